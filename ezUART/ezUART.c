@@ -1,23 +1,375 @@
+// Generated by codegen.py from variables.csv, do not edit.
 #include "ezUART.h"
-#define MAX_VARS 10   // Maximum number of variables you want to send
-#define VAR_SIZE 4    // Size of each variable (4 bytes)
+#include <string.h>
 
-uint32_t vars[MAX_VARS];  // Array to hold the 4-byte variables
+#if defined(__BYTE_ORDER__) && __BYTE_ORDER__ != __ORDER_LITTLE_ENDIAN__
+#error "ezUART sends values little-endian, the copy routines assume a little-endian MCU"
+#endif
 
-void send_ezUART(void *var, int id) {
-    // Ensure the id is within bounds
-    if (id < 0 || id >= MAX_VARS) {
-        return;  // Invalid ID, do nothing
+// Two copies of every frame: setters fill tx[back] while the DMA sends tx[back ^ 1]
+static uint8_t tx[2][ezUART_TX_SIZE] = {
+    {
+        0xAA, 0x05, 0x00, 0x00, 0x00, 0x00, 0x00, 0x55, 0xAA, 0x0A, 0x01, 0x00, 0x00, 0x00, 0x00, 0x02,
+        0x00, 0x00, 0x00, 0x00, 0x55, 0xAA, 0x05, 0x05, 0x00, 0x00, 0x00, 0x00, 0x55,
+    },
+    {
+        0xAA, 0x05, 0x00, 0x00, 0x00, 0x00, 0x00, 0x55, 0xAA, 0x0A, 0x01, 0x00, 0x00, 0x00, 0x00, 0x02,
+        0x00, 0x00, 0x00, 0x00, 0x55, 0xAA, 0x05, 0x05, 0x00, 0x00, 0x00, 0x00, 0x55,
+    },
+};
+static uint8_t back = 0;
+
+// run_ezUART() calls between transmissions of each speed group and where its frames end
+static const uint32_t group_periods[ezUART_GROUP_COUNT + 1] = {1, 10, 100, 0};
+static const uint16_t group_ends[ezUART_GROUP_COUNT + 1] = {8, 21, 29, 0};
+#define HYPERPERIOD 100
+
+static volatile uint8_t busy = 0;  // DMA sending: 0 nothing, 1 telemetry, 2 replies
+static uint32_t tick = 0;
+volatile uint32_t ezUART_overruns = 0;
+
+#define RX_FRAME_SIZE (ezUART_MAX_COMMAND_SIZE + 3)
+volatile uint32_t ezUART_rx_overruns = 0;
+static uint8_t rx_ring[ezUART_RX_SIZE];
+static volatile uint16_t rx_head = 0;  // Written by ezUART_receive()
+static volatile uint16_t rx_tail = 0;  // Written by run_ezUART()
+static uint8_t rx_frame[RX_FRAME_SIZE];  // Command frame being received
+static uint16_t rx_length = 0;
+
+// Replies are built in replies[reply_back] and sent from replies[reply_back ^ 1]
+static uint8_t replies[2][ezUART_REPLY_SIZE];
+static uint16_t reply_length = 0;  // Bytes built in replies[reply_back]
+static volatile uint8_t reply_back = 0;
+static volatile uint16_t reply_pending = 0;  // Bytes of replies[reply_back ^ 1] waiting for the DMA
+static void process_commands(void);
+
+static uint32_t baud_rate = ezUART_BaudRate;  // Rate in use
+static uint32_t baud_confirmed = ezUART_BaudRate;  // Rate to go back to when a trial expires
+static uint32_t baud_pending = 0;  // Rate to switch to once the replies are sent
+static uint32_t baud_trial = 0;  // run_ezUART() calls left to confirm baud_rate
+
+// Value offset in tx and size of each variable ID, offset 0 marks unknown IDs
+static const uint16_t value_offsets[ezUART_ID_COUNT + 1] = {3, 11, 16, 0, 0, 24, 0};
+static const uint8_t value_sizes[ezUART_ID_COUNT + 1] = {4, 4, 4, 0, 0, 4, 0};
+
+static inline void put_float(uint8_t *dst, float value) { memcpy(dst, &value, sizeof value); }
+static inline void put_int(uint8_t *dst, int32_t value) { memcpy(dst, &value, sizeof value); }
+static inline void put_uint(uint8_t *dst, uint32_t value) { memcpy(dst, &value, sizeof value); }
+static inline void put_int8(uint8_t *dst, int8_t value) { memcpy(dst, &value, sizeof value); }
+static inline void put_int16(uint8_t *dst, int16_t value) { memcpy(dst, &value, sizeof value); }
+
+// Raw integer of a scaled value: (value - offset) / scale, rounded and clamped to [low, high]
+static inline int32_t quantize(float value, float offset, float inverse_scale, int32_t low, int32_t high) {
+    float raw = (value - offset) * inverse_scale;
+    raw += raw < 0.0f ? -0.5f : 0.5f;
+    if (raw <= (float)low) {
+        return low;
+    }
+    if (raw >= (float)high) {
+        return high;
     }
+    return (int32_t)raw;
+}
+
+void ezUART_set_counter(uint32_t value) {
+    put_uint(&tx[back][3], value);
+}
+
+void ezUART_set_current(float value) {
+    put_float(&tx[back][11], value);
+}
+
+void ezUART_set_temp(int32_t value) {
+    put_int(&tx[back][16], value);
+}
+
+void ezUART_set_setpoint(float value) {
+    put_float(&tx[back][24], value);
+}
 
-    // Check the type of the variable and store it as a 4-byte value
-    if (sizeof(var) > VAR_SIZE) {
-        // Trim larger types to 4 bytes (e.g., long long)
-        memcpy(&vars[id], var, VAR_SIZE);
-    } else if (sizeof(var) == VAR_SIZE) {
-        // Copy directly if it's already 4 bytes (e.g., int, float)
-        memcpy(&vars[id], var, VAR_SIZE);
+void send_ezUART(const void *value, int id) {
+    if (id < 0 || id >= ezUART_ID_COUNT || value_offsets[id] == 0) {
+        return;  // Unknown ID, do nothing
+    }
+    memcpy(&tx[back][value_offsets[id]], value, value_sizes[id]);
+}
+
+static uint8_t value_size(int id) {
+    return id >= 0 && id < ezUART_ID_COUNT ? value_sizes[id] : 0;
+}
+
+int read_ezUART(int id, void *value) {
+    uint8_t size = value_size(id);
+    if (size != 0) {
+        memcpy(value, &tx[back][value_offsets[id]], size);
+    }
+    return size;
+}
+
+void init_ezUART(void) {
+    tick = 0;
+    busy = 0;
+    ezUART_overruns = 0;
+    baud_rate = ezUART_BaudRate;
+    baud_confirmed = ezUART_BaudRate;
+    baud_pending = 0;
+    baud_trial = 0;
+    rx_head = 0;
+    rx_tail = 0;
+    rx_length = 0;
+    reply_length = 0;
+    reply_pending = 0;
+    ezUART_rx_overruns = 0;
+}
+
+void ezUART_dma_complete(void) {
+    if (busy == 1 && reply_pending != 0) {
+        busy = 2;  // Replies go out right behind the telemetry
+        ezUART_start_dma(replies[reply_back ^ 1], reply_pending);
+        return;
+    }
+    if (busy == 2) {
+        reply_pending = 0;
+    }
+    busy = 0;
+}
+
+void run_ezUART(void) {
+    size_t due = 0;
+    uint8_t group;
+    uint8_t front;
+
+    process_commands();
+    // Slower groups are only due when all faster ones are, so the due frames are a prefix
+    for (group = 0; group < ezUART_GROUP_COUNT && tick % group_periods[group] == 0; group++) {
+        due = group_ends[group];
+    }
+    tick = (tick + 1) % HYPERPERIOD;
+    if (due == 0) {
+        if (reply_pending != 0 && busy == 0) {
+            busy = 2;
+            ezUART_start_dma(replies[reply_back ^ 1], reply_pending);
+        }
+        return;
+    }
+    if (busy) {
+        ezUART_overruns++;
+        return;
+    }
+
+    front = back;
+    back ^= 1;
+    busy = 1;
+    ezUART_start_dma(tx[front], due);
+    // Carry the latest values over, so variables not set this period are resent unchanged
+    memcpy(tx[back], tx[front], ezUART_TX_SIZE);
+}
+
+void ezUART_receive(const uint8_t *data, size_t length) {
+    size_t i;
+    for (i = 0; i < length; i++) {
+        uint16_t next = (uint16_t)((rx_head + 1) & (ezUART_RX_SIZE - 1));
+        if (next == rx_tail) {
+            ezUART_rx_overruns += (uint32_t)(length - i);
+            return;
+        }
+        rx_ring[rx_head] = data[i];
+        rx_head = next;
+    }
+}
+
+// Add a reply frame to replies[reply_back], dropped when full (the PC sends the command again)
+static void queue_reply(const uint8_t *payload, uint8_t size) {
+    uint8_t *frame = &replies[reply_back][reply_length];
+    if (reply_length + size + 3u > ezUART_REPLY_SIZE) {
+        return;
+    }
+    frame[0] = 0xAA;
+    frame[1] = size;
+    memcpy(&frame[2], payload, size);
+    frame[size + 2] = 0x55;
+    reply_length = (uint16_t)(reply_length + size + 3);
+}
+
+static void handle_command(const uint8_t *payload, uint8_t size) {
+    uint8_t reply[4 + ezUART_MAX_COMMAND_SIZE];
+    uint8_t reply_size = 4;
+    uint8_t length;
+    uint32_t rate;
+    if (size < 3 || size > ezUART_MAX_COMMAND_SIZE || payload[0] != ezUART_COMMAND_ID
+            || (payload[1] & ezUART_REPLY_FLAG)) {
+        return;
+    }
+    reply[0] = ezUART_COMMAND_ID;
+    reply[1] = (uint8_t)(payload[1] | ezUART_REPLY_FLAG);
+    reply[2] = payload[2];  // Sequence number
+    reply[3] = ezUART_STATUS_OK;
+    switch (payload[1]) {
+    case ezUART_COMMAND_SET:
+        length = size > 3 ? value_size(payload[3]) : 0;
+        if (length == 0) {
+            reply[3] = ezUART_STATUS_UNKNOWN_ID;
+        } else if (size != 4 + length) {
+            reply[3] = ezUART_STATUS_BAD_REQUEST;
+        } else {
+            send_ezUART(&payload[4], payload[3]);
+        }
+        break;
+    case ezUART_COMMAND_READ:
+        if (size != 4) {
+            reply[3] = ezUART_STATUS_BAD_REQUEST;
+        } else if ((length = (uint8_t)read_ezUART(payload[3], &reply[5])) == 0) {
+            reply[3] = ezUART_STATUS_UNKNOWN_ID;
+        } else {
+            reply[4] = payload[3];
+            reply_size = (uint8_t)(5 + length);
+        }
+        break;
+    case ezUART_COMMAND_PING:
+        break;
+    case ezUART_COMMAND_BAUD:
+        rate = size != 7 ? 0 : (uint32_t)payload[3] | (uint32_t)payload[4] << 8
+            | (uint32_t)payload[5] << 16 | (uint32_t)payload[6] << 24;
+        if (rate == 0 || rate > ezUART_MAX_BAUD_RATE || baud_pending != 0) {
+            reply[3] = ezUART_STATUS_BAD_REQUEST;
+        } else if (rate == baud_rate) {
+            baud_confirmed = rate;  // Confirms the rate on trial, if any
+            baud_trial = 0;
+        } else if (baud_trial != 0) {
+            reply[3] = ezUART_STATUS_BAD_REQUEST;  // One trial at a time
+        } else {
+            baud_pending = rate;
+        }
+        break;
+    case ezUART_COMMAND_TEST:
+        memcpy(&reply[4], &payload[3], size - 3u);
+        reply_size = (uint8_t)(size + 1);
+        break;
+    default:
+        reply[3] = ezUART_STATUS_BAD_REQUEST;
+        break;
+    }
+    queue_reply(reply, reply_size);
+}
+
+// Apply the commands received since the last call and hand their replies to the DMA side
+static void process_commands(void) {
+    if (baud_trial != 0 && --baud_trial == 0) {
+        baud_pending = baud_confirmed;  // Not confirmed in time, back to the last good rate
+    }
+    if (baud_pending != 0 && busy == 0 && reply_pending == 0) {
+        ezUART_set_baud_rate(baud_pending);
+        baud_rate = baud_pending;
+        baud_pending = 0;
+        baud_trial = baud_rate != baud_confirmed ? ezUART_BAUD_TRIAL_TICKS : 0;
+        rx_length = 0;  // Drop the command cut by the switch
+    }
+    while (rx_tail != rx_head) {
+        uint8_t byte = rx_ring[rx_tail];
+        rx_tail = (uint16_t)((rx_tail + 1) & (ezUART_RX_SIZE - 1));
+        if (rx_length == 0 && byte != 0xAA) {
+            continue;  // Resync on the next SOF
+        }
+        if (rx_length == 1 && byte > ezUART_MAX_COMMAND_SIZE) {
+            rx_length = 0;  // Too long for a command
+            continue;
+        }
+        rx_frame[rx_length++] = byte;
+        if (rx_length > 1 && rx_length == rx_frame[1] + 3u) {
+            if (byte == 0x55) {
+                handle_command(&rx_frame[2], rx_frame[1]);
+            }
+            rx_length = 0;
+        }
+    }
+    if (reply_length != 0 && reply_pending == 0) {
+        reply_back ^= 1;  // Before reply_pending, the DMA side reads replies[reply_back ^ 1]
+        reply_pending = reply_length;
+        reply_length = 0;
+    }
+}
+
+// CRC-16/CCITT-FALSE (polynomial 0x1021), same as binascii.crc_hqx on the PC
+uint16_t crc16_ezUART(const uint8_t *data, size_t length, uint16_t crc) {
+    size_t i;
+    int bit;
+    for (i = 0; i < length; i++) {
+        crc ^= (uint16_t)data[i] << 8;
+        for (bit = 0; bit < 8; bit++) {
+            crc = (crc & 0x8000) ? (uint16_t)((crc << 1) ^ 0x1021) : (uint16_t)(crc << 1);
+        }
+    }
+    return crc;
+}
+
+// Build a protocol 2 frame from a payload of (id, value) pairs.
+// frame must hold ezUART_MAX_FRAME_SIZE bytes, returns the number of bytes to send.
+size_t encode_ezUART(const uint8_t *payload, uint8_t size, uint8_t *frame) {
+    uint8_t raw[1 + ezUART_MAX_PAYLOAD_SIZE + 2];
+    size_t raw_length = 0;
+    size_t code_index = 0;  // Where the code byte of the current COBS block goes
+    size_t length = 1;
+    uint8_t code = 1;
+    uint16_t crc;
+    size_t i;
+
+    raw[raw_length++] = size;
+    memcpy(&raw[raw_length], payload, size);
+    raw_length += size;
+    crc = crc16_ezUART(raw, raw_length, ezUART_CRC_INIT);
+    raw[raw_length++] = (uint8_t)(crc & 0xFF);  // Little-endian CRC
+    raw[raw_length++] = (uint8_t)(crc >> 8);
+
+    // COBS: replace every zero with the distance to the next one
+    for (i = 0; i < raw_length; i++) {
+        if (raw[i] == 0) {
+            frame[code_index] = code;
+            code = 1;
+            code_index = length++;
+        } else {
+            frame[length++] = raw[i];
+            code++;
+            if (code == 0xFF) {  // 254 non-zero bytes, start a new block
+                frame[code_index] = code;
+                code = 1;
+                code_index = length++;
+            }
+        }
+    }
+    frame[code_index] = code;
+    frame[length++] = 0;  // Delimiter
+    return length;
+}
+
+// Inverse of encode_ezUART() for a frame without its delimiter: undo COBS, check size and CRC.
+// payload must hold length bytes, returns the payload size or -1 for a corrupted frame.
+int decode_ezUART(const uint8_t *frame, size_t length, uint8_t *payload) {
+    uint8_t raw[1 + ezUART_MAX_PAYLOAD_SIZE + 2];
+    size_t raw_length = 0;
+    size_t index = 0;
+    size_t i;
+    uint16_t crc;
+
+    while (index < length) {
+        uint8_t code = frame[index];
+        if (code == 0 || index + code > length || raw_length + code > sizeof raw) {
+            return -1;
+        }
+        for (i = 1; i < code; i++) {
+            raw[raw_length++] = frame[index + i];
+        }
+        index += code;
+        if (code != 0xFF && index < length) {
+            raw[raw_length++] = 0;
+        }
+    }
+    if (raw_length < 3 || raw[0] + 3u != raw_length) {
+        return -1;
+    }
+    crc = crc16_ezUART(raw, raw_length - 2, ezUART_CRC_INIT);
+    if ((uint16_t)(raw[raw_length - 2] | (raw[raw_length - 1] << 8)) != crc) {
+        return -1;
     }
-    // If the variable is smaller, you would need to zero-extend it,
-    // but for now, we assume only 4-byte data.
-}
\ No newline at end of file
+    memcpy(payload, &raw[1], raw[0]);
+    return raw[0];
+}
@@ -1,8 +1,95 @@
+// Generated by codegen.py from variables.csv, do not edit.
 #ifndef EZUART_H
 #define EZUART_H
 
+#include <stdint.h>
+#include <stddef.h>
+
 #define ezUART_BaudRate 115200
 
-void send_ezUART(void *var, int id);
+// Protocol 1 frames: 0xAA, payload size, payload, 0x55
+// Protocol 2 frames: COBS(payload size, payload, CRC-16) followed by a 0x00 delimiter
+#define ezUART_PROTOCOL_VERSION 1
+#define ezUART_CRC_INIT 0xFFFF
+#define ezUART_MAX_PAYLOAD_SIZE 255
+#define ezUART_MAX_FRAME_SIZE (1 + ezUART_MAX_PAYLOAD_SIZE + 2 + 2 + 1)  // Size, payload, CRC, COBS overhead, delimiter
+
+#define ezUART_COMPACT 0
+
+// Optional fields starting every payload: sequence ID and a counter incremented per frame,
+// timestamp ID and the uint32 count of run_ezUART() calls
+#define ezUART_SEQUENCE 0
+#define ezUART_TIMESTAMP 0
+#define ezUART_SEQUENCE_ID 253
+#define ezUART_TIMESTAMP_ID 254
+#define ezUART_FIELDS_SIZE 0
+
+// Frame layout, must match LAYOUT_HASH of the generated ezUART_layout.py
+#define ezUART_LAYOUT_HASH 0xB35C68DDu
+#define ezUART_FRAME_COUNT 3
+#define ezUART_GROUP_COUNT 3
+#define ezUART_VARIABLE_COUNT 4
+#define ezUART_TX_SIZE 29
+#define ezUART_ID_COUNT 6
+
+// Variable IDs
+#define ezUART_ID_COUNTER 0
+#define ezUART_ID_CURRENT 1
+#define ezUART_ID_TEMP 2
+#define ezUART_ID_SETPOINT 5
+
+// Provided by the application: start a UART TX DMA transfer of length bytes.
+// data stays untouched until ezUART_dma_complete() is called.
+void ezUART_start_dma(const uint8_t *data, size_t length);
+// Call from the UART TX DMA transfer complete interrupt
+void ezUART_dma_complete(void);
+
+// Call init_ezUART() once, then run_ezUART() at a fixed rate, from the same context as the setters
+void init_ezUART(void);
+void run_ezUART(void);
+extern volatile uint32_t ezUART_overruns;  // Transmissions skipped because the DMA was still busy
+
+// Setters, one per variable. Scaled variables take the physical value.
+void ezUART_set_counter(uint32_t value);
+void ezUART_set_current(float value);
+void ezUART_set_temp(int32_t value);
+void ezUART_set_setpoint(float value);
+// Raw value of any variable, scaled variables take their raw integer
+void send_ezUART(const void *value, int id);
+// Copy the raw value of a variable, as last set by the application or the PC.
+// Returns its size in bytes, 0 for unknown IDs.
+int read_ezUART(int id, void *value);
+
+// Commands from the PC: command ID, opcode, sequence number, variable ID and raw value.
+// Replies: command ID, opcode | reply flag, sequence number, status, variable ID and value of reads.
+#define ezUART_COMMAND_ID 252
+#define ezUART_COMMAND_SET 1
+#define ezUART_COMMAND_READ 2
+#define ezUART_COMMAND_PING 3
+#define ezUART_COMMAND_BAUD 4  // uint32 baud rate instead of the variable ID
+#define ezUART_COMMAND_TEST 5  // Bytes echoed in the reply
+#define ezUART_REPLY_FLAG 0x80
+#define ezUART_STATUS_OK 0
+#define ezUART_STATUS_UNKNOWN_ID 1
+#define ezUART_STATUS_BAD_REQUEST 2
+#define ezUART_RX_SIZE 128  // Receive ring buffer, a power of two
+#define ezUART_MAX_COMMAND_SIZE 16
+#define ezUART_REPLY_SIZE 64  // Reply bytes buffered between two transfers
+
+// Feed bytes received from the PC, safe to call from the UART RX interrupt.
+// run_ezUART() applies the commands and sends the replies right after the telemetry.
+void ezUART_receive(const uint8_t *data, size_t length);
+extern volatile uint32_t ezUART_rx_overruns;  // Bytes dropped because the receive buffer was full
+
+// Baud rate changes from the PC go on trial: run_ezUART() switches once the replies are sent and
+// switches back unless the PC confirms the new rate within ezUART_BAUD_TRIAL_TICKS calls.
+#define ezUART_MAX_BAUD_RATE 4000000  // STM32
+#define ezUART_BAUD_TRIAL_TICKS 2000UL
+// Provided by the application: reconfigure the UART, after the last byte has left the transmitter.
+void ezUART_set_baud_rate(uint32_t baud_rate);
+
+uint16_t crc16_ezUART(const uint8_t *data, size_t length, uint16_t crc);
+size_t encode_ezUART(const uint8_t *payload, uint8_t size, uint8_t *frame);
+int decode_ezUART(const uint8_t *frame, size_t length, uint8_t *payload);
 
-#endif // ezUART_H
+#endif // EZUART_H
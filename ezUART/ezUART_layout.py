@@ -0,0 +1,15 @@
+# Generated by codegen.py from variables.csv, do not edit.
+# Frames sent by the generated ezUART.c, load them with codegen.load_layout() or capture.py --layout.
+PROTOCOL = 1
+COMPACT = False
+SEQUENCE = False
+TIMESTAMP = False
+LAYOUT_HASH = 0xB35C68DD
+
+# (speed group, variable IDs in frame order, frame size in bytes once SerialInterface removed the fields),
+# the size of compact frames being their keyframe size
+FRAMES = [
+    ('very fast', (0,), 8),
+    ('fast', (1, 2), 13),
+    ('slow', (5,), 8),
+]
@@ -0,0 +1,146 @@
+"""asyncio transport for SerialInterface.
+
+The port is opened non-blocking and woken up by the event loop (add_reader
+on POSIX, polling elsewhere or for in-process ports), so any number of
+ports and timers share one loop without a reader thread each. With qasync
+the loop is Qt's own, see main.py.
+
+    async with AsyncSerialInterface() as link:
+        link.connect('/dev/ttyUSB0', 115200)
+        async for samples in link.frames():
+            ...
+"""
+import asyncio
+import os
+import time
+import serial
+from serial_interface import SerialInterface, READ_CHUNK_SIZE
+
+POLL_INTERVAL = 0.005  # Seconds between polls when the port cannot be watched by the loop
+
+
+class AsyncSerialInterface:
+    """Non-blocking reads, async iteration of decoded frames and awaitable writes.
+
+    Framing, decoding and counters are those of the wrapped SerialInterface.
+    """
+
+    def __init__(self, interface=None):
+        self.interface = interface if interface is not None else SerialInterface()
+        self.loop = None
+        self.waiter = None  # Future of a pending wait_readable(), woken up by disconnect()
+        self.reader_fd = None  # File descriptor watched by the loop for that wait
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.disconnect()
+
+    def connect(self, port, baudrate):
+        """Open the port with non-blocking reads and writes."""
+        self.interface.attach(serial.Serial(port, baudrate, timeout=0, write_timeout=0))
+
+    def attach(self, port):
+        """Use an already open port object, e.g. a replay FakeSerialPort."""
+        self.interface.attach(port)
+
+    def disconnect(self):
+        """Close the port, ending any pending read and the async iterators cleanly."""
+        # Stop watching the descriptor before it gets closed
+        if self.reader_fd is not None:
+            self.loop.remove_reader(self.reader_fd)
+            self.reader_fd = None
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+        self.interface.disconnect()
+
+    def is_connected(self):
+        return self.interface.is_connected()
+
+    def fileno(self):
+        """File descriptor the loop can watch, or None to fall back to polling."""
+        try:
+            return self.interface.serial_port.fileno()
+        except (AttributeError, serial.SerialException):
+            return None
+
+    async def wait_readable(self):
+        """Return once the port has bytes waiting."""
+        self.loop = asyncio.get_running_loop()
+        port = self.interface.serial_port
+        if port.in_waiting:
+            return
+        fd = self.fileno()
+        if fd is None:
+            while self.is_connected() and not port.in_waiting:
+                await asyncio.sleep(POLL_INTERVAL)
+            return
+        ready = self.waiter = self.loop.create_future()
+        try:
+            self.loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+        except NotImplementedError:  # e.g. Windows proactor loop
+            while self.is_connected() and not port.in_waiting:
+                await asyncio.sleep(POLL_INTERVAL)
+            return
+        self.reader_fd = fd
+        try:
+            await ready
+        finally:
+            if self.reader_fd is not None:
+                self.loop.remove_reader(fd)
+                self.reader_fd = None
+
+    async def read_frames(self):
+        """Wait for data and return every complete raw frame, [] once disconnected."""
+        try:
+            await self.wait_readable()
+            port = self.interface.serial_port
+            if port is None or not port.is_open:
+                return []
+            chunk = port.read(min(port.in_waiting, READ_CHUNK_SIZE))
+        except (serial.SerialException, OSError) as e:
+            self.disconnect()
+            print(f"Serial exception occurred: {e}")
+            return []
+        return self.interface.feed(chunk) if chunk else []
+
+    async def read_samples(self):
+        """Wait for data and return the decoded samples of every complete frame."""
+        frames = await self.read_frames()
+        return self.interface.decode_frames(frames, time.time())  # Every frame of one read arrived together
+
+    async def frames(self):
+        """Async iterator of decoded frames (one list of Samples per frame) until disconnected."""
+        while self.is_connected():
+            frames = await self.read_frames()
+            for frame in frames:
+                yield self.interface.decode_frame(frame)
+
+    async def samples(self):
+        """Async iterator of the samples of each read, cheaper than frames() at high rates."""
+        while self.is_connected():
+            samples = await self.read_samples()
+            if samples:
+                yield samples
+
+    async def write(self, data):
+        """Write all of data, waiting for the port to drain instead of blocking."""
+        self.loop = asyncio.get_running_loop()
+        view = memoryview(data)
+        fd = self.fileno()
+        if fd is None:
+            await self.loop.run_in_executor(None, self.interface.write, bytes(view))
+            return
+        while view:
+            try:
+                view = view[os.write(fd, view):]
+            except BlockingIOError:
+                pass
+            if view:
+                drained = self.loop.create_future()
+                self.loop.add_writer(fd, lambda: drained.done() or drained.set_result(None))
+                try:
+                    await drained
+                finally:
+                    self.loop.remove_writer(fd)
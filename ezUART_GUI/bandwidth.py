@@ -0,0 +1,83 @@
+"""Link bandwidth model shared by the database, code generator and GUI.
+
+Every byte costs BITS_PER_BYTE bits on the wire (start bit, 8 data bits,
+stop bit). Each speed group is sent as frames of at most MAX_PAYLOAD_SIZE
+payload bytes at its frequency; a frame costs the protocol overhead of
+FRAME_OVERHEADS plus header_bytes at the start of its payload (optional
+fields, compact frame header), and every variable its ID byte plus its
+value, or one bitmask bit instead of the ID byte in compact frames.
+
+The functions broadcast over NumPy arrays whose last axis is the speed
+group, so any number of candidate assignments can be evaluated against
+any number of baud rates in one call:
+
+    utilization(COMMON_BAUD_RATES, payload_bytes, variable_counts, frequencies)
+
+returns an array of shape (baud rates, *candidates).
+"""
+import numpy as np
+
+DEFAULT_PROTOCOL = 1
+BITS_PER_BYTE = 10  # 8 data bits + start + stop bits
+VARIABLE_OVERHEAD = 1  # ID byte in front of every value
+MAX_PAYLOAD_SIZE = 255  # Payload size is sent as one byte
+COBS_BLOCK = 254  # Protocol 2 adds one COBS code byte per this many bytes
+
+# Bytes per frame besides the payload
+FRAME_OVERHEADS = {
+    1: 3,  # SOF, payload size, EOF
+    2: 5,  # Payload size, CRC-16, COBS code byte, delimiter
+}
+
+COMMON_BAUD_RATES = np.array([9600, 19200, 38400, 57600, 115200, 230400, 460800, 921600, 1000000, 2000000])
+
+def variable_bytes(payload_bytes, variable_counts, compact=False):
+    """Payload bytes of each group's variables: values plus ID bytes, or bitmask bytes for compact frames."""
+    variable_counts = np.asarray(variable_counts, dtype=float)
+    overhead = np.ceil(variable_counts / 8) if compact else VARIABLE_OVERHEAD * variable_counts
+    return np.asarray(payload_bytes, dtype=float) + overhead
+
+def frames_per_group(payload_bytes, variable_counts, compact=False, header_bytes=0):
+    """Frames needed to send each group's variables with header_bytes in front of every frame."""
+    return np.ceil(variable_bytes(payload_bytes, variable_counts, compact) / (MAX_PAYLOAD_SIZE - header_bytes))
+
+def wire_bytes_per_second(payload_bytes, variable_counts, frequencies, protocol=DEFAULT_PROTOCOL, compact=False,
+                          header_bytes=0):
+    """Bytes per second on the wire, summed over the last (speed group) axis.
+
+    payload_bytes and variable_counts hold the value bytes and variables of
+    each group, frequencies the frames per second of each group. Compact
+    frames are counted at their keyframe size, the worst case.
+    """
+    frames = frames_per_group(payload_bytes, variable_counts, compact, header_bytes)
+    frame_payload = variable_bytes(payload_bytes, variable_counts, compact) + frames * header_bytes
+    group_bytes = frame_payload + frames * FRAME_OVERHEADS[protocol]
+    if protocol == 2:
+        group_bytes = group_bytes + np.floor((frame_payload + 3 * frames) / COBS_BLOCK)  # Longer COBS runs
+    return (group_bytes * np.asarray(frequencies, dtype=float)).sum(axis=-1)
+
+def utilization(baud_rates, payload_bytes, variable_counts, frequencies, protocol=DEFAULT_PROTOCOL, compact=False,
+                header_bytes=0):
+    """Share of each baud rate's line used by each candidate, shape (baud rates, *candidates)."""
+    bits_per_second = wire_bytes_per_second(payload_bytes, variable_counts, frequencies, protocol, compact,
+                                            header_bytes) * BITS_PER_BYTE
+    baud_rates = np.asarray(baud_rates, dtype=float)
+    return bits_per_second[None, ...] / baud_rates.reshape((-1,) + (1,) * np.ndim(bits_per_second))
+
+def placements(payload_bytes, variable_counts, size):
+    """Payload and count arrays for adding one variable of size bytes to each group in turn.
+
+    Returns two arrays of shape (groups, groups), row g being the database
+    with the variable in group g.
+    """
+    payload_bytes = np.asarray(payload_bytes, dtype=float)
+    variable_counts = np.asarray(variable_counts, dtype=float)
+    added = np.eye(len(payload_bytes))
+    return payload_bytes + added * size, variable_counts + added
+
+def min_baud_rate(payload_bytes, variable_counts, frequencies, protocol=DEFAULT_PROTOCOL, max_utilization=1.0,
+                  baud_rates=COMMON_BAUD_RATES, compact=False, header_bytes=0):
+    """Lowest of baud_rates that carries the load within max_utilization, or None."""
+    usage = utilization(baud_rates, payload_bytes, variable_counts, frequencies, protocol, compact, header_bytes)
+    feasible = np.flatnonzero(usage.reshape(len(usage), -1).max(axis=1) <= max_utilization)
+    return int(np.asarray(baud_rates)[feasible[0]]) if len(feasible) else None
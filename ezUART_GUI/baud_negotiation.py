@@ -0,0 +1,132 @@
+"""Step a connected link up to the fastest baud rate that stays reliable.
+
+Starting from the rate the port was opened at, each faster candidate is
+tried in turn:
+
+1. set_baud_rate(candidate) at the current rate, the MCU acknowledges and
+   switches, putting the new rate on trial.
+2. The PC switches too and sends test frames the MCU echoes. Lost or
+   mangled echoes and corrupted telemetry frames make up the error rate.
+3. Below max_error_rate, a second set_baud_rate(candidate), now at the new
+   rate, confirms it. Otherwise the PC goes back to the previous rate and
+   waits for the MCU to do the same once the trial expires.
+
+Negotiation stops at the first candidate that fails, so the rate kept is
+the highest one that passed, never a rate beyond a failed one.
+
+    negotiator = BaudNegotiator(interface, channel, HardwareConfig().candidate_baud_rates('STM32', 'CH340'))
+    baud_rate = negotiator.negotiate()
+"""
+import concurrent.futures
+import os
+import time
+from collections import namedtuple
+from command_channel import CommandError, BAUD_TRIAL_TIME
+
+TEST_FRAMES = 256  # Default test frames sent at each candidate rate
+TEST_DATA_SIZE = 12  # Bytes per test frame, within the firmware command size
+TEST_WINDOW = 2  # Test frames in flight, their echoes fit the firmware reply buffer
+MAX_ERROR_RATE = 0.001  # Default errors per frame accepted
+SETTLE_TIME = 0.05  # Seconds for both UARTs to switch and the garbage in between to drain
+REPLY_TIMEOUT = 1.0  # Seconds to wait for the acknowledgement of a baud rate change
+TIMEOUTS = (TimeoutError, concurrent.futures.TimeoutError)  # The same class from Python 3.11 on
+
+RateResult = namedtuple('RateResult', [
+    'baud_rate',
+    'test_frames',  # Test frames sent
+    'failed',  # Test frames lost or echoed wrong
+    'frames',  # Telemetry frames received during the test
+    'corrupted',  # Frames rejected by the CRC or format checks during the test
+    'error_rate',  # (failed + corrupted) / (test_frames + frames)
+    'accepted',
+])
+
+class BaudNegotiator:
+    def __init__(self, interface, channel, candidates, test_frames=TEST_FRAMES, max_error_rate=MAX_ERROR_RATE):
+        self.interface = interface
+        self.channel = channel  # Started CommandChannel of interface
+        self.candidates = sorted(candidates)
+        self.test_frames = test_frames
+        self.max_error_rate = max_error_rate
+        self.results = []  # RateResult of every candidate tried, in order
+
+    def negotiate(self):
+        """Try the candidates above the current rate in increasing order, returns the rate kept.
+
+        Raises ConnectionError if the MCU no longer answers at the rate kept.
+        """
+        baud_rate = self.interface.serial_port.baudrate
+        for candidate in self.candidates:
+            if candidate <= baud_rate:
+                continue
+            result = self.try_rate(baud_rate, candidate)
+            self.results.append(result)
+            if not result.accepted:
+                break
+            baud_rate = candidate
+        return baud_rate
+
+    def try_rate(self, baud_rate, candidate):
+        """Put candidate on trial from baud_rate and keep it if it passes, returns its RateResult."""
+        try:
+            self.channel.set_baud_rate(candidate).result(REPLY_TIMEOUT)
+        except CommandError:
+            return RateResult(candidate, 0, 0, 0, 0, 1.0, False)  # Refused, the MCU stays at baud_rate
+        except TIMEOUTS:
+            self.fall_back(baud_rate, time.monotonic())  # The MCU may have switched without us hearing it
+            return RateResult(candidate, 0, 0, 0, 0, 1.0, False)
+        switched = time.monotonic()
+        self.switch(candidate)
+        result = self.measure(candidate)
+        if result.accepted:
+            try:
+                self.channel.set_baud_rate(candidate).result(REPLY_TIMEOUT)  # Confirm the trial rate
+                return result
+            except (CommandError,) + TIMEOUTS:
+                result = result._replace(accepted=False)
+        self.fall_back(baud_rate, switched)
+        return result
+
+    def switch(self, baud_rate):
+        self.interface.serial_port.baudrate = baud_rate
+        time.sleep(SETTLE_TIME)
+
+    def fall_back(self, baud_rate, switched):
+        """Return to baud_rate once the trial the MCU started at switched has expired."""
+        self.interface.serial_port.baudrate = baud_rate
+        time.sleep(max(switched + BAUD_TRIAL_TIME + SETTLE_TIME - time.monotonic(), 0.0))
+        try:
+            self.channel.ping().result(REPLY_TIMEOUT)
+        except TIMEOUTS:
+            raise ConnectionError(f"No reply at {baud_rate} baud after abandoning a faster rate")
+
+    def measure(self, baud_rate):
+        """Send test frames TEST_WINDOW at a time until done or too many failed, returns the RateResult."""
+        interface = self.interface
+        frames = interface.frames_received
+        corrupted = interface.crc_errors + interface.format_errors
+        allowed = self.max_error_rate * self.test_frames
+        sent = failed = 0
+        while sent < self.test_frames:
+            batch = [os.urandom(TEST_DATA_SIZE) for _ in range(min(TEST_WINDOW, self.test_frames - sent))]
+            futures = [self.channel.test(data) for data in batch]
+            sent += len(batch)
+            for data, future in zip(batch, futures):
+                try:
+                    if future.result() != data:
+                        failed += 1
+                except (CommandError, ConnectionError) + TIMEOUTS:
+                    failed += 1
+            if failed + interface.crc_errors + interface.format_errors - corrupted > allowed:
+                break  # Already beyond the error budget
+        frames = interface.frames_received - frames
+        corrupted = interface.crc_errors + interface.format_errors - corrupted
+        error_rate = (failed + corrupted) / (sent + frames)
+        return RateResult(baud_rate, sent, failed, frames, corrupted, error_rate, error_rate <= self.max_error_rate)
+
+    def summary(self):
+        """One line per candidate tried."""
+        return "\n".join(
+            f"{result.baud_rate} baud: {result.test_frames} test frames, {result.failed} failed, "
+            f"{result.corrupted} of {result.frames} frames corrupted, error rate {result.error_rate:.2%} "
+            + ("kept" if result.accepted else "rejected") for result in self.results)
@@ -0,0 +1,276 @@
+"""Benchmarks of the receive, decode and plot pipeline.
+
+Micro-benchmarks run the parser, decoders and plot data path over
+synthetic frame buffers. The end-to-end benchmark streams frames through
+a pseudo-terminal, paced at the line rate of the chosen baud rate, into
+a SerialInterface reading in another thread. Results are written as JSON
+and can be compared against a previous run to catch regressions:
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --compare baseline.json
+
+The transmission scheduler is timed on a synthetic message set as well.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import numpy as np
+from serial_interface import SerialInterface, PROTOCOL_VERSIONS, DEFAULT_PROTOCOL
+from database import Database
+from sample_store import SampleStore
+from plot_decimation import decimate_minmax
+from scheduler import Message, schedule_messages
+from bandwidth import BITS_PER_BYTE, FRAME_OVERHEADS
+
+REPEATS = 5  # Best of this many runs is reported
+REGRESSION_THRESHOLD = 0.10  # Relative slowdown flagged by --compare
+HIGHER_IS_BETTER = ('per_s', 'frames_per_s')  # Metrics compared by --compare
+LOWER_IS_BETTER = ('us_each', 'ms_each', 'latency_p50_ms', 'latency_p99_ms', 'cpu_us_per_frame')
+SCHEDULER_FREQUENCIES = (1000, 500, 250, 100, 50, 20, 10, 5, 2, 1)  # Hz, hyperperiod of 1 s
+SCHEDULER_LOAD = 0.8  # Line utilization of the synthetic message set
+
+
+def synthetic_interface(variables, protocol=DEFAULT_PROTOCOL):
+    """SerialInterface decoding a frame counter (ID 0) followed by float variables."""
+    database = Database(os.devnull)
+    database.add_variable('counter', 'slow', 'uint')
+    for i in range(1, variables):
+        database.add_variable(f'var{i}', 'slow', 'float')
+    interface = SerialInterface(protocol)
+    interface.load_database(database)
+    return interface
+
+def synthetic_frames(interface, count, variables):
+    """Frames numbered by their counter value, carrying a sine per variable."""
+    values = np.sin(np.arange(count)[:, None] * 0.01 + np.arange(variables))
+    return [interface.encode_frame([(0, i)] + [(var_id, values[i, var_id]) for var_id in range(1, variables)])
+            for i in range(count)]
+
+def best_time(function, repeats=REPEATS):
+    """Best wall time of several runs of function()."""
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def rate(count, seconds):
+    return {'per_s': count / seconds, 'us_each': seconds / count * 1e6}
+
+
+def run_micro(frames_count, variables, protocol=DEFAULT_PROTOCOL):
+    """Time every hot-path stage over the same synthetic frames."""
+    interface = synthetic_interface(variables, protocol)
+    frames = synthetic_frames(interface, frames_count, variables)
+    stream = b"".join(map(interface.wrap_frame, frames))
+    var_ids = list(range(variables))
+    samples = [sample for frame in frames for sample in interface.decode_frame(frame, 0.0)]
+    timestamps = np.linspace(0, 60, len(samples))
+    samples = [sample._replace(timestamp=t) for sample, t in zip(samples, timestamps)]
+    results = {}
+
+    def parse():
+        parser = SerialInterface(protocol)
+        for i in range(0, len(stream), 4096):
+            parser.feed(stream[i:i + 4096])
+    results['feed'] = rate(frames_count, best_time(parse))
+
+    results['decode_packet'] = rate(frames_count, best_time(
+        lambda: [interface.decode_packet(frame.hex()) for frame in frames]))
+    results['decode_frame'] = rate(frames_count, best_time(
+        lambda: [interface.decode_frame(frame, 0.0) for frame in frames]))
+    results['decode_batch'] = rate(frames_count, best_time(
+        lambda: interface.decode_batch(frames, var_ids, 0.0)))
+    results['decode_frames'] = rate(frames_count, best_time(
+        lambda: interface.decode_frames(frames, 0.0)))
+
+    # The same values sent as compact frames, all variables in frame number 0
+    compact = [interface.encode_compact(0, [sample.value for sample in interface.decode_frame(frame, 0.0)])
+               for frame in frames]
+    results['decode_compact'] = rate(frames_count, best_time(
+        lambda: [interface.decode_frame(frame, 0.0) for frame in compact]))
+    results['decode_compact_batch'] = rate(frames_count, best_time(
+        lambda: interface.decode_compact_batch(compact, 0.0)))
+
+    results['format_samples'] = rate(frames_count, best_time(
+        lambda: interface.format_samples(samples)))
+
+    # Plot data path behind extract_and_plot_value and update_plot
+    store = SampleStore([(0, var_id) for var_id in var_ids], depth=len(samples))
+    results['store_samples'] = rate(frames_count, best_time(lambda: store.add_samples(samples)))
+    def decimate():
+        for buffer in store.buffers.values():
+            x, y = buffer.view()
+            decimate_minmax(x, y, x[0], x[-1], 1920)
+    results['decimate_plot'] = rate(frames_count, best_time(decimate))
+    return results
+
+def run_scheduler(messages_count):
+    """Time one hyperperiod of messages with random sizes and frequencies at SCHEDULER_LOAD."""
+    rng = np.random.default_rng(0)
+    sizes = rng.integers(1, 11, messages_count) * 5
+    frequencies = rng.choice(SCHEDULER_FREQUENCIES, messages_count)
+    messages = [Message(f'm{i}', int(size), int(frequency)) for i, (size, frequency) in enumerate(zip(sizes, frequencies))]
+    bits_per_second = int(((sizes + FRAME_OVERHEADS[DEFAULT_PROTOCOL]) * frequencies).sum()) * BITS_PER_BYTE
+    baud_rate = int(bits_per_second / SCHEDULER_LOAD)
+
+    schedule = schedule_messages(messages, baud_rate)
+    return {
+        'messages': messages_count,
+        'instances': int(frequencies.sum()),
+        'baud_rate': baud_rate,
+        'utilization': schedule.utilization,
+        'missed': sum(report.missed for report in schedule.reports),
+        'ms_each': best_time(lambda: schedule_messages(messages, baud_rate)) * 1e3,
+    }
+
+def run_gui(frames_count, variables):
+    """Time the GUI slots themselves on an offscreen window."""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5 import QtWidgets
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    from gui import ezUARTApp
+
+    window = ezUARTApp()
+    window.serial_interface = synthetic_interface(variables)
+    frames = synthetic_frames(window.serial_interface, frames_count, variables)
+    now = time.time()
+    samples = [sample for i, frame in enumerate(frames)
+               for sample in window.serial_interface.decode_frame(frame, now + i * 1e-3)]
+    results = {
+        'extract_and_plot_value': rate(frames_count, best_time(lambda: window.extract_and_plot_value(samples))),
+        'update_serial_text_area': rate(frames_count, best_time(lambda: window.update_serial_text_area(samples))),
+    }
+    def update_plot():
+        window.curve_states.clear()  # Force a full redraw every run
+        window.update_plot()
+    results['update_plot'] = {'ms_each': best_time(update_plot) * 1e3}
+    window.close()
+    app.processEvents()
+    return results
+
+def run_end_to_end(baudrate, variables, duration, protocol=DEFAULT_PROTOCOL):
+    """Stream frames through a pty at line rate and measure throughput, latency and CPU."""
+    from replay import PtyPort
+
+    interface = synthetic_interface(variables, protocol)
+    frames = [interface.wrap_frame(frame) for frame in synthetic_frames(interface, 1, variables)]
+    frames_per_s = baudrate / 10 / len(frames[0])  # 10 bits per byte on the wire
+    count = int(frames_per_s * duration)
+    frames = [interface.wrap_frame(frame) for frame in synthetic_frames(interface, count, variables)]
+    sent_at = np.zeros(count)
+    received_at = np.full(count, np.nan)
+
+    port = PtyPort()
+    interface.connect(port.name, baudrate)
+
+    def write():
+        started = time.time()
+        batch = max(1, int(frames_per_s / 1000))  # Write about every millisecond
+        for i in range(0, count, batch):
+            delay = started + i / frames_per_s - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            sent_at[i:i + batch] = time.time()
+            port.inject(b"".join(frames[i:i + batch]))
+    writer = threading.Thread(target=write, daemon=True)
+
+    cpu_started = time.thread_time()
+    started = time.perf_counter()
+    writer.start()
+    deadline = started + duration + 2
+    received = 0
+    while received < count and time.perf_counter() < deadline:
+        for sample in interface.read_samples():
+            if sample.var_id == 0:
+                received_at[sample.value] = sample.timestamp
+                received += 1
+    elapsed = time.perf_counter() - started
+    cpu = time.thread_time() - cpu_started
+    writer.join()
+    interface.disconnect()
+    port.close()
+
+    latency = (received_at - sent_at)[~np.isnan(received_at)] * 1e3
+    return {
+        'baudrate': baudrate,
+        'variables': variables,
+        'protocol': protocol,
+        'frames_sent': count,
+        'frames_received': received,
+        'frames_per_s': received / elapsed,
+        'latency_p50_ms': float(np.percentile(latency, 50)) if len(latency) else None,
+        'latency_p99_ms': float(np.percentile(latency, 99)) if len(latency) else None,
+        'cpu_us_per_frame': cpu / max(received, 1) * 1e6,
+    }
+
+
+def compare(results, baseline, path=''):
+    """Print per-metric changes against a baseline and return the regressed metric names."""
+    regressions = []
+    for key, value in results.items():
+        name = f"{path}{key}"
+        previous = baseline.get(key) if isinstance(baseline, dict) else None
+        if isinstance(value, dict):
+            regressions += compare(value, previous or {}, name + '.')
+            continue
+        if key not in HIGHER_IS_BETTER + LOWER_IS_BETTER or not previous or value is None:
+            continue
+        change = value / previous - 1
+        worse = -change if key in HIGHER_IS_BETTER else change
+        flag = " REGRESSION" if worse > REGRESSION_THRESHOLD else ""
+        print(f"{name:55s} {previous:14.2f} -> {value:14.2f} ({change:+.1%}){flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ezUART receive, decode and plot pipeline.")
+    parser.add_argument('--frames', type=int, default=20000, help="Frames per micro-benchmark")
+    parser.add_argument('--variables', type=int, default=4, help="Variables per frame (1 to 51)")
+    parser.add_argument('--baud', type=int, nargs='*', default=[115200, 921600],
+                        help="Baud rates of the end-to-end benchmark")
+    parser.add_argument('--protocol', type=int, choices=PROTOCOL_VERSIONS, default=DEFAULT_PROTOCOL,
+                        help="Wire protocol version")
+    parser.add_argument('--messages', type=int, default=200, help="Messages of the scheduler benchmark")
+    parser.add_argument('--duration', type=float, default=2.0, help="Seconds per end-to-end run")
+    parser.add_argument('--no-e2e', action='store_true', help="Skip the end-to-end pty benchmark")
+    parser.add_argument('--gui', action='store_true', help="Also time the Qt GUI slots (offscreen)")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--compare', help="Compare against a previous JSON result file")
+    args = parser.parse_args()
+
+    results = {
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'micro': run_micro(args.frames, args.variables, args.protocol),
+        'scheduler': run_scheduler(args.messages),
+    }
+    if args.gui:
+        results['gui'] = run_gui(args.frames, args.variables)
+    if not args.no_e2e:
+        results['end_to_end'] = {str(baudrate): run_end_to_end(baudrate, args.variables, args.duration, args.protocol)
+                                 for baudrate in args.baud}
+
+    if args.output:
+        with open(args.output, mode='w') as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare({key: results[key] for key in ('micro', 'scheduler', 'gui', 'end_to_end') if key in results},
+                              baseline)
+        if regressions:
+            print(f"{len(regressions)} regression(s) above {REGRESSION_THRESHOLD:.0%}")
+            sys.exit(1)
+    else:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Headless capture: stream decoded samples from a serial port straight to disk.
+
+Only uses SerialInterface and Database, so it runs without Qt on lab machines:
+
+    python capture.py /dev/ttyUSB0 --baud "very fast" --output run.csv
+    python capture.py /dev/ttyUSB0 --output run.ezrec --raw
+    python capture.py /dev/ttyUSB0 --negotiate STM32 --adapter CH340
+    python capture.py /dev/ttyUSB0 --duration 60 --profile profile.txt
+    python capture.py /dev/ttyUSB0 --layout ../ezUART/ezUART_layout.py
+
+Outputs ending in .ezrec are written as indexed binary recordings, other
+outputs (.csv, .parquet, .h5) by a background SampleExporter.
+--negotiate steps the link up to the fastest reliable baud rate first.
+--profile prints the per-stage latencies of the data path at the end.
+--layout checks the ezUART_layout.py generated with the firmware against
+the database and preloads its frame layouts.
+"""
+import argparse
+import os
+import threading
+import time
+from serial_interface import SerialInterface, PROTOCOL_VERSIONS, DEFAULT_PROTOCOL
+from database import Database
+from recording import RecordingWriter
+from export import SampleExporter, export_formats
+from command_channel import CommandChannel
+from baud_negotiation import BaudNegotiator
+from hardware_config import HardwareConfig
+from profiling import profiler
+from codegen import load_layout
+
+STATS_INTERVAL = 1.0  # Default seconds between throughput reports
+
+def parse_baud_rate(value):
+    """Accept either a database speed name or a numeric baud rate."""
+    if value in Database.BAUD_RATES:
+        return Database.BAUD_RATES[value]
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid baud rate: {value}")
+
+def print_stats(interface, samples, elapsed, previous):
+    """Print the link statistics since the previous report and return the new sample count."""
+    stats = interface.link_stats()
+    lag = f" | lag {stats.lag * 1e3:.1f} ms" if stats.lag is not None else ""
+    print(f"{stats.frames_per_second:10.0f} frames/s | {(samples - previous) / elapsed:10.0f} samples/s | "
+          f"{stats.bytes_per_second / 1024:8.1f} KiB/s | skipped {stats.resync_bytes} bytes | "
+          f"errors {stats.crc_errors + stats.format_errors} | lost {stats.frames_lost} frames | "
+          f"decode {stats.decode_time * 1e6:.1f} us/frame{lag}")
+    return samples
+
+def negotiate(interface, hardware, adapter=None):
+    """Step the link up to the fastest reliable rate, returns it. Samples received meanwhile are dropped."""
+    channel = CommandChannel(interface)
+    channel.start()
+    done = threading.Event()
+
+    def read_replies():
+        while not done.is_set() and interface.is_connected():
+            interface.read_samples()
+
+    reader = threading.Thread(target=read_replies, daemon=True)
+    reader.start()
+    negotiator = BaudNegotiator(interface, channel, HardwareConfig().candidate_baud_rates(hardware, adapter))
+    try:
+        baud_rate = negotiator.negotiate()
+    finally:
+        done.set()
+        reader.join()
+        channel.stop()
+        print(negotiator.summary())
+    return baud_rate
+
+def capture(interface, write, duration=None, stats_interval=STATS_INTERVAL, recorder=None):
+    """Hand decoded samples to write() until the port closes, duration elapses or Ctrl+C.
+
+    Raw frames are recorded too when a RecordingWriter is given.
+    """
+    started = last_report = time.monotonic()
+    samples_written = 0
+    snapshot = 0
+    interface.link_stats()  # Start the first rate window
+    try:
+        while interface.is_connected():
+            samples = interface.read_samples(recorder)
+            if samples:
+                profiled = profiler.clock()
+                write(samples)
+                profiler.record('emit', profiled)
+                samples_written += len(samples)
+            now = time.monotonic()
+            if now - last_report >= stats_interval:
+                snapshot = print_stats(interface, samples_written, now - last_report, snapshot)
+                last_report = now
+            if duration is not None and now - started >= duration:
+                break
+    except KeyboardInterrupt:
+        pass
+    return samples_written
+
+def main():
+    parser = argparse.ArgumentParser(description="Capture ezUART samples to a recording or export file without the GUI.")
+    parser.add_argument('port', help="Serial port, e.g. /dev/ttyUSB0 or COM3")
+    parser.add_argument('--baud', type=parse_baud_rate, default=Database.BAUD_RATES['slow'],
+                        help="Baud rate or speed name (slow, fast, very fast)")
+    parser.add_argument('--protocol', type=int, choices=PROTOCOL_VERSIONS, default=DEFAULT_PROTOCOL,
+                        help="Wire protocol version")
+    parser.add_argument('--database', default='variables.csv', help="Variable database file")
+    parser.add_argument('--output', default='capture.csv',
+                        help=f"Output file (.ezrec, {', '.join(export_formats())})")
+    parser.add_argument('--layout', help="ezUART_layout.py generated with the firmware, checked against the database")
+    parser.add_argument('--raw', action='store_true', help="Also record raw frames (.ezrec only)")
+    parser.add_argument('--duration', type=float, help="Stop after this many seconds")
+    parser.add_argument('--stats-interval', type=float, default=STATS_INTERVAL,
+                        help="Seconds between throughput reports")
+    parser.add_argument('--link-stats', help="Write the link statistics reports to this CSV file")
+    parser.add_argument('--negotiate', choices=sorted(HardwareConfig().get_supported_hardware()),
+                        help="Negotiate the fastest reliable baud rate with this hardware, starting at --baud")
+    parser.add_argument('--adapter', choices=sorted(HardwareConfig().adapters),
+                        help="USB to UART adapter, limits the negotiated baud rate")
+    parser.add_argument('--profile', nargs='?', const='-', metavar='FILE',
+                        help="Profile the data path and write the report to FILE, stdout by default")
+    args = parser.parse_args()
+    extension = os.path.splitext(args.output)[1].lower()
+    if extension != '.ezrec' and extension not in export_formats():
+        parser.error(f"Cannot write {args.output}, outputs can be .ezrec, {', '.join(export_formats())}")
+    if args.profile:
+        profiler.enable()
+
+    database = Database(args.database)
+    interface = SerialInterface(args.protocol)
+    interface.load_database(database)
+    if args.layout:
+        try:
+            layout = load_layout(args.layout, database, interface)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        if layout.PROTOCOL != args.protocol:
+            parser.error(f"{args.layout} was generated for protocol {layout.PROTOCOL}, not {args.protocol}")
+    interface.connect(args.port, args.baud)
+    baud_rate = args.baud
+
+    try:
+        if args.negotiate:
+            try:
+                baud_rate = negotiate(interface, args.negotiate, args.adapter)
+            except ConnectionError as e:
+                print(f"Baud negotiation failed: {e}")
+                return
+        print(f"Capturing {args.port} at {baud_rate} baud to {args.output} (Ctrl+C to stop)")
+        if extension == '.ezrec':
+            with RecordingWriter(args.output, database) as recorder:
+                samples_written = capture(interface, recorder.add_samples, args.duration, args.stats_interval,
+                                          recorder if args.raw else None)
+        else:
+            with SampleExporter(args.output) as exporter:
+                capture(interface, exporter.add_samples, args.duration, args.stats_interval)
+            print(exporter.summary())
+            samples_written = exporter.written
+    finally:
+        interface.disconnect()
+
+    print(f"Wrote {samples_written} samples, {interface.frames_received} frames, "
+          f"skipped {interface.bytes_skipped} bytes, {interface.crc_errors} CRC errors, "
+          f"{interface.stats.frames_lost} frames lost")
+    if args.link_stats:
+        print(f"Wrote {interface.stats.export(args.link_stats)} link statistics rows to {args.link_stats}")
+    if args.profile:
+        profiler.dump(args.profile)
+
+if __name__ == "__main__":
+    main()
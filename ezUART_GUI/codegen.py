@@ -0,0 +1,1107 @@
+"""Generate ezUART.h, ezUART.c and the matching Python frame layout from a variable database.
+
+    python codegen.py --database variables.csv --output ../ezUART
+
+Every speed group is laid out as protocol 1 frames in one static transmit
+buffer, fastest group first, with the frame headers and variable IDs filled
+in at compile time. Setters copy a value to its precomputed offset and
+run_ezUART() hands the frames that are due to the UART TX DMA as a single
+contiguous transfer. Group periods are multiples of each other, so the due
+frames always form a prefix of the buffer.
+
+With --compact, or when a variable is delta encoded, frames are instead
+built at send time from the latest raw values: a frame number, a bitmask of
+the values present, then the values, with int8 differences for delta
+variables and a keyframe of full values every KEYFRAME_INTERVAL frames.
+Variables with a scale or offset are sent as int8/int16 raw integers and
+their setters take the physical value.
+
+--sequence and --timestamp start every payload with a frame sequence number
+and the run_ezUART() tick count, which SerialInterface strips off and
+tracks in its link statistics.
+
+The generated C only needs stdint.h and string.h and builds with gcc on the
+host, the application provides ezUART_start_dma() and ezUART_set_baud_rate()
+for its UART. --hardware sets the fastest rate the PC may switch it to.
+"""
+import argparse
+import binascii
+import importlib.util
+import os
+import re
+from collections import namedtuple
+from database import (Database, COMPACT_ID, KEYFRAME_FLAG, KEYFRAME_INTERVAL, COMMAND_ID, SEQUENCE_ID, TIMESTAMP_ID,
+                      FIELD_SIZES, frame_payload_size)
+from command_channel import (COMMAND_SET, COMMAND_READ, COMMAND_PING, COMMAND_BAUD, COMMAND_TEST, REPLY_FLAG,
+                             STATUS_OK, STATUS_UNKNOWN_ID, STATUS_BAD_REQUEST, BAUD_TRIAL_TIME)
+from hardware_config import HardwareConfig, DEFAULT_HARDWARE
+from serial_interface import SOF, EOF, FRAME_OVERHEAD, PROTOCOL_VERSIONS, DEFAULT_PROTOCOL
+from scheduler import Message, schedule_messages, print_report
+from bandwidth import MAX_PAYLOAD_SIZE
+
+# C type and copy routine of each database data type
+C_TYPES = {
+    'float': 'float',
+    'int': 'int32_t',
+    'uint': 'uint32_t',
+    'int8': 'int8_t',
+    'int16': 'int16_t'
+}
+C_RANGES = {'int8': (-128, 127), 'int16': (-32768, 32767)}  # Raw range of the scaled types
+RX_SIZE = 128  # Command receive ring buffer, a power of two holding a full window of sets
+MAX_COMMAND_SIZE = 16  # Longest command payload the firmware accepts
+REPLY_SIZE = 64  # Reply bytes buffered between two transfers
+
+# One frame: offset of its SOF byte in the transmit buffer, frame size and (Variable, position) pairs.
+# The position is the value offset in the buffer, or the variable index for compact frames.
+FramePlan = namedtuple('FramePlan', ['speed', 'offset', 'size', 'fields'])
+
+def c_identifier(name):
+    """Turn a variable name into a C identifier."""
+    identifier = re.sub(r'\W', '_', name)
+    return f'_{identifier}' if identifier[:1].isdigit() else identifier
+
+def c_float(value):
+    return f'{float(value)!r}f'
+
+def is_scaled(var):
+    return var.scale != 1.0 or var.offset != 0.0
+
+def fields_size(fields):
+    return sum(FIELD_SIZES[field] for field in fields)
+
+def plan_frames(database, compact=False, fields=()):
+    """Lay out the frames of every speed group, fastest group first.
+
+    Returns the frames in transmit order and, for each group, where its
+    frames end: a transmit buffer offset, or a frame count for compact
+    frames, which are built at send time and sized for a keyframe. The
+    optional fields go first in every payload.
+    """
+    header = fields_size(fields)
+    frames = []
+    group_ends = {}
+    offset = 0
+    index = 0
+    for speed, variables in database.frames(compact):
+        fields = []
+        if compact:
+            size = header + frame_payload_size(variables, compact=True) + FRAME_OVERHEAD
+            for var in variables:
+                fields.append((var, index))
+                index += 1
+            frames.append(FramePlan(speed, offset, size, fields))
+            offset += size
+            group_ends[speed] = len(frames)
+            continue
+        position = offset + 2 + header  # After SOF, size and fields
+        for var in variables:
+            fields.append((var, position + 1))  # Value follows the ID byte
+            position += 1 + var.size
+        frames.append(FramePlan(speed, offset, position + 1 - offset, fields))
+        offset = position + 1  # After EOF
+        group_ends[speed] = offset
+    return frames, list(group_ends.items())
+
+def layout_hash(frames, compact=False, fields=()):
+    """CRC-32 of the frame layout, shared by the C and Python sides to detect drift."""
+    description = [(frame.speed, frame.size, [(var.var_id, var.data_type, var.scale, var.offset, var.delta, position)
+                                              for var, position in frame.fields])
+                   for frame in frames]
+    return binascii.crc32(repr((compact, tuple(fields), description)).encode('utf-8'))
+
+def encoded_size(frame_size):
+    """Largest protocol 2 frame for a protocol 1 frame of frame_size bytes."""
+    raw = frame_size - FRAME_OVERHEAD + 1 + 2  # Size byte, payload, CRC
+    return raw + raw // 254 + 1 + 1  # COBS code bytes and delimiter
+
+def frame_template(frames, fields=()):
+    """Initial transmit buffer: frame headers, field and variable IDs and EOF set, values zeroed."""
+    buffer = bytearray(frames[-1].offset + frames[-1].size if frames else 0)
+    for frame in frames:
+        buffer[frame.offset] = SOF[0]
+        buffer[frame.offset + 1] = frame.size - FRAME_OVERHEAD
+        position = frame.offset + 2
+        for field in fields:
+            buffer[position] = field
+            position += FIELD_SIZES[field]
+        for var, offset in frame.fields:
+            buffer[offset - 1] = var.var_id
+        buffer[frame.offset + frame.size - 1] = EOF[0]
+    return buffer
+
+def c_array(data, indent='    ', per_line=16):
+    lines = []
+    for start in range(0, len(data), per_line):
+        lines.append(indent + ', '.join(f'0x{byte:02X}' for byte in data[start:start + per_line]) + ',')
+    return '\n'.join(lines)
+
+def c_list(values):
+    return ', '.join(map(str, values))
+
+def generate_header(database, protocol=DEFAULT_PROTOCOL, source='variables.csv', compact=False, fields=(),
+                    hardware=DEFAULT_HARDWARE):
+    frames, group_ends = plan_frames(database, compact, fields)
+    variables = [var for frame in frames for var, _ in frame.fields]
+    baud_rate = max((var.baud_rate for var in variables), default=Database.BAUD_RATES['slow'])
+    buffer_size = frames[-1].offset + frames[-1].size if frames else 0
+
+    lines = [
+        f'// Generated by codegen.py from {source}, do not edit.',
+        '#ifndef EZUART_H',
+        '#define EZUART_H',
+        '',
+        '#include <stdint.h>',
+        '#include <stddef.h>',
+        '',
+        f'#define ezUART_BaudRate {baud_rate}',
+        '',
+        '// Protocol 1 frames: 0xAA, payload size, payload, 0x55',
+        '// Protocol 2 frames: COBS(payload size, payload, CRC-16) followed by a 0x00 delimiter',
+        f'#define ezUART_PROTOCOL_VERSION {protocol}',
+        '#define ezUART_CRC_INIT 0xFFFF',
+        f'#define ezUART_MAX_PAYLOAD_SIZE {MAX_PAYLOAD_SIZE}',
+        '#define ezUART_MAX_FRAME_SIZE (1 + ezUART_MAX_PAYLOAD_SIZE + 2 + 2 + 1)  // Size, payload, CRC, COBS overhead, delimiter',
+        '',
+    ]
+    if compact:
+        lines += [
+            '// Compact frames: 0xFF, frame number (0x80 set on keyframes), bitmask of the values present, values.',
+            '// Delta frames carry int8 differences for delta variables and leave unchanged values out.',
+            '#define ezUART_COMPACT 1',
+            f'#define ezUART_COMPACT_ID {COMPACT_ID}',
+            f'#define ezUART_KEYFRAME_FLAG 0x{KEYFRAME_FLAG:02X}',
+            f'#define ezUART_KEYFRAME_INTERVAL {KEYFRAME_INTERVAL}',
+        ]
+    else:
+        lines.append('#define ezUART_COMPACT 0')
+    lines += [
+        '',
+        '// Optional fields starting every payload: sequence ID and a counter incremented per frame,',
+        '// timestamp ID and the uint32 count of run_ezUART() calls',
+        f'#define ezUART_SEQUENCE {int(SEQUENCE_ID in fields)}',
+        f'#define ezUART_TIMESTAMP {int(TIMESTAMP_ID in fields)}',
+        f'#define ezUART_SEQUENCE_ID {SEQUENCE_ID}',
+        f'#define ezUART_TIMESTAMP_ID {TIMESTAMP_ID}',
+        f'#define ezUART_FIELDS_SIZE {fields_size(fields)}',
+        '',
+        '// Frame layout, must match LAYOUT_HASH of the generated ezUART_layout.py',
+        f'#define ezUART_LAYOUT_HASH 0x{layout_hash(frames, compact, fields):08X}u',
+        f'#define ezUART_FRAME_COUNT {len(frames)}',
+        f'#define ezUART_GROUP_COUNT {len(group_ends)}',
+        f'#define ezUART_VARIABLE_COUNT {len(variables)}',
+        f'#define ezUART_TX_SIZE {max(buffer_size, 1)}',
+        f'#define ezUART_ID_COUNT {max((var.var_id for var in variables), default=-1) + 1}',
+        '',
+        '// Variable IDs',
+    ]
+    lines += [f'#define ezUART_ID_{c_identifier(var.name).upper()} {var.var_id}' for var in variables]
+    lines += [
+        '',
+        '// Provided by the application: start a UART TX DMA transfer of length bytes.',
+        '// data stays untouched until ezUART_dma_complete() is called.',
+        'void ezUART_start_dma(const uint8_t *data, size_t length);',
+        '// Call from the UART TX DMA transfer complete interrupt',
+        'void ezUART_dma_complete(void);',
+        '',
+        '// Call init_ezUART() once, then run_ezUART() at a fixed rate, from the same context as the setters',
+        'void init_ezUART(void);',
+        'void run_ezUART(void);',
+        'extern volatile uint32_t ezUART_overruns;  // Transmissions skipped because the DMA was still busy',
+        '',
+        '// Setters, one per variable. Scaled variables take the physical value.',
+    ]
+    lines += [f'void ezUART_set_{c_identifier(var.name)}({"float" if is_scaled(var) else C_TYPES[var.data_type]} value);'
+              for var in variables]
+    lines += [
+        '// Raw value of any variable, scaled variables take their raw integer',
+        'void send_ezUART(const void *value, int id);',
+        '// Copy the raw value of a variable, as last set by the application or the PC.',
+        '// Returns its size in bytes, 0 for unknown IDs.',
+        'int read_ezUART(int id, void *value);',
+        '',
+        '// Commands from the PC: command ID, opcode, sequence number, variable ID and raw value.',
+        '// Replies: command ID, opcode | reply flag, sequence number, status, variable ID and value of reads.',
+        f'#define ezUART_COMMAND_ID {COMMAND_ID}',
+        f'#define ezUART_COMMAND_SET {COMMAND_SET}',
+        f'#define ezUART_COMMAND_READ {COMMAND_READ}',
+        f'#define ezUART_COMMAND_PING {COMMAND_PING}',
+        f'#define ezUART_COMMAND_BAUD {COMMAND_BAUD}  // uint32 baud rate instead of the variable ID',
+        f'#define ezUART_COMMAND_TEST {COMMAND_TEST}  // Bytes echoed in the reply',
+        f'#define ezUART_REPLY_FLAG 0x{REPLY_FLAG:02X}',
+        f'#define ezUART_STATUS_OK {STATUS_OK}',
+        f'#define ezUART_STATUS_UNKNOWN_ID {STATUS_UNKNOWN_ID}',
+        f'#define ezUART_STATUS_BAD_REQUEST {STATUS_BAD_REQUEST}',
+        f'#define ezUART_RX_SIZE {RX_SIZE}  // Receive ring buffer, a power of two',
+        f'#define ezUART_MAX_COMMAND_SIZE {MAX_COMMAND_SIZE}',
+        f'#define ezUART_REPLY_SIZE {REPLY_SIZE}  // Reply bytes buffered between two transfers',
+        '',
+        '// Feed bytes received from the PC, safe to call from the UART RX interrupt.',
+        '// run_ezUART() applies the commands and sends the replies right after the telemetry.',
+        'void ezUART_receive(const uint8_t *data, size_t length);',
+        'extern volatile uint32_t ezUART_rx_overruns;  // Bytes dropped because the receive buffer was full',
+        '',
+        '// Baud rate changes from the PC go on trial: run_ezUART() switches once the replies are sent and',
+        '// switches back unless the PC confirms the new rate within ezUART_BAUD_TRIAL_TICKS calls.',
+        f'#define ezUART_MAX_BAUD_RATE {HardwareConfig().max_baud_rate(hardware)}  // {hardware}',
+        f'#define ezUART_BAUD_TRIAL_TICKS {round(database.run_rate * BAUD_TRIAL_TIME)}UL',
+        '// Provided by the application: reconfigure the UART, after the last byte has left the transmitter.',
+        'void ezUART_set_baud_rate(uint32_t baud_rate);',
+        '',
+        'uint16_t crc16_ezUART(const uint8_t *data, size_t length, uint16_t crc);',
+        'size_t encode_ezUART(const uint8_t *payload, uint8_t size, uint8_t *frame);',
+        'int decode_ezUART(const uint8_t *frame, size_t length, uint8_t *payload);',
+        '',
+        '#endif // EZUART_H',
+        '',
+    ]
+    return '\n'.join(lines)
+
+def raw_expression(var):
+    """C expression turning a setter argument into the raw value of the variable."""
+    if not is_scaled(var):
+        return 'value'
+    low, high = C_RANGES[var.data_type]
+    return (f'({C_TYPES[var.data_type]})quantize(value, {c_float(var.offset)}, {c_float(1 / var.scale)}, '
+            f'{low}, {high})')
+
+def schedule_lines(group_ends, hyperperiod):
+    return [
+        '// run_ezUART() calls between transmissions of each speed group and where its frames end',
+        f'static const uint32_t group_periods[ezUART_GROUP_COUNT + 1] = {{{c_list([Database.SPEED_PERIODS[speed] for speed, _ in group_ends] + [0])}}};',
+        f'static const uint16_t group_ends[ezUART_GROUP_COUNT + 1] = {{{c_list([end for _, end in group_ends] + [0])}}};',
+        f'#define HYPERPERIOD {hyperperiod}',
+        '',
+        'static volatile uint8_t busy = 0;  // DMA sending: 0 nothing, 1 telemetry, 2 replies',
+        'static uint32_t tick = 0;',
+        'volatile uint32_t ezUART_overruns = 0;',
+        '',
+    ]
+
+def fields_lines(fields):
+    """State and writer of the optional fields, nothing when there are none."""
+    if not fields:
+        return []
+    lines = []
+    if SEQUENCE_ID in fields:
+        lines.append('static uint8_t sequence = 0;  // Sequence number of the next frame')
+    if TIMESTAMP_ID in fields:
+        lines.append('static uint32_t ticks = 0;  // run_ezUART() calls, sent as the timestamp')
+    lines += [
+        '',
+        '// Write the optional fields at the start of a payload',
+        'static void put_fields(uint8_t *payload) {',
+    ]
+    position = 0
+    for field in fields:
+        name = 'SEQUENCE' if field == SEQUENCE_ID else 'TIMESTAMP'
+        lines.append(f'    payload[{position}] = ezUART_{name}_ID;')
+        if field == SEQUENCE_ID:
+            lines.append(f'    payload[{position + 1}] = sequence++;')
+        else:
+            lines.append(f'    memcpy(&payload[{position + 1}], &ticks, sizeof ticks);')
+        position += FIELD_SIZES[field]
+    lines += ['}', '']
+    return lines
+
+def init_fields_lines(fields):
+    lines = ['    sequence = 0;'] if SEQUENCE_ID in fields else []
+    return lines + (['    ticks = 0;'] if TIMESTAMP_ID in fields else [])
+
+def due_lines(fields=()):
+    """Start of run_ezUART(): find how much of the schedule is due, return when nothing can be sent."""
+    lines = ['    process_commands();']
+    if TIMESTAMP_ID in fields:
+        lines.append('    ticks++;')
+    return lines + [
+        '    // Slower groups are only due when all faster ones are, so the due frames are a prefix',
+        '    for (group = 0; group < ezUART_GROUP_COUNT && tick % group_periods[group] == 0; group++) {',
+        '        due = group_ends[group];',
+        '    }',
+        '    tick = (tick + 1) % HYPERPERIOD;',
+        '    if (due == 0) {',
+        '        if (reply_pending != 0 && busy == 0) {',
+        '            busy = 2;',
+        '            ezUART_start_dma(replies[reply_back ^ 1], reply_pending);',
+        '        }',
+        '        return;',
+        '    }',
+        '    if (busy) {',
+        '        ezUART_overruns++;',
+        '        return;',
+        '    }',
+    ]
+
+COPY_ROUTINES = [
+    'static inline void put_float(uint8_t *dst, float value) { memcpy(dst, &value, sizeof value); }',
+    'static inline void put_int(uint8_t *dst, int32_t value) { memcpy(dst, &value, sizeof value); }',
+    'static inline void put_uint(uint8_t *dst, uint32_t value) { memcpy(dst, &value, sizeof value); }',
+    'static inline void put_int8(uint8_t *dst, int8_t value) { memcpy(dst, &value, sizeof value); }',
+    'static inline void put_int16(uint8_t *dst, int16_t value) { memcpy(dst, &value, sizeof value); }',
+    '',
+    '// Raw integer of a scaled value: (value - offset) / scale, rounded and clamped to [low, high]',
+    'static inline int32_t quantize(float value, float offset, float inverse_scale, int32_t low, int32_t high) {',
+    '    float raw = (value - offset) * inverse_scale;',
+    '    raw += raw < 0.0f ? -0.5f : 0.5f;',
+    '    if (raw <= (float)low) {',
+    '        return low;',
+    '    }',
+    '    if (raw >= (float)high) {',
+    '        return high;',
+    '    }',
+    '    return (int32_t)raw;',
+    '}',
+    '',
+]
+
+DMA_COMPLETE = [
+    'void ezUART_dma_complete(void) {',
+    '    if (busy == 1 && reply_pending != 0) {',
+    '        busy = 2;  // Replies go out right behind the telemetry',
+    '        ezUART_start_dma(replies[reply_back ^ 1], reply_pending);',
+    '        return;',
+    '    }',
+    '    if (busy == 2) {',
+    '        reply_pending = 0;',
+    '    }',
+    '    busy = 0;',
+    '}',
+    '',
+]
+
+INIT_COMMANDS = [
+    '    baud_rate = ezUART_BaudRate;',
+    '    baud_confirmed = ezUART_BaudRate;',
+    '    baud_pending = 0;',
+    '    baud_trial = 0;',
+    '    rx_head = 0;',
+    '    rx_tail = 0;',
+    '    rx_length = 0;',
+    '    reply_length = 0;',
+    '    reply_pending = 0;',
+    '    ezUART_rx_overruns = 0;',
+]
+
+def command_state_lines(protocol):
+    """Receive buffer and reply queue state, shared by both frame modes."""
+    if protocol == 2:
+        rx_frame_size = 'ezUART_MAX_COMMAND_SIZE + 6'  # Size, payload, CRC, COBS code bytes
+    else:
+        rx_frame_size = 'ezUART_MAX_COMMAND_SIZE + 3'  # SOF, size, payload, EOF
+    return [
+        f'#define RX_FRAME_SIZE ({rx_frame_size})',
+        'volatile uint32_t ezUART_rx_overruns = 0;',
+        'static uint8_t rx_ring[ezUART_RX_SIZE];',
+        'static volatile uint16_t rx_head = 0;  // Written by ezUART_receive()',
+        'static volatile uint16_t rx_tail = 0;  // Written by run_ezUART()',
+        'static uint8_t rx_frame[RX_FRAME_SIZE];  // Command frame being received',
+        'static uint16_t rx_length = 0;',
+        '',
+        '// Replies are built in replies[reply_back] and sent from replies[reply_back ^ 1]',
+        'static uint8_t replies[2][ezUART_REPLY_SIZE];',
+        'static uint16_t reply_length = 0;  // Bytes built in replies[reply_back]',
+        'static volatile uint8_t reply_back = 0;',
+        'static volatile uint16_t reply_pending = 0;  // Bytes of replies[reply_back ^ 1] waiting for the DMA',
+        'static void process_commands(void);',
+        '',
+        'static uint32_t baud_rate = ezUART_BaudRate;  // Rate in use',
+        'static uint32_t baud_confirmed = ezUART_BaudRate;  // Rate to go back to when a trial expires',
+        'static uint32_t baud_pending = 0;  // Rate to switch to once the replies are sent',
+        'static uint32_t baud_trial = 0;  // run_ezUART() calls left to confirm baud_rate',
+        '',
+    ]
+
+def command_lines(protocol):
+    """Command parser and reply queue, shared by both frame modes."""
+    lines = [
+        'void ezUART_receive(const uint8_t *data, size_t length) {',
+        '    size_t i;',
+        '    for (i = 0; i < length; i++) {',
+        '        uint16_t next = (uint16_t)((rx_head + 1) & (ezUART_RX_SIZE - 1));',
+        '        if (next == rx_tail) {',
+        '            ezUART_rx_overruns += (uint32_t)(length - i);',
+        '            return;',
+        '        }',
+        '        rx_ring[rx_head] = data[i];',
+        '        rx_head = next;',
+        '    }',
+        '}',
+        '',
+        '// Add a reply frame to replies[reply_back], dropped when full (the PC sends the command again)',
+        'static void queue_reply(const uint8_t *payload, uint8_t size) {',
+        '    uint8_t *frame = &replies[reply_back][reply_length];',
+    ]
+    if protocol == 2:
+        lines += [
+            '    if (reply_length + size + 6u > ezUART_REPLY_SIZE) {',
+            '        return;',
+            '    }',
+            '    reply_length = (uint16_t)(reply_length + encode_ezUART(payload, size, frame));',
+        ]
+    else:
+        lines += [
+            '    if (reply_length + size + 3u > ezUART_REPLY_SIZE) {',
+            '        return;',
+            '    }',
+            '    frame[0] = 0xAA;',
+            '    frame[1] = size;',
+            '    memcpy(&frame[2], payload, size);',
+            '    frame[size + 2] = 0x55;',
+            '    reply_length = (uint16_t)(reply_length + size + 3);',
+        ]
+    lines += [
+        '}',
+        '',
+        'static void handle_command(const uint8_t *payload, uint8_t size) {',
+        '    uint8_t reply[4 + ezUART_MAX_COMMAND_SIZE];',
+        '    uint8_t reply_size = 4;',
+        '    uint8_t length;',
+        '    uint32_t rate;',
+        '    if (size < 3 || size > ezUART_MAX_COMMAND_SIZE || payload[0] != ezUART_COMMAND_ID',
+        '            || (payload[1] & ezUART_REPLY_FLAG)) {',
+        '        return;',
+        '    }',
+        '    reply[0] = ezUART_COMMAND_ID;',
+        '    reply[1] = (uint8_t)(payload[1] | ezUART_REPLY_FLAG);',
+        '    reply[2] = payload[2];  // Sequence number',
+        '    reply[3] = ezUART_STATUS_OK;',
+        '    switch (payload[1]) {',
+        '    case ezUART_COMMAND_SET:',
+        '        length = size > 3 ? value_size(payload[3]) : 0;',
+        '        if (length == 0) {',
+        '            reply[3] = ezUART_STATUS_UNKNOWN_ID;',
+        '        } else if (size != 4 + length) {',
+        '            reply[3] = ezUART_STATUS_BAD_REQUEST;',
+        '        } else {',
+        '            send_ezUART(&payload[4], payload[3]);',
+        '        }',
+        '        break;',
+        '    case ezUART_COMMAND_READ:',
+        '        if (size != 4) {',
+        '            reply[3] = ezUART_STATUS_BAD_REQUEST;',
+        '        } else if ((length = (uint8_t)read_ezUART(payload[3], &reply[5])) == 0) {',
+        '            reply[3] = ezUART_STATUS_UNKNOWN_ID;',
+        '        } else {',
+        '            reply[4] = payload[3];',
+        '            reply_size = (uint8_t)(5 + length);',
+        '        }',
+        '        break;',
+        '    case ezUART_COMMAND_PING:',
+        '        break;',
+        '    case ezUART_COMMAND_BAUD:',
+        '        rate = size != 7 ? 0 : (uint32_t)payload[3] | (uint32_t)payload[4] << 8',
+        '            | (uint32_t)payload[5] << 16 | (uint32_t)payload[6] << 24;',
+        '        if (rate == 0 || rate > ezUART_MAX_BAUD_RATE || baud_pending != 0) {',
+        '            reply[3] = ezUART_STATUS_BAD_REQUEST;',
+        '        } else if (rate == baud_rate) {',
+        '            baud_confirmed = rate;  // Confirms the rate on trial, if any',
+        '            baud_trial = 0;',
+        '        } else if (baud_trial != 0) {',
+        '            reply[3] = ezUART_STATUS_BAD_REQUEST;  // One trial at a time',
+        '        } else {',
+        '            baud_pending = rate;',
+        '        }',
+        '        break;',
+        '    case ezUART_COMMAND_TEST:',
+        '        memcpy(&reply[4], &payload[3], size - 3u);',
+        '        reply_size = (uint8_t)(size + 1);',
+        '        break;',
+        '    default:',
+        '        reply[3] = ezUART_STATUS_BAD_REQUEST;',
+        '        break;',
+        '    }',
+        '    queue_reply(reply, reply_size);',
+        '}',
+        '',
+        '// Apply the commands received since the last call and hand their replies to the DMA side',
+        'static void process_commands(void) {',
+        '    if (baud_trial != 0 && --baud_trial == 0) {',
+        '        baud_pending = baud_confirmed;  // Not confirmed in time, back to the last good rate',
+        '    }',
+        '    if (baud_pending != 0 && busy == 0 && reply_pending == 0) {',
+        '        ezUART_set_baud_rate(baud_pending);',
+        '        baud_rate = baud_pending;',
+        '        baud_pending = 0;',
+        '        baud_trial = baud_rate != baud_confirmed ? ezUART_BAUD_TRIAL_TICKS : 0;',
+        '        rx_length = 0;  // Drop the command cut by the switch',
+        '    }',
+        '    while (rx_tail != rx_head) {',
+        '        uint8_t byte = rx_ring[rx_tail];',
+        '        rx_tail = (uint16_t)((rx_tail + 1) & (ezUART_RX_SIZE - 1));',
+    ]
+    if protocol == 2:
+        lines += [
+            '        if (byte != 0) {',
+            '            if (rx_length < RX_FRAME_SIZE) {',
+            '                rx_frame[rx_length] = byte;',
+            '            }',
+            '            if (rx_length <= RX_FRAME_SIZE) {',
+            '                rx_length++;  // One past RX_FRAME_SIZE marks a frame too long for a command',
+            '            }',
+            '            continue;',
+            '        }',
+            '        if (rx_length > 0 && rx_length <= RX_FRAME_SIZE) {',
+            '            uint8_t payload[RX_FRAME_SIZE];',
+            '            int size = decode_ezUART(rx_frame, rx_length, payload);',
+            '            if (size >= 0) {',
+            '                handle_command(payload, (uint8_t)size);',
+            '            }',
+            '        }',
+            '        rx_length = 0;',
+        ]
+    else:
+        lines += [
+            '        if (rx_length == 0 && byte != 0xAA) {',
+            '            continue;  // Resync on the next SOF',
+            '        }',
+            '        if (rx_length == 1 && byte > ezUART_MAX_COMMAND_SIZE) {',
+            '            rx_length = 0;  // Too long for a command',
+            '            continue;',
+            '        }',
+            '        rx_frame[rx_length++] = byte;',
+            '        if (rx_length > 1 && rx_length == rx_frame[1] + 3u) {',
+            '            if (byte == 0x55) {',
+            '                handle_command(&rx_frame[2], rx_frame[1]);',
+            '            }',
+            '            rx_length = 0;',
+            '        }',
+        ]
+    lines += [
+        '    }',
+        '    if (reply_length != 0 && reply_pending == 0) {',
+        '        reply_back ^= 1;  // Before reply_pending, the DMA side reads replies[reply_back ^ 1]',
+        '        reply_pending = reply_length;',
+        '        reply_length = 0;',
+        '    }',
+        '}',
+        '',
+    ]
+    return lines
+
+HELPERS = [
+    '// CRC-16/CCITT-FALSE (polynomial 0x1021), same as binascii.crc_hqx on the PC',
+    'uint16_t crc16_ezUART(const uint8_t *data, size_t length, uint16_t crc) {',
+    '    size_t i;',
+    '    int bit;',
+    '    for (i = 0; i < length; i++) {',
+    '        crc ^= (uint16_t)data[i] << 8;',
+    '        for (bit = 0; bit < 8; bit++) {',
+    '            crc = (crc & 0x8000) ? (uint16_t)((crc << 1) ^ 0x1021) : (uint16_t)(crc << 1);',
+    '        }',
+    '    }',
+    '    return crc;',
+    '}',
+    '',
+    '// Build a protocol 2 frame from a payload of (id, value) pairs.',
+    '// frame must hold ezUART_MAX_FRAME_SIZE bytes, returns the number of bytes to send.',
+    'size_t encode_ezUART(const uint8_t *payload, uint8_t size, uint8_t *frame) {',
+    '    uint8_t raw[1 + ezUART_MAX_PAYLOAD_SIZE + 2];',
+    '    size_t raw_length = 0;',
+    '    size_t code_index = 0;  // Where the code byte of the current COBS block goes',
+    '    size_t length = 1;',
+    '    uint8_t code = 1;',
+    '    uint16_t crc;',
+    '    size_t i;',
+    '',
+    '    raw[raw_length++] = size;',
+    '    memcpy(&raw[raw_length], payload, size);',
+    '    raw_length += size;',
+    '    crc = crc16_ezUART(raw, raw_length, ezUART_CRC_INIT);',
+    '    raw[raw_length++] = (uint8_t)(crc & 0xFF);  // Little-endian CRC',
+    '    raw[raw_length++] = (uint8_t)(crc >> 8);',
+    '',
+    '    // COBS: replace every zero with the distance to the next one',
+    '    for (i = 0; i < raw_length; i++) {',
+    '        if (raw[i] == 0) {',
+    '            frame[code_index] = code;',
+    '            code = 1;',
+    '            code_index = length++;',
+    '        } else {',
+    '            frame[length++] = raw[i];',
+    '            code++;',
+    '            if (code == 0xFF) {  // 254 non-zero bytes, start a new block',
+    '                frame[code_index] = code;',
+    '                code = 1;',
+    '                code_index = length++;',
+    '            }',
+    '        }',
+    '    }',
+    '    frame[code_index] = code;',
+    '    frame[length++] = 0;  // Delimiter',
+    '    return length;',
+    '}',
+    '',
+    '// Inverse of encode_ezUART() for a frame without its delimiter: undo COBS, check size and CRC.',
+    '// payload must hold length bytes, returns the payload size or -1 for a corrupted frame.',
+    'int decode_ezUART(const uint8_t *frame, size_t length, uint8_t *payload) {',
+    '    uint8_t raw[1 + ezUART_MAX_PAYLOAD_SIZE + 2];',
+    '    size_t raw_length = 0;',
+    '    size_t index = 0;',
+    '    size_t i;',
+    '    uint16_t crc;',
+    '',
+    '    while (index < length) {',
+    '        uint8_t code = frame[index];',
+    '        if (code == 0 || index + code > length || raw_length + code > sizeof raw) {',
+    '            return -1;',
+    '        }',
+    '        for (i = 1; i < code; i++) {',
+    '            raw[raw_length++] = frame[index + i];',
+    '        }',
+    '        index += code;',
+    '        if (code != 0xFF && index < length) {',
+    '            raw[raw_length++] = 0;',
+    '        }',
+    '    }',
+    '    if (raw_length < 3 || raw[0] + 3u != raw_length) {',
+    '        return -1;',
+    '    }',
+    '    crc = crc16_ezUART(raw, raw_length - 2, ezUART_CRC_INIT);',
+    '    if ((uint16_t)(raw[raw_length - 2] | (raw[raw_length - 1] << 8)) != crc) {',
+    '        return -1;',
+    '    }',
+    '    memcpy(payload, &raw[1], raw[0]);',
+    '    return raw[0];',
+    '}',
+    '',
+]
+
+def generate_source(database, protocol=DEFAULT_PROTOCOL, source='variables.csv', compact=False, fields=()):
+    frames, group_ends = plan_frames(database, compact, fields)
+    hyperperiod = Database.SPEED_PERIODS[group_ends[-1][0]] if group_ends else 1
+    lines = [
+        f'// Generated by codegen.py from {source}, do not edit.',
+        '#include "ezUART.h"',
+        '#include <string.h>',
+        '',
+        '#if defined(__BYTE_ORDER__) && __BYTE_ORDER__ != __ORDER_LITTLE_ENDIAN__',
+        '#error "ezUART sends values little-endian, the copy routines assume a little-endian MCU"',
+        '#endif',
+        '',
+    ]
+    if compact:
+        lines += compact_source(frames, group_ends, hyperperiod, protocol, fields)
+    else:
+        lines += direct_source(frames, group_ends, hyperperiod, protocol, fields)
+    lines += command_lines(protocol)
+    lines += HELPERS
+    return '\n'.join(lines)
+
+def direct_source(frames, group_ends, hyperperiod, protocol, fields=()):
+    """Protocol 1 frames kept ready in a double buffer and sent by DMA as they are."""
+    variables = sorted((field for frame in frames for field in frame.fields), key=lambda field: field[0].var_id)
+    template = frame_template(frames, fields) or bytearray(1)
+    id_count = variables[-1][0].var_id + 1 if variables else 0
+    value_offsets = [0] * id_count  # 0 is never a value offset, it marks unknown IDs
+    value_sizes = [0] * id_count
+    for var, offset in variables:
+        value_offsets[var.var_id] = offset
+        value_sizes[var.var_id] = var.size
+
+    lines = ['// Two copies of every frame: setters fill tx[back] while the DMA sends tx[back ^ 1]',
+             'static uint8_t tx[2][ezUART_TX_SIZE] = {']
+    lines += ['    {', c_array(template, '        '), '    },'] * 2
+    lines += [
+        '};',
+        'static uint8_t back = 0;',
+        '',
+    ]
+    lines += schedule_lines(group_ends, hyperperiod)
+    lines += command_state_lines(protocol)
+    if fields:
+        lines += [
+            '// Offset of each frame in tx, to write the fields of the frames sent',
+            f'static const uint16_t frame_offsets[ezUART_FRAME_COUNT + 1] = {{{c_list([frame.offset for frame in frames] + [len(template)])}}};',
+        ]
+    lines += fields_lines(fields)
+    lines += [
+        '// Value offset in tx and size of each variable ID, offset 0 marks unknown IDs',
+        f'static const uint16_t value_offsets[ezUART_ID_COUNT + 1] = {{{c_list(value_offsets + [0])}}};',
+        f'static const uint8_t value_sizes[ezUART_ID_COUNT + 1] = {{{c_list(value_sizes + [0])}}};',
+        '',
+    ]
+    if protocol == 2:
+        lines += [
+            f'static uint8_t encoded[{max(sum(encoded_size(frame.size) for frame in frames), 1)}];  // Protocol 2 frames of one transfer',
+            '',
+        ]
+    lines += COPY_ROUTINES
+    for frame in frames:
+        for var, offset in frame.fields:
+            lines += [
+                f'void ezUART_set_{c_identifier(var.name)}({"float" if is_scaled(var) else C_TYPES[var.data_type]} value) {{',
+                f'    put_{var.data_type}(&tx[back][{offset}], {raw_expression(var)});',
+                '}',
+                '',
+            ]
+    lines += [
+        'void send_ezUART(const void *value, int id) {',
+        '    if (id < 0 || id >= ezUART_ID_COUNT || value_offsets[id] == 0) {',
+        '        return;  // Unknown ID, do nothing',
+        '    }',
+        '    memcpy(&tx[back][value_offsets[id]], value, value_sizes[id]);',
+        '}',
+        '',
+        'static uint8_t value_size(int id) {',
+        '    return id >= 0 && id < ezUART_ID_COUNT ? value_sizes[id] : 0;',
+        '}',
+        '',
+        'int read_ezUART(int id, void *value) {',
+        '    uint8_t size = value_size(id);',
+        '    if (size != 0) {',
+        '        memcpy(value, &tx[back][value_offsets[id]], size);',
+        '    }',
+        '    return size;',
+        '}',
+        '',
+        'void init_ezUART(void) {',
+        '    tick = 0;',
+        '    busy = 0;',
+        '    ezUART_overruns = 0;',
+    ]
+    lines += init_fields_lines(fields)
+    lines += INIT_COMMANDS
+    lines += [
+        '}',
+        '',
+    ]
+    lines += DMA_COMPLETE
+    lines += [
+        'void run_ezUART(void) {',
+        '    size_t due = 0;',
+        '    uint8_t group;',
+        '    uint8_t front;',
+    ]
+    if fields:
+        lines.append('    uint8_t frame;')
+    lines += [
+        '',
+    ]
+    lines += due_lines(fields)
+    lines += [
+        '',
+        '    front = back;',
+        '    back ^= 1;',
+        '    busy = 1;',
+    ]
+    if fields:
+        lines += [
+            '    for (frame = 0; frame < ezUART_FRAME_COUNT && frame_offsets[frame] < due; frame++) {',
+            '        put_fields(&tx[front][frame_offsets[frame] + 2]);',
+            '    }',
+        ]
+    if protocol == 2:
+        lines += [
+            '    {',
+            '        size_t offset = 0;',
+            '        size_t encoded_length = 0;',
+            '        while (offset < due) {',
+            '            uint8_t size = tx[front][offset + 1];',
+            '            encoded_length += encode_ezUART(&tx[front][offset + 2], size, &encoded[encoded_length]);',
+            '            offset += (size_t)size + 3;',
+            '        }',
+            '        ezUART_start_dma(encoded, encoded_length);',
+            '    }',
+        ]
+    else:
+        lines.append('    ezUART_start_dma(tx[front], due);')
+    lines += [
+        '    // Carry the latest values over, so variables not set this period are resent unchanged',
+        '    memcpy(tx[back], tx[front], ezUART_TX_SIZE);',
+        '}',
+        '',
+    ]
+    return lines
+
+def compact_source(frames, group_ends, hyperperiod, protocol, fields=()):
+    """Compact frames built at send time from the latest raw values, with deltas against what was sent."""
+    variables = [var for frame in frames for var, _ in frame.fields]
+    id_count = max((var.var_id for var in variables), default=-1) + 1
+    indices = [0xFF] * id_count  # 0xFF marks unknown IDs
+    for index, var in enumerate(variables):
+        indices[var.var_id] = index
+    frame_firsts = [frame.fields[0][1] for frame in frames] + [len(variables)]
+    out_size = sum(encoded_size(frame.size) if protocol == 2 else frame.size for frame in frames)
+
+    lines = [
+        '// Latest raw value of every variable in frame order and the value the receiver has,',
+        '// kept as 32-bit words (signed types sign-extended, floats bit for bit)',
+        'static uint32_t raw_values[ezUART_VARIABLE_COUNT + 1];',
+        'static uint32_t sent_values[ezUART_VARIABLE_COUNT + 1];',
+        'static uint8_t until_keyframe[ezUART_FRAME_COUNT + 1];  // Frames left before the next keyframe',
+        f'static uint8_t out[{max(out_size, 1)}];  // Frames of one transfer',
+        '',
+    ]
+    lines += schedule_lines(group_ends, hyperperiod)
+    lines += command_state_lines(protocol)
+    lines += fields_lines(fields)
+    lines += [
+        '// First variable of each frame, value size, delta encoding and signedness of each variable',
+        f'static const uint8_t frame_firsts[ezUART_FRAME_COUNT + 1] = {{{c_list(frame_firsts)}}};',
+        f'static const uint8_t value_sizes[ezUART_VARIABLE_COUNT + 1] = {{{c_list([var.size for var in variables] + [0])}}};',
+        f'static const uint8_t delta_encoded[ezUART_VARIABLE_COUNT + 1] = {{{c_list([int(var.delta) for var in variables] + [0])}}};',
+        f'static const uint8_t value_signed[ezUART_VARIABLE_COUNT + 1] = {{{c_list([int(var.data_type in ("int", "int8", "int16")) for var in variables] + [0])}}};',
+        f'static const uint8_t variable_indices[ezUART_ID_COUNT + 1] = {{{c_list(indices + [0xFF])}}};',
+        '',
+    ]
+    lines += COPY_ROUTINES
+    for var in variables:
+        index = variables.index(var)
+        if var.data_type == 'float':
+            body = [f'    memcpy(&raw_values[{index}], &value, sizeof value);']
+        elif var.data_type == 'uint':
+            body = [f'    raw_values[{index}] = {raw_expression(var)};']
+        else:
+            body = [f'    raw_values[{index}] = (uint32_t)(int32_t){raw_expression(var)};']
+        lines += [f'void ezUART_set_{c_identifier(var.name)}({"float" if is_scaled(var) else C_TYPES[var.data_type]} value) {{']
+        lines += body + ['}', '']
+    lines += [
+        'void send_ezUART(const void *value, int id) {',
+        '    uint8_t index;',
+        '    uint32_t raw = 0;',
+        '    if (id < 0 || id >= ezUART_ID_COUNT || variable_indices[id] == 0xFF) {',
+        '        return;  // Unknown ID, do nothing',
+        '    }',
+        '    index = variable_indices[id];',
+        '    memcpy(&raw, value, value_sizes[index]);',
+        '    if (value_signed[index] && value_sizes[index] == 1) {',
+        '        raw = (uint32_t)(int32_t)(int8_t)raw;',
+        '    } else if (value_signed[index] && value_sizes[index] == 2) {',
+        '        raw = (uint32_t)(int32_t)(int16_t)raw;',
+        '    }',
+        '    raw_values[index] = raw;',
+        '}',
+        '',
+        'static uint8_t value_size(int id) {',
+        '    if (id < 0 || id >= ezUART_ID_COUNT || variable_indices[id] == 0xFF) {',
+        '        return 0;',
+        '    }',
+        '    return value_sizes[variable_indices[id]];',
+        '}',
+        '',
+        'int read_ezUART(int id, void *value) {',
+        '    uint8_t size = value_size(id);',
+        '    if (size != 0) {',
+        '        memcpy(value, &raw_values[variable_indices[id]], size);  // Low bytes of the raw value',
+        '    }',
+        '    return size;',
+        '}',
+        '',
+        'void init_ezUART(void) {',
+        '    tick = 0;',
+        '    busy = 0;',
+        '    ezUART_overruns = 0;',
+    ]
+    lines += init_fields_lines(fields)
+    lines += INIT_COMMANDS
+    lines += [
+        '    memset(until_keyframe, 0, sizeof until_keyframe);  // Start every frame with a keyframe',
+        '}',
+        '',
+    ]
+    lines += DMA_COMPLETE
+    lines += [
+        '// Write the compact payload of a frame, returns its size',
+        'static uint8_t build_frame(uint8_t frame, uint8_t *payload) {',
+        '    uint8_t first = frame_firsts[frame];',
+        '    uint8_t count = (uint8_t)(frame_firsts[frame + 1] - first);',
+        '    uint8_t mask_size = (uint8_t)((count + 7) / 8);',
+        '    uint8_t keyframe = until_keyframe[frame] == 0;',
+        '    uint8_t size;',
+        '    uint8_t i;',
+        '',
+        '    // A delta too large for int8 turns the frame into a keyframe',
+        '    for (i = first; i < first + count && !keyframe; i++) {',
+        '        int32_t delta = (int32_t)(raw_values[i] - sent_values[i]);',
+        '        if (delta_encoded[i] && (delta < -128 || delta > 127)) {',
+        '            keyframe = 1;',
+        '        }',
+        '    }',
+        '    payload[0] = ezUART_COMPACT_ID;',
+        '    payload[1] = (uint8_t)(frame | (keyframe ? ezUART_KEYFRAME_FLAG : 0));',
+        '    memset(&payload[2], 0, mask_size);',
+        '    size = (uint8_t)(2 + mask_size);',
+        '    for (i = 0; i < count; i++) {',
+        '        uint8_t index = (uint8_t)(first + i);',
+        '        if (!keyframe && raw_values[index] == sent_values[index]) {',
+        '            continue;  // Unchanged, the receiver keeps its value',
+        '        }',
+        '        payload[2 + i / 8] |= (uint8_t)(1 << (i % 8));',
+        '        if (!keyframe && delta_encoded[index]) {',
+        '            payload[size++] = (uint8_t)(int8_t)(int32_t)(raw_values[index] - sent_values[index]);',
+        '        } else {',
+        '            memcpy(&payload[size], &raw_values[index], value_sizes[index]);  // Low bytes first',
+        '            size = (uint8_t)(size + value_sizes[index]);',
+        '        }',
+        '        sent_values[index] = raw_values[index];',
+        '    }',
+        '    until_keyframe[frame] = keyframe ? ezUART_KEYFRAME_INTERVAL - 1 : (uint8_t)(until_keyframe[frame] - 1);',
+        '    return size;',
+        '}',
+        '',
+        'void run_ezUART(void) {',
+        '    uint8_t due = 0;',
+        '    uint8_t group;',
+        '    uint8_t frame;',
+        '    size_t length = 0;',
+        '',
+    ]
+    lines += due_lines(fields)
+    lines += ['', '    for (frame = 0; frame < due; frame++) {']
+    if protocol == 2:
+        lines.append('        uint8_t payload[ezUART_MAX_PAYLOAD_SIZE];')
+        if fields:
+            lines.append('        put_fields(payload);')
+        lines += [
+            '        uint8_t size = (uint8_t)(ezUART_FIELDS_SIZE + build_frame(frame, &payload[ezUART_FIELDS_SIZE]));',
+            '        length += encode_ezUART(payload, size, &out[length]);',
+        ]
+    else:
+        if fields:
+            lines.append('        put_fields(&out[length + 2]);')
+        lines += [
+            '        uint8_t size = (uint8_t)(ezUART_FIELDS_SIZE + build_frame(frame, &out[length + 2 + ezUART_FIELDS_SIZE]));',
+            '        out[length] = 0xAA;',
+            '        out[length + 1] = size;',
+            '        out[length + 2 + size] = 0x55;',
+            '        length += (size_t)size + 3;',
+        ]
+    lines += [
+        '    }',
+        '    busy = 1;',
+        '    ezUART_start_dma(out, length);',
+        '}',
+        '',
+    ]
+    return lines
+
+def generate_layout(database, protocol=DEFAULT_PROTOCOL, source='variables.csv', compact=False, fields=()):
+    """Python module describing the generated frames, for SerialInterface.load_frame_layouts()."""
+    frames, _ = plan_frames(database, compact, fields)
+    lines = [
+        f'# Generated by codegen.py from {source}, do not edit.',
+        '# Frames sent by the generated ezUART.c, load them with codegen.load_layout() or capture.py --layout.',
+        f'PROTOCOL = {protocol}',
+        f'COMPACT = {compact}',
+        f'SEQUENCE = {SEQUENCE_ID in fields}',
+        f'TIMESTAMP = {TIMESTAMP_ID in fields}',
+        f'LAYOUT_HASH = 0x{layout_hash(frames, compact, fields):08X}',
+        '',
+        '# (speed group, variable IDs in frame order, frame size in bytes once SerialInterface removed the fields),',
+        '# the size of compact frames being their keyframe size',
+        'FRAMES = [',
+    ]
+    lines += [f'    ({frame.speed!r}, {tuple(var.var_id for var, _ in frame.fields)!r}, {frame.size - fields_size(fields)}),'
+              for frame in frames]
+    lines += [']', '']
+    return '\n'.join(lines)
+
+def load_layout(filename, database, interface):
+    """Import an ezUART_layout.py written by generate_layout() and load its frames into a SerialInterface.
+
+    Returns the module. Raises ValueError when the file is not a layout or
+    its LAYOUT_HASH differs from the frames planned from database, i.e. the
+    firmware was generated from another database.
+    """
+    spec = importlib.util.spec_from_file_location('ezUART_layout', filename)
+    if spec is None:
+        raise ValueError(f"{filename} is not a Python module")
+    module = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(module)
+        compact = module.COMPACT
+        fields = [field for field, sent in ((SEQUENCE_ID, module.SEQUENCE), (TIMESTAMP_ID, module.TIMESTAMP)) if sent]
+        firmware_hash = module.LAYOUT_HASH
+    except (SyntaxError, AttributeError) as e:
+        raise ValueError(f"{filename} is not an ezUART layout: {e}")
+    frames, _ = plan_frames(database, compact, fields)
+    database_hash = layout_hash(frames, compact, fields)
+    if firmware_hash != database_hash:
+        raise ValueError(f"{filename} has layout hash 0x{firmware_hash:08X} but {database.filename} "
+                         f"0x{database_hash:08X}, regenerate the firmware")
+    interface.load_frame_layouts(module.FRAMES, compact)
+    return module
+
+def uses_compact(database):
+    """Delta variables need compact frames."""
+    return any(var.delta for var in database.get_variables())
+
+def schedule_frames(database, run_rate, baud_rate=None, compact=False, fields=()):
+    """Schedule the generated frames on the line when run_ezUART() is called run_rate times per second.
+
+    Compact frames are budgeted at their keyframe size, the worst case.
+    """
+    frames, _ = plan_frames(database, compact, fields)
+    if baud_rate is None:
+        baud_rate = max((var.baud_rate for frame in frames for var, _ in frame.fields), default=Database.BAUD_RATES['slow'])
+    messages = [Message(f'{frame.speed} #{index}', frame.size - FRAME_OVERHEAD, run_rate / Database.SPEED_PERIODS[frame.speed])
+                for index, frame in enumerate(frames)]
+    return schedule_messages(messages, baud_rate, overhead_bytes=FRAME_OVERHEAD)
+
+def generate(database, output, protocol=DEFAULT_PROTOCOL, compact=False, fields=(), hardware=DEFAULT_HARDWARE):
+    """Write ezUART.h, ezUART.c and ezUART_layout.py to the output directory.
+
+    Compact frames are generated when compact is set or any variable is delta
+    encoded. fields lists the optional frame fields sent, SEQUENCE_ID and/or
+    TIMESTAMP_ID. hardware names a HardwareConfig entry, which limits the baud
+    rates the PC may switch to. Raises ValueError if the variables, sent in
+    these frames, would use more than Database.MAX_UTILIZATION of the link.
+    """
+    fields = [field for field in FIELD_SIZES if field in fields]  # Wire order
+    source = os.path.basename(database.filename)
+    compact = compact or uses_compact(database)
+    names = {}
+    for var in database.get_variables():
+        if var.data_type not in C_TYPES:
+            raise ValueError(f"No C type for '{var.name}': {var.data_type}")
+        identifier = c_identifier(var.name)
+        if identifier in names:
+            raise ValueError(f"Variables '{names[identifier]}' and '{var.name}' share the C name {identifier}")
+        names[identifier] = var.name
+    overload = database.link_overload(protocol, compact, fields)
+    if overload is not None:
+        raise ValueError(f"{overload} Move variables to slower speed groups or raise the baud rate.")
+
+    os.makedirs(output, exist_ok=True)
+    files = {
+        'ezUART.h': generate_header(database, protocol, source, compact, fields, hardware),
+        'ezUART.c': generate_source(database, protocol, source, compact, fields),
+        'ezUART_layout.py': generate_layout(database, protocol, source, compact, fields),
+    }
+    for name, content in files.items():
+        with open(os.path.join(output, name), 'w', newline='\n') as file:
+            file.write(content)
+    return [os.path.join(output, name) for name in files]
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the ezUART firmware files from a variable database.")
+    parser.add_argument('--database', default='variables.csv', help="Variable database file")
+    parser.add_argument('--output', default=os.path.join('..', 'ezUART'), help="Directory for the generated files")
+    parser.add_argument('--protocol', type=int, choices=PROTOCOL_VERSIONS, default=DEFAULT_PROTOCOL,
+                        help="Wire protocol version sent by the firmware")
+    parser.add_argument('--compact', action='store_true',
+                        help="Send compact frames (implied when a variable is delta encoded)")
+    parser.add_argument('--sequence', action='store_true', help="Send a sequence number in every frame")
+    parser.add_argument('--timestamp', action='store_true', help="Send the run_ezUART() tick count in every frame")
+    parser.add_argument('--rate', type=float, help="run_ezUART() calls per second, prints the line schedule")
+    parser.add_argument('--hardware', choices=sorted(HardwareConfig().get_supported_hardware()),
+                        default=DEFAULT_HARDWARE, help="Target hardware, limits the baud rates the PC may select")
+    args = parser.parse_args()
+
+    database = Database(args.database)
+    if not database.get_variables():
+        parser.error(f"No variables in {args.database}")
+    compact = args.compact or uses_compact(database)
+    fields = [field for field, enabled in ((SEQUENCE_ID, args.sequence), (TIMESTAMP_ID, args.timestamp)) if enabled]
+    try:
+        paths = generate(database, args.output, args.protocol, compact, fields, args.hardware)
+    except ValueError as e:
+        parser.error(str(e))
+    frames, _ = plan_frames(database, compact, fields)
+    print(f"{len(database.get_variables())} variables in {len(frames)} {'compact ' if compact else ''}frames, "
+          f"wrote {', '.join(paths)}")
+    if args.rate:
+        print_report(schedule_frames(database, args.rate, compact=compact, fields=fields))
+
+if __name__ == '__main__':
+    main()
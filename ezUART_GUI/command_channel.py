@@ -0,0 +1,308 @@
+"""Framed PC to MCU command channel: set and read variables, ping, change the baud rate.
+
+Requests and replies are ordinary frames, wrapped by the SerialInterface
+wire protocol, whose payload starts with COMMAND_ID:
+
+    request: COMMAND_ID, opcode, sequence, [variable ID, [raw value]]
+    reply:   COMMAND_ID, opcode | REPLY_FLAG, sequence, status, [variable ID, raw value]
+
+A writer thread sends queued requests while fewer than window requests
+wait for their reply, retransmits those not acknowledged within timeout
+and fails them after retries retransmissions. Setting a variable that
+already has a set waiting to be sent replaces its value instead of queueing
+another request, and at most one set per variable is in flight, so a slider
+producing hundreds of updates per second costs one request per round trip
+and the MCU always ends up with the latest value.
+
+    channel = CommandChannel(interface)
+    channel.start()
+    channel.set_variable(var_id, 1.5)
+    value = channel.read_variable(var_id).result(timeout=1)
+
+A baud rate change only holds on trial: the MCU switches after replying,
+and goes back to the previous rate unless the PC confirms the new one
+with a second set_baud_rate() call, sent at the new rate, within
+BAUD_TRIAL_TIME. Test frames are echoed by the MCU and never
+retransmitted, see baud_negotiation.py.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from database import COMMAND_ID
+from serial_interface import SOF, EOF
+
+COMMAND_SET = 1
+COMMAND_READ = 2
+COMMAND_PING = 3
+COMMAND_BAUD = 4  # Followed by the uint32 baud rate instead of a variable ID
+COMMAND_TEST = 5  # Followed by bytes the MCU echoes in its reply
+REPLY_FLAG = 0x80
+REPLY_HEADER_SIZE = 4  # COMMAND_ID, opcode, sequence, status
+
+STATUS_OK = 0
+STATUS_UNKNOWN_ID = 1
+STATUS_BAD_REQUEST = 2
+STATUS_NAMES = {STATUS_OK: "ok", STATUS_UNKNOWN_ID: "unknown variable ID", STATUS_BAD_REQUEST: "bad request"}
+
+WINDOW = 8  # Default requests waiting for their reply at once
+MAX_WINDOW = 128  # Sequence numbers are one byte, half of them may be outstanding
+TIMEOUT = 0.1  # Default seconds before a request is sent again
+RETRIES = 3  # Default retransmissions before a request fails
+RTT_SMOOTHING = 0.125  # Weight of a new round trip time in the smoothed one
+BAUD_TRIAL_TIME = 2.0  # Seconds the MCU waits for the confirmation of a new baud rate
+
+class CommandError(Exception):
+    """The MCU rejected a command."""
+
+class Request:
+    """One command, resolved through future once acknowledged or failed."""
+
+    def __init__(self, opcode, var_id=None, value=None, data=b"", retries=None):
+        self.opcode = opcode
+        self.var_id = var_id
+        self.value = value
+        self.data = data  # Raw value bytes sent after the variable ID
+        self.retries = retries  # None for the channel default
+        self.future = Future()
+        self.sequence = None
+        self.sent = 0.0  # Monotonic time of the last transmission
+        self.attempts = 0
+
+class CommandChannel:
+    def __init__(self, interface, window=WINDOW, timeout=TIMEOUT, retries=RETRIES):
+        if not 1 <= window <= MAX_WINDOW:
+            raise ValueError(f"Command window must be between 1 and {MAX_WINDOW}, got {window}")
+        self.interface = interface
+        self.window = window
+        self.timeout = timeout
+        self.retries = retries
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.queued = OrderedDict()  # Key -> Request waiting to be sent, sets and reads coalesce on their key
+        self.in_flight = {}  # Sequence number -> Request waiting for its reply
+        self.setting = set()  # Variable IDs with a set in flight
+        self.raw = []  # Unframed bytes queued by write()
+        self.next_sequence = 0
+        self.next_key = 0  # Pings, baud rate changes and tests never coalesce, each gets its own key
+        self.dirty = False  # Set with a notify whenever the writer thread has something new to look at
+        self.running = False
+        self.thread = None
+
+        self.sent = 0  # Requests sent, retransmissions excluded
+        self.retransmits = 0
+        self.acked = 0
+        self.coalesced = 0  # Sets and reads merged into a queued request
+        self.timeouts = 0
+        self.errors = 0  # Requests rejected by the MCU
+        self.stale = 0  # Replies matching no request in flight
+        self.rtt = None  # Smoothed round trip time in seconds
+
+    def start(self):
+        self.interface.on_command_reply = self.handle_reply
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the writer thread and fail every request still pending."""
+        with self.lock:
+            self.running = False
+            self.dirty = True
+            self.wakeup.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.interface.on_command_reply == self.handle_reply:
+            self.interface.on_command_reply = None
+        with self.lock:
+            pending = list(self.queued.values()) + list(self.in_flight.values())
+            self.queued.clear()
+            self.in_flight.clear()
+            self.setting.clear()
+        for request in pending:
+            request.future.set_exception(ConnectionError("Command channel stopped"))
+
+    def set_variable(self, var_id, value):
+        """Queue setting a variable, returns a Future resolved with the value once the MCU acknowledged it.
+
+        Raises struct.error right away when the value does not fit the variable type.
+        """
+        data = self.interface.decoders[var_id].pack(self.interface.raw_value(var_id, value))
+        return self.submit((COMMAND_SET, var_id), COMMAND_SET, var_id, value, data)
+
+    def read_variable(self, var_id):
+        """Queue reading a variable, returns a Future resolved with its current value on the MCU."""
+        return self.submit((COMMAND_READ, var_id), COMMAND_READ, var_id)
+
+    def ping(self):
+        """Queue a ping, returns a Future resolved with the round trip time in seconds."""
+        return self.submit(self.unique_key(COMMAND_PING), COMMAND_PING)
+
+    def set_baud_rate(self, baud_rate):
+        """Queue a baud rate change, or the confirmation of the rate on trial.
+
+        Returns a Future resolved with baud_rate once the MCU acknowledged it,
+        the MCU switches right after its reply.
+        """
+        return self.submit(self.unique_key(COMMAND_BAUD), COMMAND_BAUD, value=baud_rate,
+                           data=baud_rate.to_bytes(4, 'little'))
+
+    def test(self, data):
+        """Queue a test frame, never retransmitted, returns a Future resolved with the bytes echoed."""
+        return self.submit(self.unique_key(COMMAND_TEST), COMMAND_TEST, value=data, data=data, retries=0)
+
+    def unique_key(self, opcode):
+        with self.lock:
+            self.next_key += 1
+            return (opcode, self.next_key)
+
+    def submit(self, key, opcode, var_id=None, value=None, data=b"", retries=None):
+        with self.lock:
+            request = self.queued.get(key)
+            if request is not None:
+                request.value = value  # Only the latest value matters
+                request.data = data
+                self.coalesced += 1
+                return request.future
+            request = self.queued[key] = Request(opcode, var_id, value, data, retries)
+            self.dirty = True
+            self.wakeup.notify()
+        return request.future
+
+    def write(self, data):
+        """Queue unframed bytes for the writer thread, e.g. text typed in the console."""
+        with self.lock:
+            self.raw.append(bytes(data))
+            self.dirty = True
+            self.wakeup.notify()
+
+    def pending(self):
+        """Requests queued or waiting for their reply."""
+        return len(self.queued) + len(self.in_flight)
+
+    def encode(self, request):
+        payload = bytearray((COMMAND_ID, request.opcode, request.sequence))
+        if request.var_id is not None:
+            payload.append(request.var_id)
+        payload += request.data
+        return self.interface.wrap_frame(SOF + bytes((len(payload),)) + bytes(payload) + EOF)
+
+    def allocate_sequence(self):
+        while self.next_sequence in self.in_flight:
+            self.next_sequence = (self.next_sequence + 1) & 0xFF
+        sequence = self.next_sequence
+        self.next_sequence = (sequence + 1) & 0xFF
+        return sequence
+
+    def collect(self, now):
+        """Frames to send now and requests that ran out of retries, returns (data, failed, wait)."""
+        data = bytearray(b"".join(self.raw))
+        self.raw.clear()
+        failed = []
+        deadline = None
+
+        for sequence, request in list(self.in_flight.items()):
+            expires = request.sent + self.timeout
+            if expires <= now:
+                if request.attempts > (self.retries if request.retries is None else request.retries):
+                    del self.in_flight[sequence]
+                    if request.opcode == COMMAND_SET:
+                        self.setting.discard(request.var_id)
+                    self.timeouts += 1
+                    failed.append(request)
+                    continue
+                data += self.encode(request)
+                request.sent = now
+                request.attempts += 1
+                self.retransmits += 1
+                expires = now + self.timeout
+            deadline = expires if deadline is None else min(deadline, expires)
+
+        for key in list(self.queued):
+            if len(self.in_flight) >= self.window:
+                break
+            request = self.queued[key]
+            if request.opcode == COMMAND_SET:
+                if request.var_id in self.setting:
+                    continue  # Keep coalescing until the previous set is acknowledged
+                self.setting.add(request.var_id)
+            del self.queued[key]
+            request.sequence = self.allocate_sequence()
+            request.sent = now
+            request.attempts = 1
+            self.in_flight[request.sequence] = request
+            self.sent += 1
+            data += self.encode(request)
+            expires = now + self.timeout
+            deadline = expires if deadline is None else min(deadline, expires)
+
+        wait = None if deadline is None else max(deadline - now, 0.0)
+        return bytes(data), failed, wait
+
+    def run(self):
+        """Writer thread: send, retransmit and time out requests, never blocking the callers."""
+        wait = None
+        while True:
+            with self.lock:
+                if not self.dirty:
+                    self.wakeup.wait(wait)  # Until new requests, a reply, stop() or the next timeout
+                self.dirty = False
+                if not self.running:
+                    return
+                data, failed, wait = self.collect(time.monotonic())
+            if data:
+                try:
+                    self.interface.write(data)
+                except Exception as e:  # Port closed under us, the requests time out
+                    print(f"Command write failed: {e}")
+            for request in failed:
+                request.future.set_exception(TimeoutError(
+                    f"No reply to command {request.opcode} after {request.attempts} attempts"))
+
+    def handle_reply(self, frame):
+        """Resolve the request a reply frame (SOF, size, payload, EOF) acknowledges, called by the reader thread."""
+        payload = frame[2:-1]
+        if len(payload) < REPLY_HEADER_SIZE or not payload[1] & REPLY_FLAG:
+            return
+        now = time.monotonic()
+        with self.lock:
+            request = self.in_flight.get(payload[2])
+            if request is None or request.opcode != payload[1] & ~REPLY_FLAG:
+                self.stale += 1
+                return
+            del self.in_flight[payload[2]]
+            if request.opcode == COMMAND_SET:
+                self.setting.discard(request.var_id)
+            rtt = now - request.sent
+            self.rtt = rtt if self.rtt is None else self.rtt + RTT_SMOOTHING * (rtt - self.rtt)
+            self.acked += 1
+            status = payload[3]
+            if status != STATUS_OK:
+                self.errors += 1
+            self.dirty = True
+            self.wakeup.notify()
+
+        if status != STATUS_OK:
+            request.future.set_exception(CommandError(
+                f"Command {request.opcode} rejected: {STATUS_NAMES.get(status, status)}"))
+        elif request.opcode == COMMAND_READ:
+            try:  # Never raise into the reader thread, the request is already out of in_flight
+                var_id = payload[REPLY_HEADER_SIZE]
+                value = self.interface.decoders[var_id].unpack_from(payload, REPLY_HEADER_SIZE + 1)[0]
+            except Exception as e:
+                request.future.set_exception(CommandError(f"Malformed read reply: {e}"))
+                return
+            request.future.set_result(self.interface.scaled(var_id, value))
+        elif request.opcode == COMMAND_PING:
+            request.future.set_result(rtt)
+        elif request.opcode == COMMAND_TEST:
+            request.future.set_result(bytes(payload[REPLY_HEADER_SIZE:]))
+        else:
+            request.future.set_result(request.value)
+
+    def summary(self):
+        """One line of counters for status displays."""
+        rtt = "-" if self.rtt is None else f"{self.rtt * 1e3:.1f} ms"
+        return (f"{self.sent} sent, {self.acked} acked, {self.coalesced} coalesced, {self.retransmits} retransmitted, "
+                f"{self.timeouts} timed out, {self.errors} rejected, RTT {rtt}")
@@ -1,5 +1,45 @@
 import csv
 import os
+import struct
+from collections import namedtuple
+from math import ceil
+from operator import attrgetter
+import numpy as np
+import bandwidth
+
+# One database entry. The first three fields keep the original (name, baud_rate, type) layout.
+# Values are sent as (value - offset) / scale, delta variables as int8 differences in compact frames.
+Variable = namedtuple('Variable', ['name', 'baud_rate', 'data_type', 'var_id', 'speed', 'size',
+                                   'scale', 'offset', 'delta'], defaults=(1.0, 0.0, False))
+
+# Dense lookup tables indexed by variable ID, produced by Database.compile().
+# scales holds None for unscaled variables, frames the variables of each compact frame number.
+DecoderTable = namedtuple('DecoderTable', ['decoders', 'type_names', 'scales', 'offsets', 'frames'])
+
+DEFAULT_TYPE = 'float'  # Type assumed for variable IDs missing from the database
+MAX_VAR_ID = 251  # Variable IDs are sent as one byte, the IDs above are reserved, so at most 252 variables
+TABLE_SIZE = 256  # Decoder tables cover every byte value
+
+# Compact frames: COMPACT_ID, frame number (KEYFRAME_FLAG set on keyframes), a bitmask of the
+# variables present, then their values in frame order. Delta frames carry int8 differences
+# for delta variables, variables missing from the bitmask keep their previous value.
+COMPACT_ID = 255
+KEYFRAME_FLAG = 0x80
+COMPACT_HEADER_SIZE = 2  # COMPACT_ID and frame number, the bitmask follows
+KEYFRAME_INTERVAL = 16  # Compact frames sent between two keyframes of the same frame number
+DELTA_TYPE = 'int8'
+
+# Command frames between the PC and the MCU start with COMMAND_ID, see command_channel.py
+COMMAND_ID = 252
+
+# Optional frame fields, in this order at the start of the payload: SEQUENCE_ID and a uint8
+# counter incremented per frame sent, TIMESTAMP_ID and the uint32 run_ezUART() tick count.
+SEQUENCE_ID = 253
+TIMESTAMP_ID = 254
+SEQUENCE_SIZE = 2
+TIMESTAMP_SIZE = 5
+FIELD_SIZES = {SEQUENCE_ID: SEQUENCE_SIZE, TIMESTAMP_ID: TIMESTAMP_SIZE}  # In wire order
+FIELDS_SIZE = SEQUENCE_SIZE + TIMESTAMP_SIZE  # Room kept in every frame so enabling the fields never splits one
 
 class Database:
     BAUD_RATES = {
@@ -8,40 +48,307 @@ class Database:
         'very fast': 115200
     }
 
+    # run_ezUART() calls between two transmissions of a speed group, fastest first.
+    # Each period must be a multiple of the previous one.
+    SPEED_PERIODS = {
+        'very fast': 1,
+        'fast': 10,
+        'slow': 100
+    }
+    RUN_RATE = 1000  # Default run_ezUART() calls per second
+    MAX_UTILIZATION = 0.9  # Share of the link variables may use, the rest is margin for jitter
+
+    # Wire format of the value sent for each data type (little-endian)
+    TYPE_FORMATS = {
+        'float': '<f',
+        'int': '<i',
+        'uint': '<I',
+        'int8': '<b',
+        'int16': '<h'
+    }
+    INTEGER_TYPES = ('int', 'uint', 'int8', 'int16')  # Types that can be delta encoded
+    SCALED_TYPES = ('int8', 'int16')  # Types that can carry a scale and offset
+
     def __init__(self, filename='variables.csv'):
         self.filename = filename
-        self.variables = []
+        self.variables = {}  # Variable ID -> Variable
+        self.names = {}  # Variable name -> variable ID
+        self.next_id = 0  # No ID below this one is free
+        self.compiled = None  # Cached DecoderTable, dropped on every change
+        # Value bytes and variable count of each speed group in SPEED_PERIODS order, kept up to date
+        # by insert() and remove_variable() so the admission control never walks the variables
+        self.group_bytes = np.zeros(len(self.SPEED_PERIODS))
+        self.group_counts = np.zeros(len(self.SPEED_PERIODS))
+        # Link the variables are sent over, used by the bandwidth admission control
+        self.link_baud_rate = max(self.BAUD_RATES.values())
+        self.run_rate = self.RUN_RATE
+        self.protocol = bandwidth.DEFAULT_PROTOCOL
+        self.compact = False  # Frames are budgeted as compact keyframes
+        self.fields = ()  # Optional frame fields sent, SEQUENCE_ID and/or TIMESTAMP_ID
         self.load_variables()
 
-    def add_variable(self, variable_name, baud_rate_name, data_type):
-        # Ensure unique variable names
-        if any(var[0] == variable_name for var in self.variables):
-            print(f"Variable '{variable_name}' already exists.")
-            return
-        baud_rate = self.BAUD_RATES.get(baud_rate_name)
-        if baud_rate is None:
+    def add_variable(self, variable_name, baud_rate_name, data_type, var_id=None, auto_place=False,
+                     scale=1.0, offset=0.0, delta=False):
+        """Add a variable to a speed group in O(1) and return its ID, or None if it is invalid.
+
+        The variable gets the lowest free ID unless var_id is given. It is
+        rejected when the link would exceed MAX_UTILIZATION, or moved to the
+        fastest slower group that still fits with auto_place. Integer types
+        can carry scaled values (value = raw * scale + offset) and be delta
+        encoded in compact frames.
+        """
+        if baud_rate_name not in self.BAUD_RATES:
             print(f"Invalid baud rate name: {baud_rate_name}")
-            return
-        self.variables.append((variable_name, baud_rate, data_type))
+            return None
+        if data_type in self.TYPE_FORMATS and variable_name not in self.names:
+            baud_rate_name = self.admit(variable_name, baud_rate_name, struct.calcsize(self.TYPE_FORMATS[data_type]),
+                                        auto_place)
+            if baud_rate_name is None:
+                return None
+        return self.insert(variable_name, self.BAUD_RATES[baud_rate_name], data_type, var_id, baud_rate_name,
+                           scale, offset, delta)
+
+    def admit(self, variable_name, speed, size, auto_place=False, compact=None, fields=None):
+        """Speed group a new variable of size bytes can be sent in without overrunning the link, or None.
+
+        compact and fields override the frame format of the link, see frame_format().
+        """
+        speeds = list(self.SPEED_PERIODS)
+        requested = self.group_index(speed)
+        payload_bytes, variable_counts = bandwidth.placements(self.group_bytes, self.group_counts, size)
+        usage = bandwidth.utilization([self.link_baud_rate], payload_bytes, variable_counts, self.speed_frequencies(),
+                                      *self.frame_format(None, compact, fields))[0]
+        if usage[requested] <= self.MAX_UTILIZATION:
+            return speed
+        if auto_place:
+            for group in range(requested + 1, len(speeds)):
+                if usage[group] <= self.MAX_UTILIZATION and speeds[group] in self.BAUD_RATES:
+                    print(f"Variable '{variable_name}' moved from '{speed}' to '{speeds[group]}' to fit the link.")
+                    return speeds[group]
+        print(f"Variable '{variable_name}' would use {usage[requested]:.0%} of {self.link_baud_rate} baud "
+              f"in '{speed}' (limit {self.MAX_UTILIZATION:.0%}).")
+        return None
+
+    def insert(self, variable_name, baud_rate, data_type, var_id, speed, scale=1.0, offset=0.0, delta=False):
+        """Validate and index one variable, shared by add_variable and load_variables."""
+        # Ensure unique variable names and IDs
+        if variable_name in self.names:
+            print(f"Variable '{variable_name}' already exists.")
+            return None
+        if data_type not in self.TYPE_FORMATS:
+            print(f"Invalid data type for '{variable_name}': {data_type}")
+            return None
+        scaled = scale != 1.0 or offset != 0.0
+        if scale == 0 or (scaled and data_type not in self.SCALED_TYPES) or (delta and data_type not in self.INTEGER_TYPES):
+            print(f"Invalid encoding for '{variable_name}': scale {scale}, delta {delta} ({data_type})")
+            return None
+        if var_id is None:
+            var_id = self.free_id()
+            if var_id is None:
+                print(f"No free variable ID left for '{variable_name}'.")
+                return None
+        elif not 0 <= var_id <= MAX_VAR_ID or var_id in self.variables:
+            print(f"Invalid or duplicate variable ID for '{variable_name}': {var_id}")
+            return None
+        size = struct.calcsize(self.TYPE_FORMATS[data_type])
+        self.variables[var_id] = Variable(variable_name, baud_rate, data_type, var_id, speed, size,
+                                          float(scale), float(offset), bool(delta))
+        self.names[variable_name] = var_id
+        group = self.group_index(speed)
+        self.group_bytes[group] += size
+        self.group_counts[group] += 1
+        self.compiled = None
+        return var_id
+
+    def free_id(self):
+        """Lowest unused variable ID, amortized O(1) since next_id only moves forward on adds."""
+        while self.next_id in self.variables:
+            self.next_id += 1
+        return self.next_id if self.next_id <= MAX_VAR_ID else None
+
+    def remove_variable(self, variable_name):
+        var_id = self.names.pop(variable_name, None)
+        if var_id is not None:
+            var = self.variables.pop(var_id)
+            group = self.group_index(var.speed)
+            self.group_bytes[group] -= var.size
+            self.group_counts[group] -= 1
+            self.next_id = min(self.next_id, var_id)
+            self.compiled = None
+
+    def group_of(self, speed):
+        """Speed group a variable is sent with, unknown speeds go with the slowest group."""
+        return speed if speed in self.SPEED_PERIODS else list(self.SPEED_PERIODS)[-1]
+
+    def group_index(self, speed):
+        """Position of the speed group of speed in SPEED_PERIODS."""
+        return list(self.SPEED_PERIODS).index(self.group_of(speed))
+
+    def speed_frequencies(self):
+        """Frames per second of each speed group, in SPEED_PERIODS order."""
+        return self.run_rate / np.array(list(self.SPEED_PERIODS.values()), dtype=float)
+
+    def group_usage(self):
+        """Value bytes and variable count of each speed group, in SPEED_PERIODS order."""
+        return self.group_bytes.copy(), self.group_counts.copy()
+
+    def frame_format(self, protocol=None, compact=None, fields=None):
+        """Protocol, compact flag and header bytes per frame for the bandwidth model.
+
+        Arguments left as None take the protocol, compact and fields attributes.
+        The header covers the optional fields and the compact frame header.
+        """
+        protocol = self.protocol if protocol is None else protocol
+        compact = self.compact if compact is None else compact
+        fields = self.fields if fields is None else fields
+        header_bytes = sum(FIELD_SIZES[field] for field in fields) + (COMPACT_HEADER_SIZE if compact else 0)
+        return protocol, compact, header_bytes
+
+    def utilization(self, baud_rates=None):
+        """Share of the link the variables use, or an array with one entry per baud rate."""
+        rates = [self.link_baud_rate] if baud_rates is None else baud_rates
+        usage = bandwidth.utilization(rates, *self.group_usage(), self.speed_frequencies(), *self.frame_format())
+        return float(usage[0]) if baud_rates is None else usage
+
+    def min_baud_rate(self, protocol=None, compact=None, fields=None):
+        """Lowest common baud rate carrying the variables within MAX_UTILIZATION, or None."""
+        protocol, compact, header_bytes = self.frame_format(protocol, compact, fields)
+        return bandwidth.min_baud_rate(*self.group_usage(), self.speed_frequencies(), protocol, self.MAX_UTILIZATION,
+                                       compact=compact, header_bytes=header_bytes)
+
+    def link_overload(self, protocol=None, compact=None, fields=None):
+        """Why the variables overrun the link beyond MAX_UTILIZATION, or None if they fit.
+
+        Applies the admission control of add_variable() to the whole database,
+        e.g. rows loaded from a file or the frames of the code generator, sent
+        in the frame format given by protocol, compact and fields.
+        """
+        usage = float(bandwidth.utilization([self.link_baud_rate], *self.group_usage(), self.speed_frequencies(),
+                                            *self.frame_format(protocol, compact, fields))[0])
+        if usage <= self.MAX_UTILIZATION:
+            return None
+        needed = self.min_baud_rate(protocol, compact, fields)
+        return (f"The variables would use {usage:.0%} of {self.link_baud_rate} baud "
+                f"(limit {self.MAX_UTILIZATION:.0%}), "
+                + (f"{needed} baud needed." if needed else "no common baud rate is fast enough."))
+
+    def frames(self, compact=False):
+        """(speed, variables) of every frame sent, see frame_groups()."""
+        return frame_groups(self.get_variables(), compact)
+
+    def get_variable(self, var_id):
+        """Variable with this ID, or None."""
+        return self.variables.get(var_id)
+
+    def get_variable_id(self, variable_name):
+        """ID of the variable with this name, or None."""
+        return self.names.get(variable_name)
 
     def get_variables(self):
-        return self.variables
+        """All variables ordered by ID."""
+        return [self.variables[var_id] for var_id in sorted(self.variables)]
+
+    def get_variable_types(self):
+        """Return the data type of each variable keyed by its ID."""
+        return {var_id: var.data_type for var_id, var in self.variables.items()}
+
+    def compile(self):
+        """Return the dense decoder tables of the database, rebuilt only after changes."""
+        if self.compiled is None:
+            self.compiled = compile_decoders(self.get_variables())
+        return self.compiled
+
+    def __getstate__(self):
+        """Pickle without the compiled decoders (struct objects), e.g. for an acquisition worker process."""
+        state = self.__dict__.copy()
+        state['compiled'] = None
+        return state
 
     def save_variables(self):
         with open(self.filename, mode='w', newline='') as file:
             writer = csv.writer(file)
-            writer.writerow(['id', 'baud_rate', 'type'])  # Header row
-            for var in self.variables:
-                writer.writerow(var)
+            writer.writerow(['var_id', 'name', 'speed', 'baud_rate', 'type', 'scale', 'offset', 'delta'])  # Header row
+            for var in self.get_variables():
+                writer.writerow([var.var_id, var.name, var.speed, var.baud_rate, var.data_type,
+                                 var.scale, var.offset, int(var.delta)])
 
     def load_variables(self):
         if os.path.exists(self.filename):
             with open(self.filename, mode='r') as file:
                 reader = csv.DictReader(file)
+                # Older files have no ID column, name the variable 'id' and number them by position
+                numbered = 'var_id' in (reader.fieldnames or [])
                 for row in reader:
-                    variable_name = row['id']
-                    baud_rate = int(row['baud_rate'])
-                    data_type = row['type']
-                    self.variables.append((variable_name, baud_rate, data_type))
+                    try:
+                        variable_name = row['name'] if numbered else row['id']
+                        baud_rate = int(row['baud_rate'])
+                        data_type = row['type']
+                        var_id = int(row['var_id']) if numbered else len(self.variables)
+                        speed = row.get('speed') or self.speed_of(baud_rate)
+                        scale = float(row.get('scale') or 1.0)
+                        offset = float(row.get('offset') or 0.0)
+                        delta = bool(int(row.get('delta') or 0))
+                    except (KeyError, ValueError) as e:
+                        print(f"Invalid variable row {reader.line_num}: {e}")
+                        continue
+                    self.insert(variable_name, baud_rate, data_type, var_id, speed, scale, offset, delta)
+            overload = self.link_overload()
+            if overload is not None:
+                print(f"{self.filename}: {overload}")
+
+    def speed_of(self, baud_rate):
+        """First speed group name using this baud rate, for files without a speed column."""
+        return next((name for name, rate in self.BAUD_RATES.items() if rate == baud_rate), None)
 
     # Additional methods to handle database operations can be added here.
+
+def frame_payload_size(variables, compact=False):
+    """Payload bytes of a frame carrying every variable (a keyframe for compact frames)."""
+    values = sum(var.size for var in variables)
+    if compact:
+        return COMPACT_HEADER_SIZE + ceil(len(variables) / 8) + values
+    return values + bandwidth.VARIABLE_OVERHEAD * len(variables)
+
+def frame_groups(variables, compact=False):
+    """Split the variables into the frames sent for each speed group, fastest group first.
+
+    Returns (speed, variables) pairs with the variables ordered by ID, every
+    frame holding at most MAX_PAYLOAD_SIZE payload bytes with the optional
+    fields. Variables of unknown speed groups go with the slowest one. The
+    index of a compact frame in this list is its frame number.
+    """
+    speeds = list(Database.SPEED_PERIODS)
+    groups = {speed: [] for speed in speeds}
+    for var in sorted(variables, key=attrgetter('var_id')):
+        groups[var.speed if var.speed in groups else speeds[-1]].append(var)
+    frames = []
+    for speed, members in groups.items():
+        frame = []
+        for var in members:
+            if frame and frame_payload_size(frame + [var], compact) > bandwidth.MAX_PAYLOAD_SIZE - FIELDS_SIZE:
+                frames.append((speed, tuple(frame)))
+                frame = []
+            frame.append(var)
+        if frame:
+            frames.append((speed, tuple(frame)))
+    return frames
+
+def compile_decoders(variables):
+    """Build dense decoder tables covering every one-byte variable ID.
+
+    IDs missing from variables decode as DEFAULT_TYPE. Variables of the same
+    type share one struct.Struct.
+    """
+    structs = {data_type: struct.Struct(fmt) for data_type, fmt in Database.TYPE_FORMATS.items()}
+    decoders = [structs[DEFAULT_TYPE]] * TABLE_SIZE
+    type_names = [DEFAULT_TYPE] * TABLE_SIZE
+    scales = [None] * TABLE_SIZE
+    offsets = [0.0] * TABLE_SIZE
+    for var in variables:
+        decoders[var.var_id] = structs.get(var.data_type, structs[DEFAULT_TYPE])
+        type_names[var.var_id] = var.data_type
+        if var.scale != 1.0 or var.offset != 0.0:
+            scales[var.var_id] = var.scale
+            offsets[var.var_id] = var.offset
+    frames = [members for _, members in frame_groups(variables, compact=True)]
+    return DecoderTable(decoders, type_names, scales, offsets, frames)
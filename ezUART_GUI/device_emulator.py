@@ -0,0 +1,183 @@
+"""Emulated ezUART device on a pseudo-terminal, to try the PC side without hardware.
+
+The emulator sends telemetry of the database variables and answers the
+commands of the generated firmware, baud rate changes and their trial
+included. Both ends only understand each other while the rate the PC set
+on the pseudo-terminal matches the emulated UART rate, and rates above
+--reliable-baud flip bits at the --noise rate per byte, so baud
+negotiation runs into the same failures as on a real link:
+
+    python device_emulator.py --database ../ezUART/variables.csv --reliable-baud 921600
+    python capture.py /dev/pts/N --database ../ezUART/variables.csv --negotiate STM32
+"""
+import argparse
+import os
+import random
+import re
+import select
+import termios
+import time
+from database import Database
+from serial_interface import SerialInterface, SOF, EOF, PROTOCOL_VERSIONS, DEFAULT_PROTOCOL
+from command_channel import (COMMAND_SET, COMMAND_READ, COMMAND_PING, COMMAND_BAUD, COMMAND_TEST, REPLY_FLAG,
+                             STATUS_OK, STATUS_UNKNOWN_ID, STATUS_BAD_REQUEST, BAUD_TRIAL_TIME)
+from hardware_config import HardwareConfig, DEFAULT_HARDWARE
+from replay import PtyPort, MAX_VALUES_PER_FRAME
+from capture import parse_baud_rate
+
+TELEMETRY_RATE = 100  # Default frames sent per second
+NOISE = 0.01  # Default probability of a bit flip per byte above the reliable rate
+READ_SIZE = 4096
+
+# termios speed constant -> baud rate, rates set through BOTHER are not visible and always match
+TERMIOS_RATES = {getattr(termios, name): int(name[1:]) for name in dir(termios) if re.fullmatch(r'B\d+', name)}
+
+class EmulatedDevice:
+    def __init__(self, database, protocol=DEFAULT_PROTOCOL, baud_rate=None, hardware=DEFAULT_HARDWARE,
+                 reliable_baud_rate=None, noise=NOISE, telemetry_rate=TELEMETRY_RATE, seed=None):
+        self.port = PtyPort()
+        self.interface = SerialInterface(protocol)  # Parses commands and encodes frames
+        self.interface.load_database(database)
+        self.interface.on_command_reply = self.handle_command
+        self.values = {var.var_id: 0.0 for var in database.get_variables()}  # Sent as telemetry, set by the PC
+        self.baud_rate = baud_rate or HardwareConfig().safe_baud_rate(hardware)
+        self.confirmed = self.baud_rate  # Rate to go back to when a trial expires
+        self.trial_end = None  # Monotonic time the rate on trial is abandoned at
+        self.max_baud_rate = HardwareConfig().max_baud_rate(hardware)
+        self.reliable_baud_rate = reliable_baud_rate or self.max_baud_rate
+        self.noise = noise
+        self.telemetry_rate = telemetry_rate
+        self.random = random.Random(seed)
+        self.sequence = 0
+        self.commands = 0
+        self.running = False
+
+    @property
+    def name(self):
+        return self.port.name
+
+    def host_baud_rate(self):
+        """Rate the PC set on the pseudo-terminal, None when it cannot be told."""
+        return TERMIOS_RATES.get(termios.tcgetattr(self.port.master)[5])
+
+    def line(self, data):
+        """data as it crosses the emulated line in either direction."""
+        host = self.host_baud_rate()
+        if host is not None and host != self.baud_rate:
+            return bytes(self.random.getrandbits(8) for _ in data)  # Framing errors all over
+        if self.baud_rate <= self.reliable_baud_rate or not self.noise:
+            return data
+        data = bytearray(data)
+        for i in range(len(data)):
+            if self.random.random() < self.noise:
+                data[i] ^= 1 << self.random.randrange(8)
+        return bytes(data)
+
+    def send(self, frame):
+        self.port.inject(self.line(self.interface.wrap_frame(frame)))
+
+    def handle_command(self, frame):
+        """Answer a command frame like the generated firmware."""
+        payload = frame[2:-1]
+        if len(payload) < 3 or payload[1] & REPLY_FLAG:
+            return
+        self.commands += 1
+        opcode = payload[1]
+        status = STATUS_OK
+        data = b""
+        switch_to = None
+        if opcode in (COMMAND_SET, COMMAND_READ):
+            var_id = payload[3] if len(payload) > 3 else None
+            decoder = self.interface.decoders[var_id] if var_id in self.values else None
+            if decoder is None:
+                status = STATUS_UNKNOWN_ID
+            elif opcode == COMMAND_SET and len(payload) == 4 + decoder.size:
+                self.values[var_id] = self.interface.scaled(var_id, decoder.unpack_from(payload, 4)[0])
+            elif opcode == COMMAND_READ and len(payload) == 4:
+                data = bytes((var_id,)) + decoder.pack(self.interface.raw_value(var_id, self.values[var_id]))
+            else:
+                status = STATUS_BAD_REQUEST
+        elif opcode == COMMAND_BAUD:
+            rate = int.from_bytes(payload[3:7], 'little') if len(payload) == 7 else 0
+            if not 0 < rate <= self.max_baud_rate:
+                status = STATUS_BAD_REQUEST
+            elif rate == self.baud_rate:
+                self.confirmed = rate
+                self.trial_end = None
+                print(f"Confirmed {rate} baud")
+            elif self.trial_end is not None:
+                status = STATUS_BAD_REQUEST
+            else:
+                switch_to = rate
+        elif opcode == COMMAND_TEST:
+            data = bytes(payload[3:])
+        elif opcode != COMMAND_PING:
+            status = STATUS_BAD_REQUEST
+        reply = bytes((payload[0], opcode | REPLY_FLAG, payload[2], status)) + data
+        self.send(SOF + bytes((len(reply),)) + reply + EOF)
+        if switch_to is not None:
+            self.switch(switch_to)
+
+    def switch(self, baud_rate):
+        self.baud_rate = baud_rate
+        self.trial_end = time.monotonic() + BAUD_TRIAL_TIME if baud_rate != self.confirmed else None
+        print(f"Switched to {baud_rate} baud" + (" on trial" if self.trial_end is not None else ""))
+
+    def send_telemetry(self):
+        values = list(self.values.items())
+        for i in range(0, max(len(values), 1), MAX_VALUES_PER_FRAME):
+            self.send(self.interface.encode_frame(values[i:i + MAX_VALUES_PER_FRAME], sequence=self.sequence))
+            self.sequence += 1
+
+    def run(self, duration=None):
+        """Serve the pseudo-terminal until stop(), duration elapses or Ctrl+C."""
+        self.running = True
+        started = next_frame = time.monotonic()
+        try:
+            while self.running:
+                now = time.monotonic()
+                if duration is not None and now - started >= duration:
+                    break
+                readable, _, _ = select.select([self.port.master], [], [], max(next_frame - now, 0.0))
+                if readable:
+                    self.interface.feed(self.line(os.read(self.port.master, READ_SIZE)))
+                now = time.monotonic()
+                if self.trial_end is not None and now >= self.trial_end:
+                    print(f"{self.baud_rate} baud not confirmed")
+                    self.switch(self.confirmed)
+                if now >= next_frame:
+                    self.send_telemetry()
+                    next_frame += 1.0 / self.telemetry_rate
+        except KeyboardInterrupt:
+            pass
+        self.running = False
+
+    def stop(self):
+        self.running = False
+
+def main():
+    hardware = sorted(HardwareConfig().get_supported_hardware())
+    parser = argparse.ArgumentParser(description="Emulate an ezUART device on a pseudo-terminal.")
+    parser.add_argument('--database', default='variables.csv', help="Variable database file")
+    parser.add_argument('--protocol', type=int, choices=PROTOCOL_VERSIONS, default=DEFAULT_PROTOCOL,
+                        help="Wire protocol version")
+    parser.add_argument('--hardware', choices=hardware, default=DEFAULT_HARDWARE, help="Emulated hardware")
+    parser.add_argument('--baud', type=parse_baud_rate, help="Initial baud rate, the hardware's safe rate by default")
+    parser.add_argument('--reliable-baud', type=int, help="Fastest rate without bit errors, the hardware limit by default")
+    parser.add_argument('--noise', type=float, default=NOISE, help="Bit flips per byte above the reliable rate")
+    parser.add_argument('--telemetry-rate', type=float, default=TELEMETRY_RATE, help="Telemetry frames per second")
+    parser.add_argument('--duration', type=float, help="Stop after this many seconds")
+    parser.add_argument('--seed', type=int, help="Seed of the noise")
+    args = parser.parse_args()
+
+    device = EmulatedDevice(Database(args.database), args.protocol, args.baud, args.hardware, args.reliable_baud,
+                            args.noise, args.telemetry_rate, args.seed)
+    print(f"Emulating {args.hardware} at {device.baud_rate} baud on {device.name} (Ctrl+C to stop)", flush=True)
+    try:
+        device.run(args.duration)
+    finally:
+        device.port.close()
+    print(f"Answered {device.commands} commands")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""Export decoded samples to CSV, Parquet or HDF5 without stalling acquisition.
+
+SampleExporter takes sample batches from the reader thread and writes them
+from its own thread in chunks of chunk_size rows: a row group per chunk in
+Parquet, a resize of the per-column datasets in HDF5. At most max_pending
+samples wait for the writer; beyond that add_samples() refuses batches and
+counts them as dropped instead of blocking the reader, and backlog()
+tells how close the exporter is to that point.
+
+export_recording() writes a time range of a recording block by block, so
+only one chunk is in memory whatever the size of the recording:
+
+    python export.py run.ezrec run.parquet --start 10 --end 20
+
+Parquet needs pyarrow and HDF5 needs h5py, CSV is always available. Both
+are only imported once a file of their format is opened, so capture.py
+starts without loading them.
+"""
+import argparse
+import csv
+import os
+import threading
+from importlib.util import find_spec
+import numpy as np
+from recording import Recording, SAMPLE_DTYPE, SAMPLES
+from serial_interface import SerialInterface
+
+CHUNK_SIZE = 65536  # Default rows written at once
+MAX_PENDING = 200000  # Default samples waiting for the writer before batches are dropped
+CSV_HEADER = ['id', 'value', 'timestamp', 'source']  # Same as capture.py always wrote
+CSV_ROWS_PER_CALL = 2048  # writerows() holds the GIL throughout, keep each call short for the reader
+
+class CsvWriter:
+    def __init__(self, filename):
+        self.file = open(filename, mode='w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(CSV_HEADER)
+
+    def write(self, records):
+        for start in range(0, len(records), CSV_ROWS_PER_CALL):
+            self.writer.writerows(records[start:start + CSV_ROWS_PER_CALL].tolist())
+
+    def close(self):
+        self.file.close()
+
+class ParquetWriter:
+    def __init__(self, filename):
+        import pyarrow  # Optional, Parquet export
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([(name, pyarrow.from_numpy_dtype(SAMPLE_DTYPE[name]))
+                                      for name in SAMPLE_DTYPE.names])
+        self.writer = pyarrow.parquet.ParquetWriter(filename, self.schema)
+
+    def write(self, records):
+        """Write records as one row group."""
+        columns = [self.pyarrow.array(np.ascontiguousarray(records[name])) for name in SAMPLE_DTYPE.names]
+        self.writer.write_table(self.pyarrow.Table.from_arrays(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+class Hdf5Writer:
+    """One chunked, growing dataset per column."""
+
+    def __init__(self, filename, chunk_size=CHUNK_SIZE):
+        import h5py  # Optional, HDF5 export
+        self.file = h5py.File(filename, mode='w')
+        self.datasets = {name: self.file.create_dataset(name, shape=(0,), maxshape=(None,),
+                                                        dtype=SAMPLE_DTYPE[name], chunks=(chunk_size,))
+                         for name in SAMPLE_DTYPE.names}
+        self.rows = 0
+
+    def write(self, records):
+        rows = self.rows + len(records)
+        for name, dataset in self.datasets.items():
+            dataset.resize((rows,))
+            dataset[self.rows:] = records[name]
+        self.rows = rows
+
+    def close(self):
+        self.file.close()
+
+# Extension -> (description, writer, library it needs or None)
+FORMATS = {
+    '.csv': ("CSV Files", CsvWriter, None),
+    '.parquet': ("Parquet Files", ParquetWriter, 'pyarrow'),
+    '.h5': ("HDF5 Files", Hdf5Writer, 'h5py'),
+    '.hdf5': ("HDF5 Files", Hdf5Writer, 'h5py'),
+}
+
+def installed(library):
+    """True if library can be imported, without importing it."""
+    return library is None or find_spec(library) is not None
+
+def export_formats():
+    """{extension: description} of the formats that can be written with the installed libraries."""
+    return {extension: description for extension, (description, _, library) in FORMATS.items() if installed(library)}
+
+def open_writer(filename):
+    """Writer for the format of the filename extension."""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Unknown export format: {extension or filename}")
+    description, writer, library = FORMATS[extension]
+    if not installed(library):
+        raise ValueError(f"{description} need {library}, export to CSV instead")
+    return writer(filename)
+
+def sample_records(records):
+    """Records of any recording version as SAMPLE_DTYPE, version 1 samples come from source 0."""
+    if records.dtype == SAMPLE_DTYPE:
+        return records
+    converted = np.zeros(len(records), dtype=SAMPLE_DTYPE)
+    for name in records.dtype.names:
+        converted[name] = records[name]
+    return converted
+
+class SampleExporter:
+    """Write decoded sample batches to a file from a background thread."""
+
+    def __init__(self, filename, chunk_size=CHUNK_SIZE, max_pending=MAX_PENDING):
+        self.filename = filename
+        self.writer = open_writer(filename)
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending
+        self.condition = threading.Condition()
+        self.pending = []  # Samples handed over by add_samples()
+        self.closing = False
+        self.written = 0  # Samples written to the file
+        self.dropped = 0  # Samples refused because the writer fell behind
+        self.error = None  # Exception that stopped the writer
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_samples(self, samples):
+        """Queue a list of decoded Samples without blocking, returns False if it was dropped."""
+        with self.condition:
+            if self.error is not None or self.closing or len(self.pending) + len(samples) > self.max_pending:
+                self.dropped += len(samples)
+                return False
+            self.pending += samples
+            self.condition.notify()
+            return True
+
+    def backlog(self):
+        """Fraction of max_pending in use, batches get dropped once it reaches 1."""
+        return len(self.pending) / self.max_pending
+
+    def run(self):
+        chunks = []  # Converted records not written yet, less than chunk_size rows
+        buffered = 0
+        try:
+            while True:
+                with self.condition:
+                    while not self.pending and not self.closing:
+                        self.condition.wait()
+                    samples, self.pending = self.pending, []
+                    closing = self.closing
+                if samples:
+                    chunks.append(np.array(samples, dtype=SAMPLE_DTYPE))
+                    buffered += len(samples)
+                if buffered >= self.chunk_size or (closing and buffered):
+                    records = np.concatenate(chunks)
+                    full = len(records) if closing else len(records) - len(records) % self.chunk_size
+                    for start in range(0, full, self.chunk_size):
+                        chunk = records[start:min(start + self.chunk_size, full)]
+                        self.writer.write(chunk)
+                        self.written += len(chunk)
+                    chunks = [records[full:]]
+                    buffered = len(records) - full
+                if closing and not self.pending:
+                    break
+        except Exception as e:  # Disk full, file removed, ...
+            self.error = e
+        finally:
+            self.writer.close()
+
+    def close(self):
+        """Write what is still queued and close the file."""
+        with self.condition:
+            self.closing = True
+            self.condition.notify()
+        self.thread.join()
+
+    def summary(self):
+        text = f"{self.written} samples exported, backlog {self.backlog():.0%}"
+        if self.dropped:
+            text += f", {self.dropped} dropped"
+        if self.error is not None:
+            text += f", failed: {self.error}"
+        return text
+
+def export_recording(recording, filename, start=None, end=None, chunk_size=CHUNK_SIZE):
+    """Write the samples of recording in [start, end] to filename, returns the number written.
+
+    Recordings of raw frames only are decoded with the schema they were recorded with.
+    """
+    writer = open_writer(filename)
+    written = 0
+    chunks = []
+    buffered = 0
+
+    def flush():
+        nonlocal written, chunks, buffered
+        if buffered:
+            records = np.concatenate(chunks)
+            writer.write(records)
+            written += len(records)
+            chunks = []
+            buffered = 0
+
+    try:
+        if len(recording.blocks(SAMPLES)):
+            for records in recording.sample_blocks(start, end):
+                chunks.append(sample_records(records).copy())  # Releases the memory-mapped block
+                buffered += len(records)
+                if buffered >= chunk_size:
+                    flush()
+        else:
+            decoder = SerialInterface()
+            decoder.load_database(recording)
+            samples = []
+            for timestamp, frame in recording.frames(start, end):
+                samples += decoder.decode_frame(frame, timestamp)
+                if len(samples) >= chunk_size:
+                    writer.write(np.array(samples, dtype=SAMPLE_DTYPE))
+                    written += len(samples)
+                    samples = []
+            if samples:
+                writer.write(np.array(samples, dtype=SAMPLE_DTYPE))
+                written += len(samples)
+        flush()
+    finally:
+        writer.close()
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a time range of an ezUART recording.")
+    parser.add_argument('recording', help="Recording file (.ezrec)")
+    parser.add_argument('output', help=f"Output file ({', '.join(export_formats())})")
+    parser.add_argument('--start', type=float, help="Seconds from the start of the recording")
+    parser.add_argument('--end', type=float, help="Seconds from the start of the recording")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Rows written at once")
+    args = parser.parse_args()
+
+    try:
+        with Recording(args.recording) as recording:
+            time_range = recording.time_range()
+            first = time_range[0] if time_range else 0.0
+            start = None if args.start is None else first + args.start
+            end = None if args.end is None else first + args.end
+            written = export_recording(recording, args.output, start, end, args.chunk_size)
+    except ValueError as e:  # Unknown format, library missing or not a recording
+        parser.error(str(e))
+    print(f"Wrote {written} samples to {args.output}")
+
+if __name__ == '__main__':
+    main()
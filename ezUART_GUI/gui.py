@@ -1,23 +1,63 @@
 from PyQt5 import QtWidgets, QtCore, QtGui
-from PyQt5.QtCore import pyqtSignal
 import pyqtgraph as pg
 import qdarktheme  # Import the theme
-from serial_interface import SerialInterface
+from serial_interface import SerialInterface, PROTOCOL_VERSIONS, DEFAULT_PROTOCOL
 from database import Database
+from sample_queue import SampleQueue
+from sample_store import SampleStore
+from plot_decimation import decimate_minmax
+from recording import Recording, RecordingWriter
+from export import SampleExporter, export_recording, export_formats
+from process_acquisition import ProcessAcquisition
+from replay import FakeSerialPort, Replayer
+from async_serial import AsyncSerialInterface
+from multi_port import MultiPortSession
+from bandwidth import COMMON_BAUD_RATES, BITS_PER_BYTE
+from command_channel import CommandChannel
+from baud_negotiation import BaudNegotiator
+from hardware_config import HardwareConfig, DEFAULT_HARDWARE
+from profiling import profiler
+from codegen import load_layout
 import threading
+import time
 import struct
 
+DELIVERY_INTERVAL_MS = 50  # Default GUI tick picking up received samples
+MAX_BATCH_SIZE = 5000  # Default maximum samples handed to the GUI per tick
+MAX_CONSOLE_LINES = 5000  # Lines kept in the serial console
+MAX_CONSOLE_LINES_PER_UPDATE = 500  # Lines appended per tick, newer ones win on overload
+PLOT_HISTORY_DEPTH = 100000  # Default samples kept per variable for plotting
+PLOT_INTERVAL_MS = 100  # Plot refresh interval without level of detail rendering
+MIN_PLOT_INTERVAL_MS = 30  # Adaptive plot refresh bounds
+MAX_PLOT_INTERVAL_MS = 1000
+PLOT_RENDER_BUDGET = 0.25  # Fraction of the plot interval that rendering may take
+SLIDER_RESOLUTION = 100  # Command slider steps per unit of the value
+
 class ezUARTApp(QtWidgets.QMainWindow):
-    data_received_signal = pyqtSignal(str)  # Signal to emit received decoded data
+    command_result = QtCore.pyqtSignal(str)  # Command outcomes, emitted from the channel threads
+    baud_negotiated = QtCore.pyqtSignal(str)  # Status line once baud negotiation is over
+    export_finished = QtCore.pyqtSignal(str)  # Status line once a recording export is over
+    acquisition_status = QtCore.pyqtSignal(str)  # Status lines of the acquisition worker process
 
-    def __init__(self):
+    def __init__(self, event_loop=None):
         super().__init__()
+        self.event_loop = event_loop  # asyncio loop running on Qt (qasync), if any
+        self.async_interface = None  # asyncio transport of the current connection
+        self.acquisition = None  # Worker process reading the main connection, if any
+        self.command_channel = None  # Commands to the MCU of the main connection
         self.setWindowTitle("ezUART - Serial Port GUI")
         self.setGeometry(100, 100, 1000, 600)
         qdarktheme.setup_theme()
 
-        # Connect the data_received_signal to the slot to update the GUI
-        self.data_received_signal.connect(self.update_serial_text_area)
+        # Samples travel from the reader thread to the GUI in batches, once per tick
+        self.sample_queue = SampleQueue(MAX_BATCH_SIZE)
+
+        # Recording and export of the received samples, fed from the reader thread,
+        # or from deliver_samples in timestamp order while additional ports are open
+        self.recorder = None
+        self.exporter = None  # Writes on its own thread, the reader only queues
+        self.recorder_lock = threading.Lock()
+        self.replayer = None  # Replays a recording through the receive pipeline
 
         # Main widget and layout
         main_widget = QtWidgets.QWidget()
@@ -29,22 +69,37 @@ class ezUARTApp(QtWidgets.QMainWindow):
         self.tabs = QtWidgets.QTabWidget()
         layout.addWidget(self.tabs)
 
-        # Serial Interface and Database Editor tabs
+        # Serial Interface, Database Editor and Profiler tabs
         self.serial_tab = QtWidgets.QWidget()
         self.database_tab = QtWidgets.QWidget()
+        self.profiler_tab = QtWidgets.QWidget()
         self.tabs.addTab(self.serial_tab, "Serial Interface")
         self.tabs.addTab(self.database_tab, "Database Editor")
-
-        # Initialize Serial Interface
-        self.serial_interface = SerialInterface()
-        self.init_serial_interface()
+        self.tabs.addTab(self.profiler_tab, "Profiler")
 
         # Initialize Database Editor
         self.database = Database()
 
+        # Initialize Serial Interface, additional ports are read by the multi-port session
+        self.serial_interface = SerialInterface()
+        self.serial_interface.load_database(self.database)
+        self.multi_port = MultiPortSession(self.database)
+        self.init_serial_interface()
+        self.init_database_editor()
+        self.init_profiler()
+
         # Plotting related data
-        self.plot_data_id1 = [0] * 100  # Store data for ID 1
-        self.plot_data_id2 = [0] * 100  # Store data for ID 2
+        self.sample_store = SampleStore([(0, var_id) for var_id in self.database.get_variable_types()],
+                                        PLOT_HISTORY_DEPTH)
+        self.curves = {}  # (source, variable ID) -> plot curve
+        self.curve_states = {}  # (source, variable ID) -> (buffer version, view range, columns) last drawn
+        self.render_time = 0.0  # Smoothed plot update cost in seconds
+
+        # Console state
+        self.console_counter = 0  # Samples seen by the console, keeps every-Nth decimation in phase
+        self.console_dropped = 0  # Lines dropped because a tick brought too many
+
+        self.link_update_time = time.monotonic()  # Last link health refresh
 
     def init_serial_interface(self):
         serial_layout = QtWidgets.QVBoxLayout(self.serial_tab)
@@ -56,22 +111,192 @@ class ezUARTApp(QtWidgets.QMainWindow):
 
         self.port_combobox = QtWidgets.QComboBox()
         self.port_combobox.addItems(self.serial_interface.list_ports())
+        self.port_combobox.setEditable(True)  # Allows any path, e.g. a replay pseudo-terminal
         self.baud_combobox = QtWidgets.QComboBox()
         self.baud_combobox.addItems(["slow", "fast", "very fast"])  # Updated baud rate options
 
         port_layout.addRow("Select Port:", self.port_combobox)
         port_layout.addRow("Baud Rate:", self.baud_combobox)
 
+        self.protocol_combobox = QtWidgets.QComboBox()
+        self.protocol_combobox.addItems([str(version) for version in PROTOCOL_VERSIONS])
+        self.protocol_combobox.setCurrentText(str(DEFAULT_PROTOCOL))
+        port_layout.addRow("Protocol Version:", self.protocol_combobox)
+
+        # Step up from the selected baud rate to the fastest one the link carries reliably
+        self.hardware_config = HardwareConfig()
+        self.negotiate_checkbox = QtWidgets.QCheckBox("Negotiate baud rate")
+        self.hardware_combobox = QtWidgets.QComboBox()
+        self.hardware_combobox.addItems(sorted(self.hardware_config.get_supported_hardware()))
+        self.hardware_combobox.setCurrentText(DEFAULT_HARDWARE)
+        self.adapter_combobox = QtWidgets.QComboBox()
+        self.adapter_combobox.addItem("Any adapter", None)
+        for adapter in sorted(self.hardware_config.adapters):
+            self.adapter_combobox.addItem(adapter, adapter)
+        negotiate_layout = QtWidgets.QHBoxLayout()
+        negotiate_layout.addWidget(self.hardware_combobox)
+        negotiate_layout.addWidget(self.adapter_combobox)
+        port_layout.addRow(self.negotiate_checkbox, negotiate_layout)
+
+        # Read on the asyncio loop instead of a thread, needs qasync
+        self.asyncio_checkbox = QtWidgets.QCheckBox("asyncio transport")
+        self.asyncio_checkbox.setEnabled(self.event_loop is not None)
+        self.asyncio_checkbox.setChecked(self.event_loop is not None)
+        port_layout.addRow(self.asyncio_checkbox)
+
+        # Read and decode in a worker process, plotting can then never hold up the port
+        self.process_checkbox = QtWidgets.QCheckBox("Acquire in a worker process")
+        port_layout.addRow(self.process_checkbox)
+
+        # Delivery settings
+        self.delivery_interval_spinbox = QtWidgets.QSpinBox()
+        self.delivery_interval_spinbox.setRange(10, 1000)
+        self.delivery_interval_spinbox.setSuffix(" ms")
+        self.delivery_interval_spinbox.setValue(DELIVERY_INTERVAL_MS)
+        self.delivery_interval_spinbox.valueChanged.connect(self.update_delivery_settings)
+        self.batch_size_spinbox = QtWidgets.QSpinBox()
+        self.batch_size_spinbox.setRange(100, 1000000)
+        self.batch_size_spinbox.setSingleStep(1000)
+        self.batch_size_spinbox.setValue(MAX_BATCH_SIZE)
+        self.batch_size_spinbox.valueChanged.connect(self.update_delivery_settings)
+        self.queue_label = QtWidgets.QLabel("0 samples")
+
+        port_layout.addRow("GUI Update Interval:", self.delivery_interval_spinbox)
+        port_layout.addRow("Max Samples per Update:", self.batch_size_spinbox)
+        port_layout.addRow("Queued:", self.queue_label)
+
+        self.history_spinbox = QtWidgets.QSpinBox()
+        self.history_spinbox.setRange(100, 10000000)
+        self.history_spinbox.setSingleStep(10000)
+        self.history_spinbox.setValue(PLOT_HISTORY_DEPTH)
+        self.history_spinbox.editingFinished.connect(self.update_plot_history)
+        port_layout.addRow("Plot History (samples):", self.history_spinbox)
+
+        self.lod_checkbox = QtWidgets.QCheckBox("Level of detail rendering")
+        self.lod_checkbox.setChecked(True)
+        self.lod_checkbox.toggled.connect(self.update_plot_mode)
+        self.plot_interval_label = QtWidgets.QLabel(f"{PLOT_INTERVAL_MS} ms")
+        port_layout.addRow(self.lod_checkbox, self.plot_interval_label)
+
+        # Link health, refreshed once per second from the SerialInterface statistics
+        health_frame = QtWidgets.QGroupBox("Link Health")
+        serial_layout.addWidget(health_frame)
+        health_layout = QtWidgets.QGridLayout(health_frame)
+        self.link_health_labels = {}
+        for index, (key, title) in enumerate([
+                ('usage', "Link Usage:"), ('frames', "Frames:"), ('errors', "CRC / Format Errors:"),
+                ('sequence', "Sequence Gaps:"), ('resync', "Resync Bytes:"), ('queue', "Queue Depth:"),
+                ('decode', "Decode Time:"), ('lag', "Lag / Last Frame:")]):
+            label = QtWidgets.QLabel("-")
+            self.link_health_labels[key] = label
+            row, column = divmod(index, 2)
+            health_layout.addWidget(QtWidgets.QLabel(title), row, 2 * column)
+            health_layout.addWidget(label, row, 2 * column + 1)
+        self.export_stats_button = QtWidgets.QPushButton("Export Link Stats...")
+        self.export_stats_button.clicked.connect(self.export_link_stats)
+        health_layout.addWidget(self.export_stats_button, 4, 0, 1, 4)
+
+        # Commands to the MCU, the slider sends every move and the channel coalesces them
+        command_frame = QtWidgets.QGroupBox("Commands")
+        serial_layout.addWidget(command_frame)
+        command_layout = QtWidgets.QGridLayout(command_frame)
+        self.command_variable_combobox = QtWidgets.QComboBox()
+        self.command_value_spinbox = QtWidgets.QDoubleSpinBox()
+        self.command_value_spinbox.setRange(-1e9, 1e9)
+        self.command_value_spinbox.setDecimals(3)
+        self.command_value_spinbox.setKeyboardTracking(False)
+        self.command_value_spinbox.valueChanged.connect(self.set_command_value)
+        self.command_slider = QtWidgets.QSlider(QtCore.Qt.Horizontal)
+        self.command_slider.setRange(-100 * SLIDER_RESOLUTION, 100 * SLIDER_RESOLUTION)
+        self.command_slider.valueChanged.connect(
+            lambda position: self.command_value_spinbox.setValue(position / SLIDER_RESOLUTION))
+        self.read_variable_button = QtWidgets.QPushButton("Read")
+        self.read_variable_button.clicked.connect(self.read_command_variable)
+        self.ping_button = QtWidgets.QPushButton("Ping")
+        self.ping_button.clicked.connect(self.ping_mcu)
+        self.command_status_label = QtWidgets.QLabel("-")
+        command_layout.addWidget(QtWidgets.QLabel("Variable:"), 0, 0)
+        command_layout.addWidget(self.command_variable_combobox, 0, 1)
+        command_layout.addWidget(self.command_value_spinbox, 0, 2)
+        command_layout.addWidget(self.read_variable_button, 0, 3)
+        command_layout.addWidget(self.ping_button, 0, 4)
+        command_layout.addWidget(self.command_slider, 1, 0, 1, 5)
+        command_layout.addWidget(self.command_status_label, 2, 0, 1, 5)
+        self.command_result.connect(self.show_command_result)
+
         # Connect button
         self.connect_button = QtWidgets.QPushButton("Connect")
         self.connect_button.clicked.connect(self.connect_serial)
         serial_layout.addWidget(self.connect_button)
 
+        # Recording buttons
+        recording_layout = QtWidgets.QHBoxLayout()
+        serial_layout.addLayout(recording_layout)
+        self.record_button = QtWidgets.QPushButton("Record...")
+        self.record_button.setCheckable(True)
+        self.record_button.clicked.connect(self.toggle_recording)
+        self.open_recording_button = QtWidgets.QPushButton("Open Recording...")
+        self.open_recording_button.clicked.connect(self.open_recording)
+        recording_layout.addWidget(self.record_button)
+        self.replay_button = QtWidgets.QPushButton("Replay Recording...")
+        self.replay_button.clicked.connect(self.replay_recording)
+        recording_layout.addWidget(self.open_recording_button)
+        recording_layout.addWidget(self.replay_button)
+
+        # Export of the received samples, or of a time range of a recording, to CSV/Parquet/HDF5
+        export_layout = QtWidgets.QHBoxLayout()
+        serial_layout.addLayout(export_layout)
+        self.export_button = QtWidgets.QPushButton("Export...")
+        self.export_button.setCheckable(True)
+        self.export_button.clicked.connect(self.toggle_export)
+        self.export_recording_button = QtWidgets.QPushButton("Export Recording...")
+        self.export_recording_button.clicked.connect(self.export_recording_range)
+        self.export_label = QtWidgets.QLabel("")
+        export_layout.addWidget(self.export_button)
+        export_layout.addWidget(self.export_recording_button)
+        export_layout.addWidget(self.export_label)
+
+        # Additional ports, each read independently and merged by timestamp
+        ports_frame = QtWidgets.QGroupBox("Additional Ports")
+        serial_layout.addWidget(ports_frame)
+        ports_layout = QtWidgets.QHBoxLayout(ports_frame)
+        self.ports_list = QtWidgets.QListWidget()
+        self.ports_list.setMaximumHeight(80)
+        ports_buttons = QtWidgets.QVBoxLayout()
+        self.add_port_button = QtWidgets.QPushButton("Add Port")
+        self.add_port_button.clicked.connect(self.add_port)
+        self.close_port_button = QtWidgets.QPushButton("Close Port")
+        self.close_port_button.clicked.connect(self.close_port)
+        ports_buttons.addWidget(self.add_port_button)
+        ports_buttons.addWidget(self.close_port_button)
+        ports_layout.addWidget(self.ports_list)
+        ports_layout.addLayout(ports_buttons)
+
         # Serial data display
-        self.serial_text_area = QtWidgets.QTextEdit()
+        self.serial_text_area = QtWidgets.QPlainTextEdit()
         self.serial_text_area.setReadOnly(True)
+        self.serial_text_area.setUndoRedoEnabled(False)
+        self.serial_text_area.setMaximumBlockCount(MAX_CONSOLE_LINES)
         serial_layout.addWidget(self.serial_text_area)
 
+        # Console controls, decoded text is only built while the console is shown
+        console_layout = QtWidgets.QHBoxLayout()
+        serial_layout.addLayout(console_layout)
+        self.show_text_checkbox = QtWidgets.QCheckBox("Show decoded data")
+        self.show_text_checkbox.setChecked(True)
+        self.pause_console_button = QtWidgets.QPushButton("Pause")
+        self.pause_console_button.setCheckable(True)
+        self.console_step_spinbox = QtWidgets.QSpinBox()
+        self.console_step_spinbox.setRange(1, 100000)
+        self.console_step_spinbox.setPrefix("Show every ")
+        self.console_step_spinbox.setSuffix(" samples")
+        self.console_dropped_label = QtWidgets.QLabel("Dropped: 0")
+        console_layout.addWidget(self.show_text_checkbox)
+        console_layout.addWidget(self.pause_console_button)
+        console_layout.addWidget(self.console_step_spinbox)
+        console_layout.addWidget(self.console_dropped_label)
+        console_layout.addStretch()
+
         # Send data
         self.send_entry = QtWidgets.QLineEdit()
         self.send_button = QtWidgets.QPushButton("Send")
@@ -81,14 +306,16 @@ class ezUARTApp(QtWidgets.QMainWindow):
 
         # Status Bar
         self.status_bar = QtWidgets.QLabel("Status: Disconnected")
+        self.baud_negotiated.connect(self.status_bar.setText)
+        self.export_finished.connect(self.status_bar.setText)
+        self.acquisition_status.connect(self.status_bar.setText)
         serial_layout.addWidget(self.status_bar)
 
         # Plot widget for live data
         self.plot_widget = pg.GraphicsLayoutWidget()
         self.plot_widget.setBackground('black')
-        self.plot = self.plot_widget.addPlot(title="Real-Time Plot")
-        self.curve_id1 = self.plot.plot(pen='y')  # Yellow for ID 1
-        self.curve_id2 = self.plot.plot(pen='c')  # Cyan for ID 2
+        self.plot = self.plot_widget.addPlot(title="Real-Time Plot", axisItems={'bottom': pg.DateAxisItem()})
+        self.plot.addLegend()
         self.plot.showGrid(x=True, y=True)
         self.plot.setLabel('left', 'Value')
         self.plot.setLabel('bottom', 'Time')
@@ -97,10 +324,222 @@ class ezUARTApp(QtWidgets.QMainWindow):
         # Set up data for plotting
         self.plot_timer = QtCore.QTimer()
         self.plot_timer.timeout.connect(self.update_plot)
-        self.plot_timer.start(100)
+        self.plot_timer.start(PLOT_INTERVAL_MS)
+
+        # Pick up received samples once per tick
+        self.delivery_timer = QtCore.QTimer()
+        self.delivery_timer.timeout.connect(self.deliver_samples)
+        self.delivery_timer.start(DELIVERY_INTERVAL_MS)
+
+    def init_database_editor(self):
+        database_layout = QtWidgets.QVBoxLayout(self.database_tab)
+
+        # New variable, checked against the link budget by Database.add_variable
+        variable_frame = QtWidgets.QGroupBox("Add Variable")
+        database_layout.addWidget(variable_frame)
+        variable_layout = QtWidgets.QFormLayout(variable_frame)
+        self.variable_name_entry = QtWidgets.QLineEdit()
+        self.variable_speed_combobox = QtWidgets.QComboBox()
+        self.variable_speed_combobox.addItems(list(Database.BAUD_RATES))
+        self.variable_type_combobox = QtWidgets.QComboBox()
+        self.variable_type_combobox.addItems(list(Database.TYPE_FORMATS))
+        self.auto_place_checkbox = QtWidgets.QCheckBox("Move to a slower speed if the link is full")
+        self.add_variable_button = QtWidgets.QPushButton("Add")
+        self.add_variable_button.clicked.connect(self.add_variable)
+        variable_layout.addRow("Name:", self.variable_name_entry)
+        variable_layout.addRow("Speed:", self.variable_speed_combobox)
+        variable_layout.addRow("Type:", self.variable_type_combobox)
+        variable_layout.addRow(self.auto_place_checkbox, self.add_variable_button)
+
+        # Link budget of the database
+        link_frame = QtWidgets.QGroupBox("Link Budget")
+        database_layout.addWidget(link_frame)
+        link_layout = QtWidgets.QFormLayout(link_frame)
+        self.link_baud_combobox = QtWidgets.QComboBox()
+        self.link_baud_combobox.addItems([str(rate) for rate in COMMON_BAUD_RATES])
+        self.link_baud_combobox.setCurrentText(str(self.database.link_baud_rate))
+        self.link_baud_combobox.currentTextChanged.connect(self.update_link_budget)
+        self.run_rate_spinbox = QtWidgets.QSpinBox()
+        self.run_rate_spinbox.setRange(1, 100000)
+        self.run_rate_spinbox.setSuffix(" Hz")
+        self.run_rate_spinbox.setValue(self.database.run_rate)
+        self.run_rate_spinbox.valueChanged.connect(self.update_link_budget)
+        self.headroom_bar = QtWidgets.QProgressBar()
+        self.headroom_bar.setFormat("%p% used")
+        self.headroom_label = QtWidgets.QLabel()
+        link_layout.addRow("Baud Rate:", self.link_baud_combobox)
+        link_layout.addRow("run_ezUART() Rate:", self.run_rate_spinbox)
+        link_layout.addRow(self.headroom_bar)
+        link_layout.addRow(self.headroom_label)
+
+        self.variables_table = QtWidgets.QTableWidget(0, 4)
+        self.variables_table.setHorizontalHeaderLabels(["ID", "Name", "Speed", "Type"])
+        self.variables_table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        database_layout.addWidget(self.variables_table)
+
+        self.save_database_button = QtWidgets.QPushButton("Save Database")
+        self.save_database_button.clicked.connect(self.database.save_variables)
+        database_layout.addWidget(self.save_database_button)
+        self.load_layout_button = QtWidgets.QPushButton("Load Firmware Layout...")
+        self.load_layout_button.clicked.connect(self.load_firmware_layout)
+        database_layout.addWidget(self.load_layout_button)
+
+        self.update_variables_table()
+        self.update_command_variables()
+        self.update_headroom()
+
+    def init_profiler(self):
+        """Per-stage latencies of the data path, refreshed with the link health while profiling."""
+        profiler_layout = QtWidgets.QVBoxLayout(self.profiler_tab)
+        controls_layout = QtWidgets.QHBoxLayout()
+        profiler_layout.addLayout(controls_layout)
+        self.profile_checkbox = QtWidgets.QCheckBox("Enable profiling")
+        self.profile_checkbox.setChecked(profiler.enabled)  # Already on with --profile
+        self.profile_checkbox.toggled.connect(self.toggle_profiling)
+        controls_layout.addWidget(self.profile_checkbox)
+        self.reset_profile_button = QtWidgets.QPushButton("Reset")
+        self.reset_profile_button.clicked.connect(self.reset_profile)
+        controls_layout.addWidget(self.reset_profile_button)
+        controls_layout.addStretch()
+
+        self.profile_table = QtWidgets.QTableWidget(0, 8)
+        self.profile_table.setHorizontalHeaderLabels(
+            ["Stage", "Count", "Mean (µs)", "p50 (µs)", "p90 (µs)", "p99 (µs)", "Max (µs)", "Busy"])
+        self.profile_table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        profiler_layout.addWidget(self.profile_table)
+        self.update_profile_table()
+
+    def toggle_profiling(self, enabled):
+        if enabled:
+            profiler.enable()
+        else:
+            profiler.disable()
+        self.update_profile_table()
+
+    def reset_profile(self):
+        profiler.reset()
+        self.update_profile_table()
+
+    def update_profile_table(self):
+        rows = profiler.rows()
+        self.profile_table.setRowCount(len(rows))
+        for row, profile in enumerate(rows):
+            busy = "-" if profile.busy is None else f"{profile.busy:.1%}"
+            values = [profile.stage, profile.count] + [
+                f"{value * 1e6:.1f}" for value in (profile.mean, profile.p50, profile.p90, profile.p99, profile.max)]
+            for column, value in enumerate(values + [busy]):
+                self.profile_table.setItem(row, column, QtWidgets.QTableWidgetItem(str(value)))
+
+    def update_command_variables(self):
+        self.command_variable_combobox.clear()
+        for var in self.database.get_variables():
+            self.command_variable_combobox.addItem(f"{var.var_id}: {var.name}", var.var_id)
+
+    def add_variable(self):
+        """Add the variable of the editor if the link has room for it."""
+        var_id = self.database.add_variable(self.variable_name_entry.text().strip(),
+                                            self.variable_speed_combobox.currentText(),
+                                            self.variable_type_combobox.currentText(),
+                                            auto_place=self.auto_place_checkbox.isChecked())
+        if var_id is None:
+            self.headroom_label.setText(self.headroom_label.text() + " - variable rejected, see the console")
+            return
+        self.serial_interface.load_database(self.database)
+        self.variable_name_entry.clear()
+        self.update_variables_table()
+        self.update_command_variables()
+        self.update_headroom()
+
+    def update_link_budget(self):
+        """Apply the baud rate and run_ezUART() rate the database is budgeted for."""
+        try:
+            self.database.link_baud_rate = int(self.link_baud_combobox.currentText())
+        except ValueError:
+            return
+        self.database.run_rate = self.run_rate_spinbox.value()
+        self.serial_interface.stats.tick_rate = self.database.run_rate
+        self.update_headroom()
+
+    def update_variables_table(self):
+        variables = self.database.get_variables()
+        self.variables_table.setRowCount(len(variables))
+        for row, var in enumerate(variables):
+            for column, value in enumerate((var.var_id, var.name, var.speed, var.data_type)):
+                self.variables_table.setItem(row, column, QtWidgets.QTableWidgetItem(str(value)))
+
+    def update_headroom(self):
+        """Show the share of the link the database uses and what is left."""
+        usage = self.database.utilization()
+        headroom = self.database.MAX_UTILIZATION - usage
+        self.headroom_bar.setValue(min(round(usage * 100), 100))
+        min_baud_rate = self.database.min_baud_rate()
+        self.headroom_label.setText(
+            f"{usage:.1%} of the link used, {headroom:.1%} headroom below the {self.database.MAX_UTILIZATION:.0%} limit"
+            + (f", needs at least {min_baud_rate} baud" if min_baud_rate else ", no common baud rate is enough"))
+
+    def update_link_health(self):
+        """Show the link statistics of the main connection, once per second."""
+        now = time.monotonic()
+        if now - self.link_update_time < 1.0:
+            return
+        self.link_update_time = now
+        if self.acquisition is not None:
+            stats = self.acquisition.link_stats()
+            if stats is None:  # No report from the worker yet
+                return
+        else:
+            stats = self.serial_interface.link_stats(self.sample_queue.depth())
+        labels = self.link_health_labels
+        baudrate = getattr(self.serial_interface.serial_port, 'baudrate', None)
+        if not self.serial_interface.is_connected():
+            labels['usage'].setText("-")
+        elif baudrate:
+            usage = stats.bytes_per_second * BITS_PER_BYTE / baudrate
+            labels['usage'].setText(f"{usage:.1%} of {baudrate} baud ({stats.bytes_per_second / 1024:.1f} KiB/s)")
+        else:
+            labels['usage'].setText(f"{stats.bytes_per_second / 1024:.1f} KiB/s")
+        labels['frames'].setText(f"{stats.frames_per_second:.0f}/s ({stats.frames} total)")
+        labels['errors'].setText(f"{stats.crc_errors} / {stats.format_errors}")
+        labels['sequence'].setText(f"{stats.sequence_gaps} ({stats.frames_lost} frames lost)")
+        labels['resync'].setText(str(stats.resync_bytes))
+        labels['queue'].setText(f"{stats.queue_depth} samples")
+        labels['decode'].setText(f"{stats.decode_time * 1e6:.1f} µs/frame")
+        lag = "-" if stats.lag is None else f"{stats.lag * 1e3:.1f} ms"
+        age = "-" if stats.frame_age is None else f"{stats.frame_age:.1f} s ago"
+        labels['lag'].setText(f"{lag} / {age}")
+        if self.command_channel is not None:
+            self.command_status_label.setText(self.command_channel.summary())
+        if profiler.enabled:
+            self.update_profile_table()
+        if self.exporter is not None:
+            self.export_label.setText(self.exporter.summary())
+
+    def export_link_stats(self):
+        """Write the link statistics history to a CSV file."""
+        filename, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Export Link Stats", "", "CSV Files (*.csv)")
+        if filename:
+            rows = self.serial_interface.stats.export(filename)
+            self.status_bar.setText(f"Status: Exported {rows} link statistics rows to {filename}")
+
+    def update_delivery_settings(self):
+        """Apply the tick interval and batch size chosen in the settings."""
+        self.delivery_timer.setInterval(self.delivery_interval_spinbox.value())
+        self.sample_queue.max_batch_size = self.batch_size_spinbox.value()
 
     def connect_serial(self):
         if self.serial_interface.is_connected():
+            if self.replayer is not None:
+                self.replayer.stop()
+                self.replayer.recording.close()
+                self.replayer = None
+            if self.command_channel is not None:
+                self.command_channel.stop()
+                self.command_channel = None
+            if self.async_interface is not None:
+                self.async_interface.disconnect()  # Ends read_serial_async
+                self.async_interface = None
+            if self.acquisition is not None:
+                self.stop_acquisition()
             self.serial_interface.disconnect()
             self.connect_button.setText("Connect")
             self.status_bar.setText("Status: Disconnected")
@@ -108,62 +547,450 @@ class ezUARTApp(QtWidgets.QMainWindow):
             port = self.port_combobox.currentText()
             baudrate_name = self.baud_combobox.currentText()
             baudrate = Database.BAUD_RATES[baudrate_name]
-            self.serial_interface.connect(port, baudrate)
+            self.serial_interface.protocol = int(self.protocol_combobox.currentText())
+            self.sample_queue.clear()
+            self.multi_port.late = 0
+            if self.acquisition is not None:
+                self.stop_acquisition()  # The worker stopped by itself, e.g. the device went away
+            negotiate = None
+            if self.negotiate_checkbox.isChecked():
+                negotiate = (self.hardware_combobox.currentText(), self.adapter_combobox.currentData())
+            if self.process_checkbox.isChecked():
+                if self.recorder is not None or self.exporter is not None:
+                    self.status_bar.setText("Status: Stop recording and export before acquiring in a worker process")
+                    return
+                self.acquisition = ProcessAcquisition(self.serial_interface, max_batch_size=MAX_BATCH_SIZE,
+                                                      on_status=self.acquisition_status.emit)
+                self.acquisition.start(port, baudrate, self.database, negotiate)
+            elif self.asyncio_checkbox.isChecked():
+                self.async_interface = AsyncSerialInterface(self.serial_interface)
+                self.async_interface.connect(port, baudrate)
+                self.event_loop.create_task(self.read_serial_async(self.async_interface))
+            else:
+                self.serial_interface.connect(port, baudrate)
+                threading.Thread(target=self.read_serial, daemon=True).start()
+            self.command_channel = CommandChannel(self.serial_interface)
+            self.command_channel.start()
             self.connect_button.setText("Disconnect")
             self.status_bar.setText(f"Status: Connected to {port} at {baudrate} baud")
-            threading.Thread(target=self.read_serial, daemon=True).start()
+            if negotiate is not None and self.acquisition is not None:
+                self.status_bar.setText(f"Status: Connected to {port}, the worker negotiates from {baudrate} baud")
+            elif negotiate is not None:
+                candidates = self.hardware_config.candidate_baud_rates(*negotiate)
+                negotiator = BaudNegotiator(self.serial_interface, self.command_channel, candidates)
+                threading.Thread(target=self.negotiate_baud_rate, args=(negotiator, port), daemon=True).start()
+                self.status_bar.setText(f"Status: Connected to {port}, negotiating from {baudrate} baud")
+
+    def stop_acquisition(self):
+        """Stop the worker process, closing the recording and export it writes."""
+        with self.recorder_lock:
+            recorder, exporter = self.recorder, self.exporter
+            self.recorder = self.exporter = None
+        if recorder is not None:
+            recorder.close()
+            self.record_button.setChecked(False)
+            self.record_button.setText("Record...")
+        if exporter is not None:
+            exporter.close()
+            self.export_label.setText(exporter.summary())
+            self.export_button.setChecked(False)
+            self.export_button.setText("Export...")
+        self.acquisition.stop()
+        self.acquisition = None
+
+    def negotiate_baud_rate(self, negotiator, port):
+        """Run baud negotiation, in a thread of its own as it waits on the replies."""
+        try:
+            baudrate = negotiator.negotiate()
+            status = f"Status: Connected to {port} at {baudrate} baud (negotiated)"
+        except Exception as e:  # Lost the device, or disconnected meanwhile
+            status = f"Status: Baud negotiation failed: {e}"
+        for line in negotiator.summary().splitlines():
+            self.command_result.emit(line)
+        self.baud_negotiated.emit(status)
 
     def read_serial(self):
         while self.serial_interface.is_connected():
-            data = self.serial_interface.read()
-            if data:
-                self.data_received_signal.emit(data)  # Emit the decoded message
+            samples = self.serial_interface.read_samples()
+            if samples:
+                started = profiler.clock()
+                self.sample_queue.put(samples)  # Picked up by deliver_samples
+                if not self.multi_port.readers:  # Otherwise recorded once merged with the other ports
+                    self.record_samples(samples)
+                profiler.record('emit', started)
+
+    async def read_serial_async(self, async_interface):
+        """asyncio version of read_serial, runs on the GUI thread through qasync."""
+        async for samples in async_interface.samples():
+            started = profiler.clock()
+            self.sample_queue.put(samples)
+            if not self.multi_port.readers:
+                self.record_samples(samples)
+            profiler.record('emit', started)
+
+    def record_samples(self, samples):
+        """Hand received samples to the running recording and export, if any."""
+        with self.recorder_lock:
+            if self.recorder is not None:
+                self.recorder.add_samples(samples)
+            if self.exporter is not None:
+                self.exporter.add_samples(samples)  # Dropped and counted if the exporter falls behind
+
+    def toggle_recording(self):
+        """Start recording received samples to a file, or stop the running recording."""
+        if self.recorder is None:
+            filename, _ = QtWidgets.QFileDialog.getSaveFileName(
+                self, "Record Samples", "", "ezUART Recordings (*.ezrec)")
+            if not filename:
+                self.record_button.setChecked(False)
+                return
+            with self.recorder_lock:
+                if self.acquisition is not None:  # Written by the worker
+                    self.recorder = self.acquisition.open_writer('record', filename, bool(self.multi_port.readers))
+                else:
+                    self.recorder = RecordingWriter(filename, self.database)
+            self.record_button.setText("Stop Recording")
+        else:
+            with self.recorder_lock:
+                self.recorder.close()
+                self.recorder = None
+            self.record_button.setText("Record...")
+
+    def export_file_filter(self):
+        """File dialog filter of the export formats the installed libraries can write."""
+        extensions = {}
+        for extension, description in export_formats().items():
+            extensions.setdefault(description, []).append(f"*{extension}")
+        return ";;".join(f"{description} ({' '.join(patterns)})" for description, patterns in extensions.items())
+
+    def toggle_export(self):
+        """Start exporting received samples to a file, or stop the running export."""
+        if self.exporter is None:
+            filename, _ = QtWidgets.QFileDialog.getSaveFileName(
+                self, "Export Samples", "", self.export_file_filter())
+            if not filename:
+                self.export_button.setChecked(False)
+                return
+            try:
+                if self.acquisition is not None:  # Written by the worker
+                    exporter = self.acquisition.open_writer('export', filename, bool(self.multi_port.readers))
+                else:
+                    exporter = SampleExporter(filename)
+            except (OSError, ValueError) as e:
+                self.status_bar.setText(f"Status: Cannot export to {filename}: {e}")
+                self.export_button.setChecked(False)
+                return
+            with self.recorder_lock:
+                self.exporter = exporter
+            self.export_button.setText("Stop Export")
+        else:
+            with self.recorder_lock:
+                exporter, self.exporter = self.exporter, None
+            exporter.close()  # Outside the lock, the reader keeps going while the rest is written
+            self.export_label.setText(exporter.summary())
+            self.export_button.setText("Export...")
+
+    def export_recording_range(self):
+        """Export a time range of a recording in the background, block by block."""
+        filename, _ = QtWidgets.QFileDialog.getOpenFileName(
+            self, "Export Recording", "", "ezUART Recordings (*.ezrec)")
+        if not filename:
+            return
+        with Recording(filename) as recording:
+            time_range = recording.time_range()
+        if time_range is None:
+            self.status_bar.setText(f"Status: {filename} is empty")
+            return
+        duration = time_range[1] - time_range[0]
+        start, ok = QtWidgets.QInputDialog.getDouble(
+            self, "Export Recording", "Start (seconds from the start of the recording):", 0.0, 0.0, duration, 3)
+        if not ok:
+            return
+        end, ok = QtWidgets.QInputDialog.getDouble(
+            self, "Export Recording", "End (seconds from the start of the recording):", duration, start, duration, 3)
+        if not ok:
+            return
+        output, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Export Samples", "", self.export_file_filter())
+        if output:
+            self.status_bar.setText(f"Status: Exporting {filename} to {output}...")
+            threading.Thread(target=self.run_recording_export, daemon=True,
+                             args=(filename, output, time_range[0] + start, time_range[0] + end)).start()
+
+    def run_recording_export(self, filename, output, start, end):
+        try:
+            with Recording(filename) as recording:
+                written = export_recording(recording, output, start, end)
+            status = f"Status: Exported {written} samples to {output}"
+        except (OSError, ValueError) as e:
+            status = f"Status: Export of {filename} failed: {e}"
+        self.export_finished.emit(status)
+
+    def load_firmware_layout(self):
+        """Check the ezUART_layout.py generated with the firmware against the database and preload its frames."""
+        filename, _ = QtWidgets.QFileDialog.getOpenFileName(
+            self, "Load Firmware Layout", "", "ezUART Layouts (*.py)")
+        if not filename:
+            return
+        try:
+            layout = load_layout(filename, self.database, self.serial_interface)
+        except (OSError, ValueError) as e:
+            self.status_bar.setText(f"Status: {e}")
+            return
+        self.protocol_combobox.setCurrentText(str(layout.PROTOCOL))
+        self.status_bar.setText(f"Status: Loaded {len(layout.FRAMES)} frame layouts from {filename}")
+
+    def open_recording(self):
+        """Load the samples of a recording into the plot history."""
+        filename, _ = QtWidgets.QFileDialog.getOpenFileName(
+            self, "Open Recording", "", "ezUART Recordings (*.ezrec)")
+        if filename:
+            self.load_recording(filename)
+
+    def replay_recording(self):
+        """Feed a recording through the receive pipeline as if it came from a device."""
+        filename, _ = QtWidgets.QFileDialog.getOpenFileName(
+            self, "Replay Recording", "", "ezUART Recordings (*.ezrec)")
+        if not filename:
+            return
+        speed, ok = QtWidgets.QInputDialog.getDouble(
+            self, "Replay Speed", "Speed factor (0 = as fast as possible):", 1.0, 0.0, 1000.0, 1)
+        if ok:
+            self.start_replay(filename, speed)
+
+    def start_replay(self, filename, speed):
+        if self.serial_interface.is_connected():
+            self.connect_serial()  # Disconnect first
+        port = FakeSerialPort()
+        self.serial_interface.protocol = int(self.protocol_combobox.currentText())
+        self.replayer = Replayer(Recording(filename), port, speed, self.serial_interface.protocol)
+        self.serial_interface.attach(port)
+        self.sample_queue.clear()
+        self.connect_button.setText("Disconnect")
+        self.status_bar.setText(f"Status: Replaying {filename} at {speed}x")
+        threading.Thread(target=self.read_serial, daemon=True).start()
+        self.replayer.start()
 
-    def update_serial_text_area(self, text):
+    def ports_locked(self):
+        """Refuse to open or close ports while recording, the recording would switch between its two feeds."""
+        if self.recorder is None and self.exporter is None:
+            return False
+        self.status_bar.setText("Status: Stop recording and export before opening or closing ports")
+        return True
+
+    def add_port(self):
+        """Open the selected port as an additional source next to the main connection."""
+        if self.ports_locked():
+            return
+        port = self.port_combobox.currentText()
+        baudrate = Database.BAUD_RATES[self.baud_combobox.currentText()]
+        source = self.multi_port.open(port, baudrate, int(self.protocol_combobox.currentText()))
+        item = QtWidgets.QListWidgetItem()
+        item.setData(QtCore.Qt.UserRole, source)
+        self.ports_list.addItem(item)
+        self.update_ports_list()
+
+    def close_port(self):
+        item = self.ports_list.currentItem()
+        if item is not None and not self.ports_locked():
+            self.multi_port.close(item.data(QtCore.Qt.UserRole))
+            self.ports_list.takeItem(self.ports_list.row(item))
+
+    def update_ports_list(self):
+        """Show the throughput of every additional port."""
+        for row in range(self.ports_list.count()):
+            item = self.ports_list.item(row)
+            reader = self.multi_port.readers.get(item.data(QtCore.Qt.UserRole))
+            if reader is None:
+                continue
+            state = "" if reader.interface.is_connected() else " (closed)"
+            item.setText(f"#{reader.source} {reader.name} @ {reader.baudrate}: "
+                         f"{reader.throughput():.0f} frames/s{state}")
+
+    def closeEvent(self, event):
+        """Close a running recording so its index gets written."""
+        if self.command_channel is not None:
+            self.command_channel.stop()
+            self.command_channel = None
+        if self.multi_port.is_merging():
+            queue = self.acquisition if self.acquisition is not None else self.sample_queue
+            self.record_samples(self.multi_port.read_merged(queue.take(), flush=True))  # Held back for the merge
+        if self.acquisition is not None:
+            self.stop_acquisition()
+        self.multi_port.close_all()
+        with self.recorder_lock:
+            if self.recorder is not None:
+                self.recorder.close()
+                self.recorder = None
+            if self.exporter is not None:
+                self.exporter.close()
+                self.exporter = None
+        super().closeEvent(event)
+
+    def load_recording(self, filename):
+        """Replace the plot history with the samples of a recording."""
+        with Recording(filename) as recording:
+            self.sample_store.clear()
+            records = recording.samples()
+            if len(records):
+                self.sample_store.add_records(records)
+            else:
+                # Raw frame recording, decode it with the schema it was recorded with
+                decoder = SerialInterface()
+                decoder.load_database(recording)
+                for timestamp, frame in recording.frames():
+                    self.sample_store.add_samples(decoder.decode_frame(frame, timestamp))
+        self.status_bar.setText(f"Status: Loaded {filename}")
+
+    def deliver_samples(self):
+        """Hand the samples queued by the reader thread or worker process to the GUI, once per tick."""
+        queue = self.acquisition if self.acquisition is not None else self.sample_queue
+        samples = queue.take()
+        if self.multi_port.is_merging():
+            samples = self.multi_port.read_merged(samples, queue.depth() > 0)  # The main connection is source 0
+            self.record_samples(samples)  # The only feed of the recording while ports are open
+            self.update_ports_list()
+        if samples:
+            profiler.record_value('delivery', (time.time() - samples[-1].timestamp) * 1e9)
+            self.update_serial_text_area(samples)
+        depth = queue.depth()
+        dropped = queue.dropped + self.multi_port.late  # Late ones would have broken the timestamp order
+        self.queue_label.setText(f"{depth} samples" + (f" ({dropped} dropped)" if dropped else ""))
+        self.update_link_health()
+
+    def update_serial_text_area(self, samples):
         """Update the serial text area in the main GUI thread."""
-        self.serial_text_area.append(text)
-        self.serial_text_area.moveCursor(QtGui.QTextCursor.End)
-        
-        # Attempt to extract value for plotting
-        self.extract_and_plot_value(text)
-
-    def extract_and_plot_value(self, decoded_message):
-        """Extract values from the decoded message and update plot data for both IDs."""
+        started = profiler.clock()
+        if self.show_text_checkbox.isChecked() and not self.pause_console_button.isChecked():
+            step = self.console_step_spinbox.value()
+            shown = samples[-self.console_counter % step::step] if step > 1 else samples
+            self.console_counter += len(samples)
+
+            # Never let the console fall behind, drop the oldest lines of an oversized tick
+            overflow = len(shown) - MAX_CONSOLE_LINES_PER_UPDATE
+            if overflow > 0:
+                shown = shown[overflow:]
+                self.console_dropped += overflow
+                self.console_dropped_label.setText(f"Dropped: {self.console_dropped}")
+
+            if shown:
+                text = self.serial_interface.format_samples(shown).rstrip("\n")
+                self.serial_text_area.appendPlainText(text)
+                self.serial_text_area.moveCursor(QtGui.QTextCursor.End)
+
+        self.extract_and_plot_value(samples)
+        profiler.record('console', started)
+
+    def extract_and_plot_value(self, samples):
+        """Store the decoded samples in the plot history of their variables."""
+        self.sample_store.add_samples(samples)
+
+    def update_plot_history(self):
+        """Reallocate the plot history with the depth chosen in the settings."""
+        depth = self.history_spinbox.value()
+        if depth != self.sample_store.depth:
+            self.sample_store = SampleStore(self.sample_store.buffers, depth)
+            self.curve_states.clear()
+
+    def update_plot_mode(self):
+        """Switch between level of detail and full-history rendering."""
+        self.curve_states.clear()
+        self.render_time = 0.0
+        self.plot_timer.setInterval(PLOT_INTERVAL_MS)
+        self.plot_interval_label.setText(f"{PLOT_INTERVAL_MS} ms")
+
+    def set_command_value(self, value):
+        """Send the value of the command editor to the selected variable."""
+        position = round(value * SLIDER_RESOLUTION)
+        if position != self.command_slider.value():
+            self.command_slider.blockSignals(True)
+            self.command_slider.setValue(position)
+            self.command_slider.blockSignals(False)
+        var_id = self.command_variable_combobox.currentData()
+        if self.command_channel is None or var_id is None:
+            return
         try:
-            lines = decoded_message.strip().split("\n")
-            for line in lines:
-                if "ID: 1" in line:  # Check for ID 1
-                    value_str = line.split("|")[-1].split(":")[-1].strip()
-                    value = float(value_str)
-                    self.update_plot_data(value, id=1)  # Update plot for ID 1
-                elif "ID: 2" in line:  # Check for ID 2
-                    value_str = line.split("|")[-1].split(":")[-1].strip()
-                    value = float(value_str)
-                    self.update_plot_data(value, id=2)  # Update plot for ID 2
-        except (ValueError, IndexError) as e:
-            print(f"Error extracting value: {e}")
-
-    def update_plot_data(self, value, id):
-        """Update the data for plotting, for a specific ID."""
-        if id == 1:
-            self.plot_data_id1.append(value)
-            if len(self.plot_data_id1) > 100:
-                self.plot_data_id1.pop(0)  # Keep the last 100 data points for ID 1
-        elif id == 2:
-            self.plot_data_id2.append(value)
-            if len(self.plot_data_id2) > 100:
-                self.plot_data_id2.pop(0)  # Keep the last 100 data points for ID 2
+            future = self.command_channel.set_variable(var_id, value)
+        except (struct.error, ValueError) as e:
+            self.show_command_result(f"Cannot set variable {var_id} to {value}: {e}")
+            return
+        future.add_done_callback(lambda future: future.exception() is None or self.command_result.emit(
+            f"Set variable {var_id} failed: {future.exception()}"))
+
+    def read_command_variable(self):
+        var_id = self.command_variable_combobox.currentData()
+        if self.command_channel is None or var_id is None:
+            return
+        self.command_channel.read_variable(var_id).add_done_callback(lambda future: self.command_result.emit(
+            f"Variable {var_id} = {future.result()}" if future.exception() is None
+            else f"Read variable {var_id} failed: {future.exception()}"))
+
+    def ping_mcu(self):
+        if self.command_channel is None:
+            return
+        self.command_channel.ping().add_done_callback(lambda future: self.command_result.emit(
+            f"Ping {future.result() * 1e3:.1f} ms" if future.exception() is None
+            else f"Ping failed: {future.exception()}"))
+
+    def show_command_result(self, text):
+        self.command_status_label.setText(text)
+        self.serial_text_area.appendPlainText(text)
 
     def send_data(self):
         if self.serial_interface.is_connected():
             data = self.send_entry.text()
-            self.serial_interface.write(data.encode('utf-8'))
-            self.serial_text_area.append(f"Sent: {data}")
+            if self.command_channel is not None:
+                self.command_channel.write(data.encode('utf-8'))  # Queued behind pending commands
+            else:
+                self.serial_interface.write(data.encode('utf-8'))
+            self.serial_text_area.appendPlainText(f"Sent: {data}")
             self.send_entry.clear()
 
     def update_plot(self):
-        """Update the plot with the latest data from both IDs."""
-        if self.plot_data_id1:
-            self.curve_id1.setData(self.plot_data_id1)  # Update the plot with data for ID 1
-        if self.plot_data_id2:
-            self.curve_id2.setData(self.plot_data_id2)  # Update the plot with data for ID 2
+        """Update the plot with the latest data of every variable."""
+        started = time.perf_counter()
+        profiled = profiler.clock()
+        lod = self.lod_checkbox.isChecked()
+        if lod:
+            view_box = self.plot.getViewBox()
+            columns = max(int(view_box.width()), 1)
+            follow = view_box.autoRangeEnabled()[0]  # Auto range needs the full extent
+            x_range = None if follow else tuple(view_box.viewRange()[0])
+
+        for key, buffer in self.sample_store.buffers.items():
+            if not buffer.count:
+                continue
+            curve = self.curves.get(key)
+            if curve is None:
+                curve = self.curves[key] = self.plot.plot(pen=pg.intColor(len(self.curves)), name=self.curve_name(key))
+            if not lod:
+                curve.setData(*buffer.view())
+                continue
+
+            # Only redraw curves whose data or visible range changed
+            state = (buffer.version, x_range, columns)
+            if self.curve_states.get(key) == state:
+                continue
+            self.curve_states[key] = state
+            x, y = buffer.view()
+            x_min, x_max = x_range or (x[0], x[-1])
+            curve.setData(*decimate_minmax(x, y, x_min, x_max, columns))
+
+        profiler.record('plot', profiled)
+        if lod:
+            self.adapt_plot_interval(time.perf_counter() - started)
+
+    def adapt_plot_interval(self, render_time):
+        """Stretch or shrink the plot interval so rendering stays within its budget."""
+        self.render_time = 0.8 * self.render_time + 0.2 * render_time
+        interval = int(self.render_time * 1000 / PLOT_RENDER_BUDGET)
+        interval = min(max(interval, MIN_PLOT_INTERVAL_MS), MAX_PLOT_INTERVAL_MS)
+        if interval != self.plot_timer.interval():
+            self.plot_timer.setInterval(interval)
+            self.plot_interval_label.setText(f"{interval} ms")
+
+    def curve_name(self, key):
+        """Legend name of a (source, variable ID) curve, tagged with the port of additional sources."""
+        source, var_id = key
+        variable = self.database.get_variable(var_id)
+        name = variable.name if variable is not None else f"ID {var_id}"
+        return name if source == 0 else f"{name} (#{source})"
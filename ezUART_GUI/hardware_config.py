@@ -1,14 +1,68 @@
+DEFAULT_HARDWARE = 'STM32'
+
 class HardwareConfig:
     def __init__(self):
+        # 'baud_rates' are the candidates baud negotiation steps through, 'safe_baud_rate' the one to
+        # connect at before negotiating and 'max_baud_rate' the fastest the UART can be clocked at
         self.supported_hardware = {
             'STM32': {
-                'baud_rates': [9600, 115200],
+                'baud_rates': [9600, 115200, 230400, 460800, 921600, 1000000, 2000000, 3000000, 4000000],
+                'safe_baud_rate': 115200,
+                'max_baud_rate': 4000000,  # USART with 8x oversampling from a 32 MHz kernel clock
+                'data_types': ['int', 'float', 'string']
+            },
+            'ESP32': {
+                'baud_rates': [9600, 115200, 230400, 460800, 921600, 1000000, 2000000, 3000000, 5000000],
+                'safe_baud_rate': 115200,
+                'max_baud_rate': 5000000,
+                'data_types': ['int', 'float', 'string']
+            },
+            'RP2040': {
+                'baud_rates': [9600, 115200, 230400, 460800, 921600, 1000000, 2000000, 3000000, 4000000],
+                'safe_baud_rate': 115200,
+                'max_baud_rate': 4000000,
+                'data_types': ['int', 'float', 'string']
+            },
+            'AVR': {
+                # Rates dividing 16 MHz evenly, 115200 is off by 2.1% there
+                'baud_rates': [9600, 38400, 76800, 250000, 500000, 1000000, 2000000],
+                'safe_baud_rate': 38400,
+                'max_baud_rate': 2000000,  # Double speed mode at 16 MHz
                 'data_types': ['int', 'float', 'string']
             }
             # Add more hardware configurations as needed
         }
+        # Fastest rate of common USB to UART adapters
+        self.adapters = {
+            'CP2102': 921600,
+            'CH340': 2000000,
+            'FT232R': 3000000,
+            'CP2102N': 3000000,
+            'FT232H': 12000000,
+        }
 
     def get_supported_hardware(self):
         return self.supported_hardware
 
-    # Additional methods to manage hardware configurations can be added here.
+    def get_hardware(self, hardware):
+        if hardware not in self.supported_hardware:
+            raise ValueError(f"Unknown hardware: {hardware}")
+        return self.supported_hardware[hardware]
+
+    def safe_baud_rate(self, hardware):
+        return self.get_hardware(hardware)['safe_baud_rate']
+
+    def max_baud_rate(self, hardware, adapter=None):
+        """Fastest rate the hardware, and the adapter if given, can run at."""
+        max_baud_rate = self.get_hardware(hardware)['max_baud_rate']
+        if adapter is not None:
+            if adapter not in self.adapters:
+                raise ValueError(f"Unknown adapter: {adapter}")
+            max_baud_rate = min(max_baud_rate, self.adapters[adapter])
+        return max_baud_rate
+
+    def candidate_baud_rates(self, hardware, adapter=None):
+        """Rates baud negotiation tries, in increasing order, from the safe rate up to the limit."""
+        low = self.safe_baud_rate(hardware)
+        high = self.max_baud_rate(hardware, adapter)
+        return sorted(rate for rate in self.get_hardware(hardware)['baud_rates'] if low <= rate <= high)
@@ -0,0 +1,116 @@
+"""Link health counters of one SerialInterface.
+
+SerialInterface updates the counters from its reader thread. snapshot()
+turns them into rates over the time since the previous snapshot and keeps
+a bounded history that export() writes to CSV for offline analysis:
+
+    snapshot = interface.link_stats(queue_depth)
+    interface.stats.export('link.csv')
+
+Frames may carry an 8-bit sequence number and the MCU tick count (see
+database.SEQUENCE_ID and TIMESTAMP_ID). Sequence gaps count lost frames,
+assuming fewer than 256 are lost in a row. The tick count gives the lag of
+each read: its delay against the quickest frame seen so far, i.e. how much
+older than usual the newest values are.
+"""
+import csv
+import time
+from collections import deque, namedtuple
+
+HISTORY_SIZE = 3600  # Snapshots kept for export, an hour at one per second
+TICK_MODULUS = 1 << 32  # The MCU tick count wraps around
+
+LinkSnapshot = namedtuple('LinkSnapshot', [
+    'time',  # Host time of the snapshot, seconds since epoch
+    'frames_per_second',
+    'bytes_per_second',
+    'frames', 'bytes',  # Totals received by the interface
+    'crc_errors', 'format_errors',
+    'sequence_gaps', 'frames_lost',
+    'resync_bytes',  # Bytes skipped while looking for a valid frame
+    'queue_depth',  # Samples decoded but not yet taken by the GUI
+    'decode_time',  # Mean seconds to decode one frame since the previous snapshot
+    'lag',  # Seconds the newest frame arrived later than the quickest one, None without timestamps
+    'frame_age',  # Seconds since the last frame was received, None before the first one
+])
+
+class LinkStats:
+    def __init__(self, tick_rate=1000, history_size=HISTORY_SIZE):
+        self.tick_rate = tick_rate  # MCU ticks per second, the run_ezUART() rate
+        self.history = deque(maxlen=history_size)
+        self.reset()
+
+    def reset(self):
+        self.sequence = None  # Last sequence number received
+        self.sequence_gaps = 0  # Times a sequence number was skipped
+        self.frames_lost = 0  # Sequence numbers skipped in total
+        self.ticks = None  # Last MCU tick count received
+        self.mcu_time = None  # MCU seconds of that tick count, unwrapped
+        self.clock_offset = None  # Smallest host minus MCU time seen
+        self.lag = None
+        self.last_frame_time = None
+        self.decode_seconds = 0.0  # Decode time and frames since the previous snapshot
+        self.decoded_frames = 0
+        self.previous = None  # (monotonic time, frames, bytes) of the previous snapshot
+        self.history.clear()
+
+    def sequence_received(self, sequence):
+        """Account a sequence number, returns how many frames were lost before it."""
+        skipped = 0
+        if self.sequence is not None:
+            skipped = (sequence - self.sequence - 1) & 0xFF
+            if skipped:
+                self.sequence_gaps += 1
+                self.frames_lost += skipped
+        self.sequence = sequence
+        return skipped
+
+    def ticks_received(self, ticks):
+        if self.ticks is None:
+            self.mcu_time = ticks / self.tick_rate
+        else:
+            self.mcu_time += ((ticks - self.ticks) % TICK_MODULUS) / self.tick_rate
+        self.ticks = ticks
+
+    def frames_decoded(self, count, seconds, timestamp):
+        """Account the decode of count frames received at timestamp (host seconds since epoch)."""
+        self.decode_seconds += seconds
+        self.decoded_frames += count
+        self.last_frame_time = timestamp
+        if self.mcu_time is not None:
+            offset = timestamp - self.mcu_time
+            if self.clock_offset is None or offset < self.clock_offset:
+                self.clock_offset = offset
+            self.lag = offset - self.clock_offset
+
+    def snapshot(self, interface, queue_depth=0):
+        """Rates since the previous snapshot and the current totals of interface, added to the history."""
+        now = time.monotonic()
+        timestamp = time.time()
+        frames = interface.frames_received
+        received = interface.bytes_received
+        if self.previous is None:
+            frames_per_second = bytes_per_second = 0.0
+        else:
+            elapsed = max(now - self.previous[0], 1e-9)
+            frames_per_second = (frames - self.previous[1]) / elapsed
+            bytes_per_second = (received - self.previous[2]) / elapsed
+        self.previous = (now, frames, received)
+        decode_time = self.decode_seconds / self.decoded_frames if self.decoded_frames else 0.0
+        self.decode_seconds = 0.0
+        self.decoded_frames = 0
+        snapshot = LinkSnapshot(
+            timestamp, frames_per_second, bytes_per_second, frames, received,
+            interface.crc_errors, interface.format_errors, self.sequence_gaps, self.frames_lost,
+            interface.bytes_skipped, queue_depth, decode_time, self.lag,
+            timestamp - self.last_frame_time if self.last_frame_time is not None else None)
+        self.history.append(snapshot)
+        return snapshot
+
+    def export(self, filename):
+        """Write the snapshot history to a CSV file, one row per snapshot."""
+        with open(filename, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(LinkSnapshot._fields)
+            writer.writerows(self.history)
+        return len(self.history)
@@ -1,11 +1,37 @@
+import argparse
+import asyncio
+import sys
 from PyQt5 import QtWidgets
 from gui import ezUARTApp
+from profiling import profiler
 import qdarktheme  # Import the theme
 
+try:
+    import qasync  # Optional, runs asyncio on the Qt event loop
+except ImportError:
+    qasync = None
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ezUART serial port GUI.")
+    parser.add_argument('--profile', nargs='?', const='-', metavar='FILE',
+                        help="Profile the data path from the start and write the report to FILE on exit, "
+                             "stdout by default")
+    args, qt_args = parser.parse_known_args()  # The rest goes to Qt, e.g. -platform
+    if args.profile:
+        profiler.enable()
+
     qdarktheme.enable_hi_dpi()
-    app = QtWidgets.QApplication([])
-    window = ezUARTApp()
-    window.show()
-    app.exec()
-    
\ No newline at end of file
+    app = QtWidgets.QApplication(sys.argv[:1] + qt_args)
+    if qasync is None:
+        window = ezUARTApp()
+        window.show()
+        app.exec()
+    else:
+        loop = qasync.QEventLoop(app)
+        asyncio.set_event_loop(loop)
+        window = ezUARTApp(loop)
+        window.show()
+        with loop:
+            loop.run_forever()
+    if args.profile:
+        profiler.dump(args.profile)
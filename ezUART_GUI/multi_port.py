@@ -0,0 +1,139 @@
+"""Several serial ports read at once and merged into one time-ordered stream."""
+import heapq
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from operator import attrgetter
+from serial_interface import SerialInterface, DEFAULT_PROTOCOL
+from sample_queue import SampleQueue
+
+MERGE_DELAY = 0.05  # Seconds a sample is held back so slower ports can catch up in the merge
+THROUGHPUT_WINDOW = 1.0  # Seconds over which per-port frames/s is measured
+
+
+class PortReader:
+    """One port with its own SerialInterface, reader thread and queue."""
+
+    def __init__(self, source, name, baudrate, database, protocol=DEFAULT_PROTOCOL):
+        self.source = source
+        self.name = name
+        self.baudrate = baudrate
+        self.interface = SerialInterface(protocol)
+        self.interface.source = source
+        self.interface.load_database(database)
+        self.queue = SampleQueue(max_batch_size=float('inf'))
+        self.thread = None
+        self.last_frames = 0  # frames_received at the start of the throughput window
+        self.last_time = time.monotonic()
+        self.rate = 0.0  # Frames per second over the last complete window
+
+    def start(self):
+        self.interface.connect(self.name, self.baudrate)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while self.interface.is_connected():
+            samples = self.interface.read_samples()
+            if samples:
+                self.queue.put(samples)
+
+    def stop(self):
+        self.interface.disconnect()
+
+    def throughput(self):
+        """Frames per second, updated once per THROUGHPUT_WINDOW."""
+        now = time.monotonic()
+        if now - self.last_time >= THROUGHPUT_WINDOW:
+            frames = self.interface.frames_received
+            self.rate = (frames - self.last_frames) / (now - self.last_time)
+            self.last_frames, self.last_time = frames, now
+        return self.rate
+
+
+class MultiPortSession:
+    """Open N ports, each read independently, and merge their samples by host timestamp.
+
+    Every port has its own reader thread and queue, so a slow or silent
+    link never blocks the others. Samples carry the source ID of their port.
+    The samples of the GUI's own connection are merged in as source 0.
+    """
+
+    def __init__(self, database, merge_delay=MERGE_DELAY):
+        self.database = database
+        self.merge_delay = merge_delay
+        self.readers = {}  # Source ID -> PortReader
+        self.pending = {0: []}  # Source ID -> samples waiting for the merge
+        self.main_until = float('-inf')  # Timestamp of the newest sample of the main connection
+        self.merged_until = float('-inf')  # Timestamp of the newest sample merged so far
+        self.late = 0  # Samples that arrived after newer ones were merged, dropped
+        self.next_source = 1  # Source 0 is the single connection of the GUI
+        self.lock = threading.Lock()
+
+    def open(self, name, baudrate, protocol=DEFAULT_PROTOCOL):
+        """Connect another port and return its source ID."""
+        with self.lock:
+            source = self.next_source
+            self.next_source += 1
+        reader = PortReader(source, name, baudrate, self.database, protocol)
+        reader.start()
+        self.readers[source] = reader
+        self.pending[source] = []
+        return source
+
+    def close(self, source):
+        reader = self.readers.pop(source, None)
+        if reader is not None:
+            reader.stop()  # Its held back samples still come out of read_merged()
+
+    def close_all(self):
+        for source in list(self.readers):
+            self.close(source)
+
+    def is_merging(self):
+        """True while ports are open or samples are still held back for the merge."""
+        return bool(self.readers) or any(self.pending.values())
+
+    def read_merged(self, main=(), main_backlog=False, flush=False):
+        """Return the samples of every port received before the merge delay, ordered by timestamp.
+
+        main are new samples of the GUI's own connection, held back like
+        the others, main_backlog tells that more of them are still queued
+        so the merge must not go past the newest one. Newer samples stay
+        pending so a port that is slightly behind can still slot its samples
+        in order, samples later than that are dropped and counted in late.
+        flush, or closing the last port, returns everything.
+        """
+        watermark = float('inf') if flush or not self.readers else time.time() - self.merge_delay
+        if main:
+            self.main_until = main[-1].timestamp
+            self.pending[0] += main
+        if main_backlog and not flush:
+            watermark = min(watermark, self.main_until)
+        ready = []
+        for source in list(self.pending):
+            pending = self.pending[source]
+            reader = self.readers.get(source)
+            if reader is not None:
+                pending += reader.queue.take()
+            # Each port's samples are already in timestamp order
+            split = bisect_right(pending, watermark, key=attrgetter('timestamp'))
+            if split:
+                late = bisect_left(pending, self.merged_until, 0, split, key=attrgetter('timestamp'))
+                self.late += late
+                if split > late:
+                    ready.append(pending[late:split])
+                del pending[:split]
+            if source and reader is None and not pending:
+                del self.pending[source]  # Closed and drained
+        if len(ready) <= 1:
+            merged = ready[0] if ready else []
+        else:
+            merged = list(heapq.merge(*ready, key=attrgetter('timestamp')))
+        if merged:
+            self.merged_until = merged[-1].timestamp
+        return merged
+
+    def names(self):
+        """Port name of every source ID."""
+        return {source: reader.name for source, reader in self.readers.items()}
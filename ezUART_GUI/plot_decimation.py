@@ -0,0 +1,27 @@
+import numpy as np
+
+def visible_slice(x, x_min, x_max):
+    """Index range of the sorted x values inside [x_min, x_max], plus one point on each side."""
+    start = max(int(np.searchsorted(x, x_min, side='left')) - 1, 0)
+    end = min(int(np.searchsorted(x, x_max, side='right')) + 1, len(x))
+    return start, end
+
+def decimate_minmax(x, y, x_min, x_max, columns):
+    """Reduce the visible part of a curve to a minimum and a maximum per pixel column.
+
+    Spikes survive because every column keeps its extremes. Curves that
+    already have fewer than two points per column are only clipped.
+    """
+    start, end = visible_slice(x, x_min, x_max)
+    x = x[start:end]
+    y = y[start:end]
+    n = len(x)
+    if n <= 2 * columns:
+        return x, y
+    # First point of each column, the points just outside the view join the edge columns
+    edges = np.searchsorted(x, np.linspace(x_min, x_max, columns + 1)[1:-1], side='left')
+    edges = np.unique(np.concatenate(([0], edges)))  # Drops empty columns
+    edges = edges[edges < n]
+    y_min = np.minimum.reduceat(y, edges)
+    y_max = np.maximum.reduceat(y, edges)
+    return np.repeat(x[edges], 2), np.column_stack((y_min, y_max)).ravel()
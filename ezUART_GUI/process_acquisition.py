@@ -0,0 +1,365 @@
+"""Acquisition in a worker process, handing samples to the GUI through shared memory.
+
+The worker owns the serial port: it reads, decodes and appends the samples
+to a SharedSampleRing, and writes recordings and exports itself. The GUI
+process maps the ring read-only and takes samples from it at its own pace.
+Only small messages go through the pipe between the two: the number of
+samples written so far, command frames and their replies, link statistics
+once per second and recording/export requests.
+
+    worker:  port -> SerialInterface -> SharedSampleRing, RecordingWriter, SampleExporter
+    GUI:     SharedSampleRing -> ProcessAcquisition.take() -> console and plot
+
+The worker never waits for the GUI. If rendering falls a whole ring behind,
+the GUI skips the oldest samples and counts them as dropped, like
+SampleQueue. Reading, decoding, recording and export go on regardless, in
+their own process with their own GIL.
+
+    acquisition = ProcessAcquisition(interface)
+    acquisition.start('/dev/ttyUSB0', 2000000, database)  # interface now writes to the worker
+    samples = acquisition.take()
+"""
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+import serial
+from serial_interface import SerialInterface, Sample
+from recording import RecordingWriter, SAMPLE_DTYPE
+from export import SampleExporter
+from capture import negotiate as negotiate_baud_rate
+
+RING_CAPACITY = 1 << 20  # Default samples held by the ring, 19 MiB
+HEADER_SIZE = 64  # Ring header, the RESERVED and WRITTEN counters
+RESERVED = 0  # Samples the worker has started writing, their slots are being overwritten
+WRITTEN = 1  # Samples completely written
+READ_TIMEOUT = 0.01  # Seconds a worker read waits, bounds the command and notification latency
+NOTIFY_INTERVAL = 0.01  # Minimum seconds between two notifications of new samples
+STATS_INTERVAL = 1.0  # Seconds between two link statistics messages
+STOP_TIMEOUT = 5.0  # Seconds the worker gets to close its files and port
+
+class SharedSampleRing:
+    """Single producer, single consumer ring of SAMPLE_DTYPE records in shared memory.
+
+    Counters only grow, sample n lives in slot n % capacity. The writer
+    bumps RESERVED before overwriting slots and WRITTEN after, so a reader
+    can tell which of the samples it copied were overwritten meanwhile.
+    """
+
+    def __init__(self, capacity=RING_CAPACITY, name=None):
+        """Create a ring for its reader, mapped read-only, or attach to the ring called name as its writer."""
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=HEADER_SIZE + capacity * SAMPLE_DTYPE.itemsize)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+            capacity = (self.memory.size - HEADER_SIZE) // SAMPLE_DTYPE.itemsize
+        self.capacity = capacity
+        self.header = np.ndarray(2, dtype=np.uint64, buffer=self.memory.buf)
+        self.records = np.ndarray(capacity, dtype=SAMPLE_DTYPE, buffer=self.memory.buf, offset=HEADER_SIZE)
+        if name is None:
+            self.header.flags.writeable = False
+            self.records.flags.writeable = False
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def written(self):
+        return int(self.header[WRITTEN])
+
+    def write(self, samples):
+        """Append a list of Samples (writer), only the newest capacity ones if there are more."""
+        records = np.array(samples[-self.capacity:], dtype=SAMPLE_DTYPE)
+        written = int(self.header[WRITTEN]) + len(samples)
+        count = len(records)
+        self.header[RESERVED] = written
+        start = (written - count) % self.capacity
+        first = min(count, self.capacity - start)
+        self.records[start:start + first] = records[:first]
+        self.records[:count - first] = records[first:]
+        self.header[WRITTEN] = written
+
+    def read(self, position, count):
+        """Copy count samples from position on (reader), returns (records, samples overwritten meanwhile)."""
+        start = position % self.capacity
+        first = min(count, self.capacity - start)
+        records = np.concatenate((self.records[start:start + first], self.records[:count - first]))
+        overwritten = int(self.header[RESERVED]) - self.capacity - position
+        if overwritten > 0:
+            return records[overwritten:], min(overwritten, count)
+        return records, 0
+
+    def close(self):
+        self.header = self.records = None  # Views must go before the mapping
+        self.memory.close()
+
+    def unlink(self):
+        self.memory.unlink()
+
+class WorkerPort:
+    """Stand-in for serial.Serial in the GUI process while the worker owns the port.
+
+    Lets CommandChannel and send_data write through the usual
+    SerialInterface, their bytes are forwarded to the worker.
+    """
+
+    def __init__(self, acquisition, baudrate):
+        self.acquisition = acquisition
+        self.baudrate = baudrate  # Updated when the worker negotiates a faster rate
+        self.is_open = True
+        self.in_waiting = 0
+
+    def read(self, size=1):
+        return b""  # Everything is read by the worker
+
+    def write(self, data):
+        self.acquisition.send(('write', bytes(data)))
+        return len(data)
+
+    def close(self):
+        self.is_open = False
+        self.acquisition.stop()
+
+class RemoteWriter:
+    """Handle of a recording or export the worker writes, in place of a RecordingWriter or SampleExporter."""
+
+    def __init__(self, acquisition, kind):
+        self.acquisition = acquisition
+        self.kind = kind  # 'record' or 'export'
+
+    def add_samples(self, samples):
+        """Merged samples of the worker and the additional ports, for a writer opened with merged."""
+        self.acquisition.send(('add_samples', samples))
+
+    def summary(self):
+        return self.acquisition.summaries.get(self.kind) or ""
+
+    def close(self):
+        """Ask the worker to close the file, waits until it did."""
+        done = self.acquisition.closed[self.kind] = threading.Event()
+        if self.acquisition.send(('close', self.kind)):
+            done.wait(STOP_TIMEOUT)
+
+class ProcessAcquisition:
+    """GUI side of a worker process acquisition, consumed like a SampleQueue."""
+
+    def __init__(self, interface, capacity=RING_CAPACITY, max_batch_size=5000, on_status=None):
+        self.interface = interface  # SerialInterface of the GUI, attached to a WorkerPort while running
+        self.capacity = capacity
+        self.max_batch_size = max_batch_size
+        self.on_status = on_status  # Called with status lines from the worker, from the listener thread
+        self.context = multiprocessing.get_context('spawn')  # Forking a process running Qt threads is unsafe
+        self.ring = None
+        self.process = None
+        self.connection = None
+        self.send_lock = threading.Lock()
+        self.listener = None
+        self.port = None
+        self.position = 0  # Samples taken so far
+        self.notified = 0  # Samples written as of the last notification
+        self.dropped = 0  # Samples skipped because the GUI fell a whole ring behind
+        self.stats = None  # Latest LinkSnapshot of the worker
+        self.summaries = {}  # Kind -> latest summary of a worker recording or export
+        self.closed = {}  # Kind -> Event set once the worker closed that file
+        self.running = False
+
+    def start(self, port, baudrate, database, negotiate=None):
+        """Start the worker on port and attach the interface to it.
+
+        negotiate is a (hardware, adapter) pair to negotiate the baud rate with first.
+        """
+        self.ring = SharedSampleRing(self.capacity)
+        self.connection, child = self.context.Pipe()
+        self.process = self.context.Process(
+            target=run_worker, daemon=True,
+            args=(child, self.ring.name, port, baudrate, self.interface.protocol, database, negotiate))
+        self.process.start()
+        child.close()
+        self.running = True
+        self.port = WorkerPort(self, baudrate)
+        self.interface.attach(self.port)
+        self.listener = threading.Thread(target=self.listen, daemon=True)
+        self.listener.start()
+
+    def send(self, message):
+        """Send a message to the worker, returns False if it is gone."""
+        with self.send_lock:
+            if not self.running:
+                return False
+            try:
+                self.connection.send(message)
+                return True
+            except (OSError, ValueError):  # Worker gone, or connection closed by stop()
+                return False
+
+    def listen(self):
+        """Handle the messages of the worker until it stops (listener thread)."""
+        try:
+            while True:
+                message = self.connection.recv()
+                kind = message[0]
+                if kind == 'samples':
+                    self.notified = message[1]
+                elif kind == 'reply':
+                    callback = self.interface.on_command_reply
+                    if callback is not None:
+                        callback(message[1])
+                elif kind == 'stats':
+                    self.stats = message[1]
+                    self.interface.stats.history.append(message[1])  # Exported by the Link Health panel
+                    self.summaries['export'] = message[2]
+                elif kind == 'baud':
+                    self.port.baudrate = message[1]
+                elif kind == 'closed':
+                    self.summaries[message[1]] = message[2]
+                    if message[1] in self.closed:
+                        self.closed[message[1]].set()
+                elif kind == 'status' and self.on_status is not None:
+                    self.on_status(message[1])
+                elif kind == 'stopped':
+                    break
+        except (EOFError, OSError):  # Worker died
+            pass
+        self.port.is_open = False
+        for done in self.closed.values():
+            done.set()
+
+    def take(self):
+        """Return the next batch of at most max_batch_size samples (GUI thread)."""
+        if self.ring is None:
+            return []
+        notified = self.notified
+        behind = notified - self.position - self.capacity
+        if behind > 0:
+            self.position += behind
+            self.dropped += behind
+        count = min(notified - self.position, self.max_batch_size)
+        if count <= 0:
+            return []
+        records, overwritten = self.ring.read(self.position, count)
+        self.position += count
+        self.dropped += overwritten
+        return list(map(Sample._make, records.tolist()))
+
+    def depth(self):
+        """Number of samples written but not taken yet."""
+        return max(self.notified - self.position, 0)
+
+    def link_stats(self):
+        """Latest LinkSnapshot of the worker with the ring depth as queue depth, None before the first one."""
+        if self.stats is None:
+            return None
+        return self.stats._replace(queue_depth=self.depth())
+
+    def open_writer(self, kind, filename, merged=False):
+        """Have the worker record ('record') or export ('export') to filename, returns its RemoteWriter.
+
+        A merged writer only gets the samples passed to RemoteWriter.add_samples(), the GUI
+        sends it the worker's samples merged in timestamp order with those of additional ports.
+        """
+        self.summaries.pop(kind, None)
+        self.send(('open', kind, filename, merged))
+        return RemoteWriter(self, kind)
+
+    def stop(self):
+        """Stop the worker, waiting for it to close its files, and release the ring."""
+        if not self.running:
+            return
+        self.send(('stop',))
+        self.process.join(STOP_TIMEOUT)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        with self.send_lock:
+            self.running = False
+        self.listener.join()
+        self.connection.close()
+        self.ring.close()
+        self.ring.unlink()
+        self.ring = None
+
+def run_worker(connection, ring_name, port, baudrate, protocol, database, negotiate=None):
+    """Read, decode and store samples until told to stop or the port goes away (worker process)."""
+    ring = SharedSampleRing(name=ring_name)
+    interface = SerialInterface(protocol)
+    interface.load_database(database)
+    try:
+        interface.connect(port, baudrate)
+    except (serial.SerialException, OSError, ValueError) as e:
+        connection.send(('status', f"Status: Cannot open {port}: {e}"))
+        connection.send(('stopped',))
+        ring.close()
+        return
+
+    if negotiate is not None:
+        try:
+            baudrate = negotiate_baud_rate(interface, *negotiate)
+            connection.send(('baud', baudrate))
+            connection.send(('status', f"Status: Connected to {port} at {baudrate} baud (negotiated)"))
+        except (ConnectionError, OSError) as e:
+            connection.send(('status', f"Status: Baud negotiation failed: {e}"))
+
+    interface.serial_port.timeout = READ_TIMEOUT
+    interface.on_command_reply = lambda frame: connection.send(('reply', bytes(frame)))
+    writers = {}  # 'record' -> RecordingWriter, 'export' -> SampleExporter
+    merged = set()  # Kinds of the writers fed by the GUI with merged samples instead
+    notified = 0
+    last_notify = last_stats = time.monotonic()
+    running = True
+    try:
+        while running and interface.is_connected():
+            samples = interface.read_samples()
+            if samples:
+                ring.write(samples)
+                for name, writer in writers.items():
+                    if name not in merged:
+                        writer.add_samples(samples)
+            now = time.monotonic()
+            written = ring.written()
+            if written != notified and now - last_notify >= NOTIFY_INTERVAL:
+                connection.send(('samples', written))
+                notified, last_notify = written, now
+            if now - last_stats >= STATS_INTERVAL:
+                exporter = writers.get('export')
+                connection.send(('stats', interface.link_stats(), exporter.summary() if exporter else None))
+                last_stats = now
+            while connection.poll():
+                message = connection.recv()
+                kind = message[0]
+                if kind == 'write':
+                    interface.write(message[1])
+                elif kind == 'add_samples':
+                    for name in merged & writers.keys():
+                        writers[name].add_samples(message[1])
+                elif kind == 'open':
+                    try:
+                        writers[message[1]] = (RecordingWriter(message[2], database) if message[1] == 'record'
+                                               else SampleExporter(message[2]))
+                        if message[3]:
+                            merged.add(message[1])
+                        else:
+                            merged.discard(message[1])
+                    except (OSError, ValueError) as e:
+                        connection.send(('status', f"Status: Cannot write {message[2]}: {e}"))
+                elif kind == 'close':
+                    writer = writers.pop(message[1], None)
+                    if writer is not None:
+                        writer.close()
+                    summary = writer.summary() if isinstance(writer, SampleExporter) else None
+                    connection.send(('closed', message[1], summary))
+                elif kind == 'stop':
+                    running = False
+    except (EOFError, OSError):  # GUI gone
+        pass
+    finally:
+        for writer in writers.values():
+            writer.close()
+        interface.disconnect()
+        written = ring.written()
+        ring.close()
+    try:
+        connection.send(('samples', written))  # The GUI may still take what was read last
+        connection.send(('stopped',))
+    except OSError:
+        pass
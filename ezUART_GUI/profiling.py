@@ -0,0 +1,154 @@
+"""Opt-in latency profiling of the data path, from the serial port to the plot.
+
+Each stage times itself into a histogram allocated up front, so recording
+never allocates. Histograms are log-linear like HDR histograms: linear
+nanosecond buckets up to 2**SUB_BUCKET_BITS, then half that many buckets
+per power of two. Values are kept within about 3%, from nanoseconds to minutes.
+
+    started = profiler.clock()
+    ...
+    profiler.record('decode', started)
+
+While profiling is off, clock() returns 0 and record() returns right away,
+so a hook costs two trivial calls. Hooks sit on whole reads, batches and
+refreshes, never on single samples.
+"""
+import sys
+import time
+from collections import namedtuple
+import numpy as np
+
+SUB_BUCKET_BITS = 6  # 32 buckets per power of two
+MAX_VALUE_BITS = 40  # Values are clamped to 2**40 ns, about 18 minutes
+
+# Stages in data path order, see the hooks in serial_interface.py and gui.py
+STAGES = (
+    'framing',  # SerialInterface.read_frames: splitting a bulk read into checked frames
+    'decode',  # SerialInterface.decode_frames and read: frames to samples
+    'decode packet',  # SerialInterface.decode_packet
+    'emit',  # Reader thread handing a batch to the GUI queue and the recorder
+    'delivery',  # Age of the newest sample of a batch when the GUI takes it
+    'console',  # ezUARTApp.update_serial_text_area
+    'plot',  # ezUARTApp.update_plot
+)
+AGE_STAGES = {'delivery'}  # Stages measuring a wait rather than work
+
+ProfileRow = namedtuple('ProfileRow', [
+    'stage', 'count',
+    'mean', 'p50', 'p90', 'p99', 'max',  # Seconds
+    'busy',  # Fraction of the time since enable() or reset() spent in the stage, None for waits
+])
+
+class LatencyHistogram:
+    """Counts of nanosecond values in preallocated log-linear buckets."""
+
+    def __init__(self, sub_bucket_bits=SUB_BUCKET_BITS, max_value_bits=MAX_VALUE_BITS):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.linear = 1 << sub_bucket_bits  # Values below get a bucket each
+        self.half = self.linear >> 1  # Buckets per power of two above
+        self.max_value = (1 << max_value_bits) - 1
+        self.counts = [0] * (self.index(self.max_value) + 1)
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def index(self, value):
+        if value < self.linear:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits
+        return self.linear + (shift - 1) * self.half + (value >> shift) - self.half
+
+    def lowest(self, index):
+        """Smallest value counted in bucket index."""
+        if index < self.linear:
+            return index
+        shift, offset = divmod(index - self.linear, self.half)
+        return (self.half + offset) << (shift + 1)
+
+    def record(self, value):
+        value = min(max(int(value), 0), self.max_value)
+        self.counts[self.index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentiles(self, percents):
+        """Values at or below which the given percents of the recorded values fall, bucket upper bounds."""
+        if not self.count:
+            return [0] * len(percents)
+        cumulative = np.cumsum(self.counts)
+        ranks = np.maximum(np.ceil(np.asarray(percents, dtype=float) / 100 * self.count), 1)
+        indices = np.searchsorted(cumulative, ranks)
+        return [min(self.lowest(int(index) + 1) - 1, self.max) for index in indices]
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+def profiling_off():
+    return 0
+
+class Profiler:
+    def __init__(self, stages=STAGES):
+        self.histograms = {stage: LatencyHistogram() for stage in stages}
+        self.enabled = False
+        self.clock = profiling_off  # time.perf_counter_ns while enabled
+        self.started = time.perf_counter_ns()  # Start of the current profile
+
+    def enable(self):
+        if not self.enabled:
+            self.reset()
+        self.enabled = True
+        self.clock = time.perf_counter_ns
+
+    def disable(self):
+        self.enabled = False
+        self.clock = profiling_off
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.reset()
+        self.started = time.perf_counter_ns()
+
+    def record(self, stage, started):
+        """Record the time since started, a clock() reading, unless it was taken with profiling off."""
+        if started:
+            self.histograms[stage].record(time.perf_counter_ns() - started)
+
+    def record_value(self, stage, nanoseconds):
+        if self.enabled:
+            self.histograms[stage].record(nanoseconds)
+
+    def rows(self):
+        """A ProfileRow per stage."""
+        elapsed = max(time.perf_counter_ns() - self.started, 1)
+        rows = []
+        for stage, histogram in self.histograms.items():
+            p50, p90, p99 = histogram.percentiles((50, 90, 99))
+            rows.append(ProfileRow(stage, histogram.count, histogram.mean() / 1e9, p50 / 1e9, p90 / 1e9, p99 / 1e9,
+                                   histogram.max / 1e9, None if stage in AGE_STAGES else histogram.total / elapsed))
+        return rows
+
+    def report(self):
+        """The profile as a text table, times in microseconds."""
+        lines = [f"{'stage':<14}{'count':>10}{'mean':>10}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}{'busy':>8}"]
+        for row in self.rows():
+            busy = "-" if row.busy is None else f"{row.busy:.1%}"
+            lines.append(f"{row.stage:<14}{row.count:>10}" + "".join(
+                f"{value * 1e6:>10.1f}" for value in (row.mean, row.p50, row.p90, row.p99, row.max)) + f"{busy:>8}")
+        return "\n".join(lines)
+
+    def dump(self, filename='-'):
+        """Write the report to filename, or to stdout for '-'."""
+        if filename == '-':
+            print(self.report(), file=sys.stdout)
+            return
+        with open(filename, 'w') as file:
+            file.write(self.report() + "\n")
+
+profiler = Profiler()  # Shared by the whole application
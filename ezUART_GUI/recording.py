@@ -0,0 +1,222 @@
+"""Append-only binary recordings of decoded samples and raw frames.
+
+File layout (little-endian):
+
+    header   MAGIC, u8 version, u32 schema length, schema JSON (the variable database)
+    blocks   BLOCK_HEADER followed by its payload, appended while recording
+    index    one INDEX_DTYPE entry per block, written on close
+    trailer  u64 index offset, u32 index entries, INDEX_MAGIC
+
+Sample blocks are arrays of SAMPLE_DTYPE records (version 1 files have no
+source field). Frame blocks hold the frame timestamps, count + 1 offsets
+and the concatenated frames. The index keeps the time span and file offset
+of every block, so a memory-mapped recording is seeked by binary search on
+the index and then on the block.
+A recording that was not closed has no index; it is rebuilt by hopping
+from block header to block header.
+"""
+import json
+import mmap
+import struct
+import numpy as np
+from database import Database, Variable, compile_decoders
+
+MAGIC = b'EZUREC\x00'  # File magic, followed by the format version byte
+VERSION = 2
+INDEX_MAGIC = b'EZIX'
+BLOCK_MAGIC = b'EZBK'
+SCHEMA_LENGTH = struct.Struct('<I')
+BLOCK_HEADER = struct.Struct('<4sB3xIddQ')  # Magic, kind, count, first/last timestamp, payload size
+TRAILER = struct.Struct('<QI4s')
+
+SAMPLES = 0  # Block kinds
+FRAMES = 1
+
+SAMPLE_DTYPE = np.dtype([('var_id', '<u2'), ('value', '<f8'), ('timestamp', '<f8'), ('source', 'u1')])
+SAMPLE_DTYPES = {  # Sample record layout of each format version
+    1: np.dtype([('var_id', '<u2'), ('value', '<f8'), ('timestamp', '<f8')]),
+    2: SAMPLE_DTYPE,
+}
+INDEX_DTYPE = np.dtype([('first', '<f8'), ('last', '<f8'), ('offset', '<u8'), ('count', '<u4'), ('kind', 'u1')])
+BLOCK_SIZE = 8192  # Default records per block
+
+
+class RecordingWriter:
+    """Write samples and raw frames to a recording, one block every block_size records."""
+
+    def __init__(self, filename, database=None, block_size=BLOCK_SIZE):
+        self.filename = filename
+        self.block_size = block_size
+        self.file = open(filename, mode='wb')
+        self.index = []
+        self.pending_samples = []
+        self.pending_frames = []  # (timestamp, frame) pairs
+
+        variables = database.get_variables() if database is not None else []
+        schema = json.dumps({'variables': [
+            {'id': var.var_id, 'name': var.name, 'speed': var.speed, 'baud_rate': var.baud_rate, 'type': var.data_type,
+             'scale': var.scale, 'offset': var.offset, 'delta': var.delta}
+            for var in variables
+        ]}).encode('utf-8')
+        self.file.write(MAGIC + bytes((VERSION,)) + SCHEMA_LENGTH.pack(len(schema)) + schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_samples(self, samples):
+        """Queue decoded Samples, writing full blocks as they fill up."""
+        self.pending_samples += samples
+        if len(self.pending_samples) >= self.block_size:
+            self.flush_samples()
+
+    def add_frames(self, frames, timestamp):
+        """Queue raw frames received together at timestamp."""
+        self.pending_frames += [(timestamp, frame) for frame in frames]
+        if len(self.pending_frames) >= self.block_size:
+            self.flush_frames()
+
+    def flush_samples(self):
+        if self.pending_samples:
+            records = np.array(self.pending_samples, dtype=SAMPLE_DTYPE)
+            self.pending_samples = []
+            self.write_block(SAMPLES, records['timestamp'], records.tobytes())
+
+    def flush_frames(self):
+        if self.pending_frames:
+            timestamps = np.array([timestamp for timestamp, _ in self.pending_frames], dtype='<f8')
+            frames = [frame for _, frame in self.pending_frames]
+            offsets = np.zeros(len(frames) + 1, dtype='<u4')
+            np.cumsum([len(frame) for frame in frames], out=offsets[1:])
+            self.pending_frames = []
+            self.write_block(FRAMES, timestamps, timestamps.tobytes() + offsets.tobytes() + b"".join(frames))
+
+    def write_block(self, kind, timestamps, payload):
+        offset = self.file.tell()
+        first, last = float(timestamps[0]), float(timestamps[-1])
+        self.file.write(BLOCK_HEADER.pack(BLOCK_MAGIC, kind, len(timestamps), first, last, len(payload)))
+        self.file.write(payload)
+        self.index.append((first, last, offset, len(timestamps), kind))
+
+    def close(self):
+        """Write the pending blocks, the index and the trailer."""
+        if self.file.closed:
+            return
+        self.flush_samples()
+        self.flush_frames()
+        index_offset = self.file.tell()
+        self.file.write(np.array(self.index, dtype=INDEX_DTYPE).tobytes())
+        self.file.write(TRAILER.pack(index_offset, len(self.index), INDEX_MAGIC))
+        self.file.close()
+
+
+class Recording:
+    """Memory-mapped, read-only view of a recording.
+
+    Provides get_variables(), get_variable_types() and compile() like
+    Database, so a SerialInterface can decode its frames with the recorded
+    schema.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, mode='rb') as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mmap[:len(MAGIC)] != MAGIC or self.mmap[len(MAGIC)] not in SAMPLE_DTYPES:
+            raise ValueError(f"{filename} is not a supported ezUART recording")
+        self.version = self.mmap[len(MAGIC)]
+        self.sample_dtype = SAMPLE_DTYPES[self.version]
+        (schema_length,) = SCHEMA_LENGTH.unpack_from(self.mmap, len(MAGIC) + 1)
+        data_start = len(MAGIC) + 1 + SCHEMA_LENGTH.size
+        self.schema = json.loads(self.mmap[data_start:data_start + schema_length].decode('utf-8'))
+        self.data_start = data_start + schema_length
+        self.index = self.read_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Unmap the file, views returned by sample_blocks() must be released first."""
+        self.mmap.close()
+
+    def get_variables(self):
+        return [Variable(var['name'], var['baud_rate'], var['type'], var['id'], var.get('speed'),
+                         struct.calcsize(Database.TYPE_FORMATS.get(var['type'], '<f')),
+                         var.get('scale', 1.0), var.get('offset', 0.0), var.get('delta', False))
+                for var in self.schema['variables']]
+
+    def get_variable_types(self):
+        return {var['id']: var['type'] for var in self.schema['variables']}
+
+    def compile(self):
+        return compile_decoders(self.get_variables())
+
+    def read_index(self):
+        """Load the block index from the trailer, or rebuild it if the recording was not closed."""
+        size = len(self.mmap)
+        if size >= self.data_start + TRAILER.size:
+            index_offset, count, magic = TRAILER.unpack_from(self.mmap, size - TRAILER.size)
+            if magic == INDEX_MAGIC:
+                return np.frombuffer(self.mmap, dtype=INDEX_DTYPE, count=count, offset=index_offset).copy()
+
+        entries = []
+        offset = self.data_start
+        while offset + BLOCK_HEADER.size <= size:
+            magic, kind, count, first, last, payload_size = BLOCK_HEADER.unpack_from(self.mmap, offset)
+            if magic != BLOCK_MAGIC or offset + BLOCK_HEADER.size + payload_size > size:
+                break  # Torn last block
+            entries.append((first, last, offset, count, kind))
+            offset += BLOCK_HEADER.size + payload_size
+        return np.array(entries, dtype=INDEX_DTYPE)
+
+    def time_range(self):
+        """(first, last) timestamp of the recording, or None if it is empty."""
+        if not len(self.index):
+            return None
+        return float(self.index['first'].min()), float(self.index['last'].max())
+
+    def blocks(self, kind, start=None, end=None):
+        """Index entries of the blocks of one kind overlapping [start, end], found by binary search."""
+        entries = self.index[self.index['kind'] == kind]
+        if start is not None:
+            entries = entries[np.searchsorted(entries['last'], start, side='left'):]
+        if end is not None:
+            entries = entries[:np.searchsorted(entries['first'], end, side='right')]
+        return entries
+
+    def sample_blocks(self, start=None, end=None):
+        """Yield zero-copy sample record arrays covering [start, end], block by block."""
+        for entry in self.blocks(SAMPLES, start, end):
+            records = np.frombuffer(self.mmap, dtype=self.sample_dtype, count=int(entry['count']),
+                                    offset=int(entry['offset']) + BLOCK_HEADER.size)
+            yield records[self.clip(records['timestamp'], start, end)]
+
+    def samples(self, start=None, end=None):
+        """Return the samples in [start, end] as one record array (SAMPLE_DTYPES of the version)."""
+        blocks = list(self.sample_blocks(start, end))
+        return np.concatenate(blocks) if blocks else np.empty(0, dtype=self.sample_dtype)
+
+    def frames(self, start=None, end=None):
+        """Yield (timestamp, frame) for the raw frames in [start, end]."""
+        for entry in self.blocks(FRAMES, start, end):
+            count = int(entry['count'])
+            offset = int(entry['offset']) + BLOCK_HEADER.size
+            timestamps = np.frombuffer(self.mmap, dtype='<f8', count=count, offset=offset)
+            offset += timestamps.nbytes
+            offsets = np.frombuffer(self.mmap, dtype='<u4', count=count + 1, offset=offset)
+            offset += offsets.nbytes
+            selected = self.clip(timestamps, start, end)
+            for i in range(selected.start, selected.stop):
+                yield float(timestamps[i]), self.mmap[offset + offsets[i]:offset + offsets[i + 1]]
+
+    @staticmethod
+    def clip(timestamps, start, end):
+        """Slice of the sorted timestamps inside [start, end]."""
+        first = 0 if start is None else int(np.searchsorted(timestamps, start, side='left'))
+        last = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, side='right'))
+        return slice(first, last)
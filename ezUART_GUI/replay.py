@@ -0,0 +1,225 @@
+"""Replay recordings through the live receive pipeline.
+
+Frames (or samples re-encoded into frames) are written with their
+original timing, scaled by a speed factor, either into an in-process
+FakeSerialPort attached to a SerialInterface or into a pseudo-terminal
+that the GUI or capture.py connect to like real hardware:
+
+    python replay.py run.ezrec --speed 10          # in-process, reports speedup
+    python replay.py run.ezrec --speed 1 --pty     # prints a /dev/pts/N to connect to
+    python replay.py run.ezrec --start 10 --end 20 # seconds from the start, like export.py
+"""
+import argparse
+import os
+import threading
+import time
+import numpy as np
+from serial_interface import SerialInterface, PROTOCOL_VERSIONS, DEFAULT_PROTOCOL
+from recording import Recording, FRAMES
+
+MAX_VALUES_PER_FRAME = 51  # 5 bytes per value within a 255 byte payload
+
+
+class FakeSerialPort:
+    """In-process stand-in for serial.Serial, fed with inject() by a Replayer."""
+
+    def __init__(self, timeout=1):
+        self.timeout = timeout
+        self.is_open = True
+        self.rx = bytearray()  # Device to host bytes waiting to be read
+        self.tx = bytearray()  # Host to device bytes written by the application
+        self.condition = threading.Condition()
+
+    @property
+    def in_waiting(self):
+        return len(self.rx)
+
+    def inject(self, data):
+        """Make data available to read(), as if the device had sent it."""
+        with self.condition:
+            self.rx += data
+            self.condition.notify()
+
+    def read(self, size=1):
+        with self.condition:
+            self.condition.wait_for(lambda: self.rx or not self.is_open, self.timeout)
+            data = bytes(self.rx[:size])
+            del self.rx[:size]
+            return data
+
+    def write(self, data):
+        self.tx += data
+        return len(data)
+
+    def close(self):
+        with self.condition:
+            self.is_open = False
+            self.condition.notify_all()
+
+
+class PtyPort:
+    """Master side of a pseudo-terminal, the slave path behaves like a serial device."""
+
+    def __init__(self):
+        import tty  # POSIX only
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.name = os.ttyname(self.slave)
+
+    def inject(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.master, view):]
+
+    def close(self):
+        os.close(self.master)
+        os.close(self.slave)
+
+
+class Replayer:
+    """Write the frames of a recording into a port with their recorded pacing.
+
+    speed scales the recorded timing (2 replays twice as fast as it was
+    recorded), a speed of 0 replays as fast as possible. Frames are sent
+    with the given wire protocol version.
+    """
+
+    def __init__(self, recording, port, speed=1.0, protocol=DEFAULT_PROTOCOL):
+        self.recording = recording
+        self.port = port
+        self.speed = speed
+        self.encoder = SerialInterface(protocol)
+        self.encoder.load_database(recording)
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.elapsed = 0.0  # Wall time spent replaying
+        self.duration = 0.0  # Recorded time replayed
+        self.running = False
+        self.stopping = threading.Event()  # Set by stop(), also cuts short the wait for the next frame
+        self.thread = None
+
+    def chunks(self, start=None, end=None):
+        """Yield (timestamp, frames) for every group of frames received together."""
+        if len(self.recording.blocks(FRAMES, start, end)):
+            timestamp, frames = None, []
+            for frame_timestamp, frame in self.recording.frames(start, end):
+                if frame_timestamp != timestamp and frames:
+                    yield timestamp, frames
+                    frames = []
+                timestamp = frame_timestamp
+                frames.append(frame)
+            if frames:
+                yield timestamp, frames
+            return
+
+        # Sample recording, rebuild one frame per group of samples sharing a timestamp
+        for records in self.recording.sample_blocks(start, end):
+            timestamps = records['timestamp']
+            bounds = np.flatnonzero(np.diff(timestamps)) + 1
+            for group in np.split(records, bounds):
+                values = list(zip(group['var_id'].tolist(), group['value'].tolist()))
+                frames = [self.encoder.encode_frame(values[i:i + MAX_VALUES_PER_FRAME])
+                          for i in range(0, len(values), MAX_VALUES_PER_FRAME)]
+                yield float(group['timestamp'][0]), frames
+
+    def run(self, start=None, end=None):
+        """Replay [start, end] of the recording, blocking until done or stopped."""
+        self.running = True
+        started = time.perf_counter()
+        first = None
+        for timestamp, frames in self.chunks(start, end):
+            if self.stopping.is_set():
+                break
+            if first is None:
+                first = timestamp
+            if self.speed:
+                delay = started + (timestamp - first) / self.speed - time.perf_counter()
+                if delay > 0 and self.stopping.wait(delay):
+                    break
+            data = b"".join(map(self.encoder.wrap_frame, frames))
+            self.port.inject(data)
+            self.frames_sent += len(frames)
+            self.bytes_sent += len(data)
+            self.duration = timestamp - first
+        self.elapsed = time.perf_counter() - started
+        self.running = False
+
+    def start(self, start=None, end=None):
+        """Replay in a background thread."""
+        self.running = True
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, args=(start, end), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+
+
+def replay_in_process(recording, speed, start=None, end=None, protocol=DEFAULT_PROTOCOL):
+    """Replay through a SerialInterface in this process and report how fast it decoded."""
+    port = FakeSerialPort(timeout=0.1)
+    interface = SerialInterface(protocol)
+    interface.load_database(recording)
+    interface.attach(port)
+    replayer = Replayer(recording, port, speed, protocol)
+
+    samples = 0
+    elapsed = None
+    started = time.perf_counter()
+    replayer.start(start, end)
+    while True:
+        batch = interface.read_samples()
+        samples += len(batch)
+        # Done once everything sent was read and a read found nothing for a whole port timeout,
+        # rejected frames and command replies never show up in frames_received
+        if not replayer.running and not port.in_waiting:
+            if elapsed is None:
+                elapsed = time.perf_counter() - started  # Not counting the wait for that last empty read
+            if not batch:
+                break
+
+    print(f"Decoded {interface.frames_received} frames, {samples} samples "
+          f"({interface.bytes_skipped} bytes skipped) in {elapsed:.3f} s")
+    if elapsed > 0:
+        print(f"{interface.frames_received / elapsed:.0f} frames/s, "
+              f"{replayer.duration / elapsed:.1f}x real time")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay an ezUART recording as if it came from hardware.")
+    parser.add_argument('recording', help="Recording file (.ezrec)")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="Replay speed factor, 0 replays as fast as possible")
+    parser.add_argument('--pty', action='store_true', help="Replay into a pseudo-terminal instead of in-process")
+    parser.add_argument('--protocol', type=int, choices=PROTOCOL_VERSIONS, default=DEFAULT_PROTOCOL,
+                        help="Wire protocol version")
+    parser.add_argument('--start', type=float, help="Seconds from the start of the recording")
+    parser.add_argument('--end', type=float, help="Seconds from the start of the recording")
+    args = parser.parse_args()
+
+    with Recording(args.recording) as recording:
+        time_range = recording.time_range()
+        first = time_range[0] if time_range else 0.0
+        start = None if args.start is None else first + args.start
+        end = None if args.end is None else first + args.end
+        if not args.pty:
+            replay_in_process(recording, args.speed, start, end, args.protocol)
+            return
+        port = PtyPort()
+        print(f"Replaying on {port.name}, connect to it then press Enter")
+        input()
+        replayer = Replayer(recording, port, args.speed, args.protocol)
+        try:
+            replayer.run(start, end)
+            print(f"Sent {replayer.frames_sent} frames in {replayer.elapsed:.3f} s, press Ctrl+C to close")
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            port.close()
+
+if __name__ == "__main__":
+    main()
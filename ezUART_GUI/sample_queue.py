@@ -0,0 +1,44 @@
+import threading
+
+class SampleQueue:
+    """Double-buffered hand-off of decoded samples from a reader thread to the GUI.
+
+    The reader appends whole sample lists with put(), the GUI swaps out at
+    most max_batch_size samples per tick with take(). Once max_depth samples
+    are pending the oldest ones are dropped and counted.
+    """
+
+    def __init__(self, max_batch_size=5000, max_depth=1000000):
+        self.max_batch_size = max_batch_size
+        self.max_depth = max_depth
+        self.lock = threading.Lock()
+        self.pending = []
+        self.dropped = 0
+
+    def put(self, samples):
+        """Queue a list of samples (reader thread)."""
+        with self.lock:
+            self.pending += samples
+            overflow = len(self.pending) - self.max_depth
+            if overflow > 0:
+                del self.pending[:overflow]
+                self.dropped += overflow
+
+    def take(self):
+        """Return the next batch of at most max_batch_size samples (GUI thread)."""
+        with self.lock:
+            if len(self.pending) <= self.max_batch_size:
+                batch, self.pending = self.pending, []
+            else:
+                batch = self.pending[:self.max_batch_size]
+                del self.pending[:self.max_batch_size]
+            return batch
+
+    def depth(self):
+        """Number of samples waiting to be taken."""
+        return len(self.pending)
+
+    def clear(self):
+        with self.lock:
+            self.pending = []
+            self.dropped = 0
@@ -0,0 +1,109 @@
+import numpy as np
+
+class RingBuffer:
+    """Fixed-depth circular buffer of timestamps and values backed by preallocated NumPy arrays.
+
+    Every sample is written twice, at its position and depth slots further,
+    so the latest samples are always one contiguous slice: appends are O(1)
+    and view() never copies.
+    """
+
+    def __init__(self, depth, dtype=np.float64):
+        self.depth = depth
+        self.timestamps = np.zeros(2 * depth, dtype=np.float64)
+        self.values = np.zeros(2 * depth, dtype=dtype)
+        self.position = 0  # Next slot to write, in [0, depth)
+        self.count = 0  # Number of valid samples, up to depth
+        self.version = 0  # Incremented on every write, lets readers skip unchanged buffers
+
+    def append(self, timestamp, value):
+        """Append a single sample."""
+        position = self.position
+        self.timestamps[position] = self.timestamps[position + self.depth] = timestamp
+        self.values[position] = self.values[position + self.depth] = value
+        self.position = (position + 1) % self.depth
+        self.count = min(self.count + 1, self.depth)
+        self.version += 1
+
+    def extend(self, timestamps, values):
+        """Append a batch of samples with at most four slice assignments per array."""
+        timestamps = np.asarray(timestamps)[-self.depth:]
+        values = np.asarray(values)[-self.depth:]
+        n = len(values)
+        if n == 0:
+            return
+        self._write(self.timestamps, timestamps)
+        self._write(self.values, values)
+        self.position = (self.position + n) % self.depth
+        self.count = min(self.count + n, self.depth)
+        self.version += 1
+
+    def _write(self, array, data):
+        depth = self.depth
+        start = self.position
+        first = min(len(data), depth - start)
+        array[start:start + first] = data[:first]
+        array[start + depth:start + depth + first] = data[:first]
+        rest = len(data) - first
+        if rest:
+            array[:rest] = data[first:]
+            array[depth:depth + rest] = data[first:]
+
+    def view(self):
+        """Return (timestamps, values) of the stored samples, oldest first, without copying."""
+        end = self.position + self.depth
+        start = end - self.count
+        return self.timestamps[start:end], self.values[start:end]
+
+    def clear(self):
+        self.position = 0
+        self.count = 0
+        self.version += 1
+
+
+class SampleStore:
+    """One RingBuffer per (source, variable ID) key, holding the plot history of every variable."""
+
+    def __init__(self, keys=(), depth=100000):
+        self.depth = depth
+        self.buffers = {}
+        for key in keys:
+            self.buffer(key)
+
+    def buffer(self, key):
+        """Return the buffer of a (source, var_id) key, creating it for variables seen first."""
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            buffer = self.buffers[key] = RingBuffer(self.depth)
+        return buffer
+
+    def add_samples(self, samples):
+        """Store a batch of Samples, grouped per variable and appended with one extend each."""
+        grouped = {}
+        for sample in samples:
+            key = (sample.source, sample.var_id)
+            group = grouped.get(key)
+            if group is None:
+                group = grouped[key] = ([], [])
+            group[0].append(sample.timestamp)
+            group[1].append(sample.value)
+        for key, (timestamps, values) in grouped.items():
+            self.buffer(key).extend(timestamps, values)
+
+    def add_columns(self, timestamps, columns, source=0):
+        """Store the value columns of a decoded Batch."""
+        for var_id, values in columns.items():
+            self.buffer((source, var_id)).extend(timestamps, values)
+
+    def add_records(self, records):
+        """Store an array of recorded samples (recording.SAMPLE_DTYPES)."""
+        keys = records['var_id'].astype(np.uint32)
+        if 'source' in records.dtype.names:
+            keys |= records['source'].astype(np.uint32) << 16
+        for key in np.unique(keys):
+            selected = records[keys == key]
+            self.buffer((int(key) >> 16, int(key) & 0xFFFF)).extend(selected['timestamp'], selected['value'])
+
+    def clear(self):
+        for buffer in self.buffers.values():
+            buffer.clear()
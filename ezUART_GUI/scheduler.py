@@ -0,0 +1,182 @@
+"""Transmission scheduler for periodic messages sharing one UART line.
+
+Schedules one hyperperiod of messages rate-monotonically (highest frequency
+first) on a timeline of byte slots, the time one byte takes on the wire. A
+message instance is released at the start of its period, must be sent
+before the next one and is split into chunks, each carrying its own
+overhead, to fill the free gaps left by faster messages.
+
+Free time is kept as sorted arrays of [start, end) slot intervals. The
+windows of the instances of one message never overlap, so a whole message
+is placed at once: one searchsorted finds the first gap of every instance,
+instances fitting in it are placed together and only the others are split
+gap by gap. The chunks are then cut out of the free intervals by sorting
+their bounds together, nothing is shifted per chunk. Gaps are kept as long
+as they can carry a last chunk of one payload byte. This replaces
+etc/chunking.py, which re-sorted the busy list and rescanned it from the
+start for every instance.
+
+    from scheduler import Message, schedule_messages, print_report
+    print_report(schedule_messages([Message('M1', 4, 500), Message('M2', 50, 31)], 115200))
+"""
+from collections import namedtuple
+from fractions import Fraction
+from functools import partial, reduce
+from math import floor, gcd, lcm
+import numpy as np
+from bandwidth import BITS_PER_BYTE, FRAME_OVERHEADS, DEFAULT_PROTOCOL
+
+PAYLOAD_MULTIPLE = 5  # One (ID, 4-byte value) pair
+MAX_HORIZON = 10.0  # Longest timeline scheduled when the hyperperiod is longer (seconds)
+MAX_DENOMINATOR = 1000  # Frequencies are rounded to fractions with at most this denominator
+
+Message = namedtuple('Message', ['id', 'size', 'frequency'])  # Payload bytes per instance, Hz
+Chunk = namedtuple('Chunk', ['start', 'end', 'message_id', 'instance', 'payload'])  # Seconds, payload bytes
+MessageReport = namedtuple('MessageReport', ['id', 'instances', 'missed', 'missing_bytes', 'worst_latency', 'utilization'])
+Schedule = namedtuple('Schedule', ['chunks', 'reports', 'utilization', 'horizon'])
+
+def frequency_fraction(frequency):
+    return Fraction(frequency).limit_denominator(MAX_DENOMINATOR)
+
+def hyperperiod(frequencies):
+    """Shortest time after which every message period repeats, i.e. 1 / gcd(frequencies), in seconds."""
+    fractions = [frequency_fraction(frequency) for frequency in frequencies]
+    numerator = reduce(gcd, (fraction.numerator for fraction in fractions))
+    denominator = reduce(lcm, (fraction.denominator for fraction in fractions))
+    return Fraction(denominator, numerator)
+
+def schedule_messages(messages, baud_rate, bits_per_byte=BITS_PER_BYTE,
+                      overhead_bytes=FRAME_OVERHEADS[DEFAULT_PROTOCOL], min_payload_multiple=PAYLOAD_MULTIPLE,
+                      horizon=None):
+    """Schedule every instance of the messages over horizon seconds (default: one hyperperiod).
+
+    Chunk payloads are multiples of min_payload_multiple, except for the last
+    chunk of an instance. Returns a Schedule with the chunks sorted by start
+    time, a MessageReport per message with its worst-case latency (release
+    to last byte, seconds) and the share of the line it uses, and the total
+    line utilization.
+    """
+    messages = [message for message in messages if message.frequency > 0]
+    if horizon is None:
+        horizon = min(hyperperiod([message.frequency for message in messages]), MAX_HORIZON) if messages else 0
+    horizon = Fraction(horizon).limit_denominator(MAX_DENOMINATOR)
+    slot_rate = Fraction(baud_rate, bits_per_byte)  # Byte slots per second
+    horizon_slots = floor(horizon * slot_rate)
+    slot_time = 1 / float(slot_rate)
+
+    free_starts = np.array([0], dtype=np.int64)  # Free intervals, sorted and disjoint
+    free_ends = np.array([horizon_slots], dtype=np.int64)
+    placed = []  # (starts, ends, message_id, instances, payloads) arrays per message
+    reports = []
+    busy_total = 0
+
+    for message in sorted(messages, key=lambda message: message.frequency, reverse=True):
+        frequency = frequency_fraction(message.frequency)
+        # Period in slots is period_numerator / period_denominator, kept exact with integers
+        period_numerator = slot_rate.numerator * frequency.denominator
+        period_denominator = slot_rate.denominator * frequency.numerator
+        count = floor(horizon * frequency)
+        instances = np.arange(count, dtype=np.int64)
+        releases = -(-instances * period_numerator // period_denominator)
+        deadlines = np.minimum((instances + 1) * period_numerator // period_denominator, horizon_slots)
+
+        # First free interval ending after each release, most instances fit in it whole
+        gaps = np.searchsorted(free_ends, releases, side='right')
+        fits = gaps < len(free_ends)
+        starts = releases
+        if len(free_ends):
+            first = np.minimum(gaps, len(free_ends) - 1)
+            starts = np.maximum(free_starts[first], releases)
+            fits &= np.minimum(free_ends[first], deadlines) - starts >= message.size + overhead_bytes
+        chunk_starts = [starts[fits]]
+        chunk_ends = [chunk_starts[0] + message.size + overhead_bytes]
+        chunk_instances = [instances[fits]]
+        chunk_payloads = [np.full(len(chunk_starts[0]), message.size, dtype=np.int64)]
+        latencies = chunk_ends[0] - releases[fits]
+        worst = int(latencies.max()) if len(latencies) else 0
+        missed = missing_bytes = 0
+
+        # The others are split over the gaps of their window, which no other instance uses
+        split = np.flatnonzero(~fits)
+        if len(split):
+            gap_starts, gap_ends = free_starts.tolist(), free_ends.tolist()
+            rows = []
+            for instance, release, deadline, i in zip(split.tolist(), releases[split].tolist(),
+                                                       deadlines[split].tolist(), gaps[split].tolist()):
+                remaining = message.size
+                finish = release
+                while remaining > 0 and i < len(gap_starts) and gap_starts[i] < deadline:
+                    start = max(gap_starts[i], release)
+                    available = min(gap_ends[i], deadline) - start - overhead_bytes
+                    payload = remaining if remaining <= available else available - available % min_payload_multiple
+                    if payload > 0:
+                        finish = start + payload + overhead_bytes
+                        rows.append((start, finish, instance, payload))
+                        remaining -= payload
+                    i += 1  # What is left of the gap is too short for the rest of the instance
+                if remaining > 0:
+                    missed += 1
+                    missing_bytes += remaining
+                elif finish - release > worst:
+                    worst = finish - release
+            if rows:
+                columns = np.array(rows, dtype=np.int64).T
+                chunk_starts.append(columns[0])
+                chunk_ends.append(columns[1])
+                chunk_instances.append(columns[2])
+                chunk_payloads.append(columns[3])
+
+        # Cut the chunks out of the free intervals: every chunk end starts a piece and every
+        # chunk start ends one, pieces too short to carry a byte are dropped
+        chunk_starts = np.concatenate(chunk_starts)
+        chunk_ends = np.concatenate(chunk_ends)
+        if len(chunk_starts):
+            free_starts = np.sort(np.concatenate((free_starts, chunk_ends)))
+            free_ends = np.sort(np.concatenate((free_ends, chunk_starts)))
+            keep = free_ends - free_starts > overhead_bytes
+            free_starts, free_ends = free_starts[keep], free_ends[keep]
+        placed.append((chunk_starts, chunk_ends, message.id, np.concatenate(chunk_instances),
+                       np.concatenate(chunk_payloads)))
+
+        busy = int((chunk_ends - chunk_starts).sum())
+        busy_total += busy
+        reports.append(MessageReport(message.id, count, missed, missing_bytes, worst * slot_time,
+                                     busy / horizon_slots if horizon_slots else 0.0))
+
+    chunks = []
+    if placed:
+        starts = np.concatenate([chunk[0] for chunk in placed])
+        order = np.argsort(starts, kind='stable')
+        ends = np.concatenate([chunk[1] for chunk in placed])[order]
+        message_ids = np.repeat(np.array([chunk[2] for chunk in placed], dtype=object),
+                                [len(chunk[0]) for chunk in placed])[order]
+        instances = np.concatenate([chunk[3] for chunk in placed])[order]
+        payloads = np.concatenate([chunk[4] for chunk in placed])[order]
+        chunks = list(map(partial(tuple.__new__, Chunk), zip((starts[order] * slot_time).tolist(),
+                                                             (ends * slot_time).tolist(), message_ids.tolist(),
+                                                             instances.tolist(), payloads.tolist())))
+    utilization = busy_total / horizon_slots if horizon_slots else 0.0
+    return Schedule(chunks, reports, utilization, float(horizon))
+
+def print_report(schedule):
+    print(f"Horizon {schedule.horizon:.6f} s, {len(schedule.chunks)} chunks, line utilization {schedule.utilization:.1%}")
+    for report in schedule.reports:
+        status = f"MISSED {report.missed} ({report.missing_bytes} B)" if report.missed else "ok"
+        print(f"  {report.id}: {report.instances} instances, worst latency {report.worst_latency * 1e3:.3f} ms, "
+              f"utilization {report.utilization:.1%}, {status}")
+
+def plot_schedule(schedule):
+    """Plot the chunks as horizontal bars on a timeline, one row per message (needs matplotlib)."""
+    import matplotlib.pyplot as plt
+
+    message_ids = [report.id for report in schedule.reports]
+    rows = {message_id: row for row, message_id in enumerate(message_ids)}
+    plt.figure(figsize=(12, 6))
+    for chunk in schedule.chunks:
+        plt.hlines(rows[chunk.message_id], chunk.start, chunk.end, colors=f'C{rows[chunk.message_id] % 10}', lw=6)
+    plt.xlabel("Time (s)")
+    plt.title(f"Scheduled transmissions ({schedule.utilization:.1%} line utilization)")
+    plt.xlim(0, schedule.horizon)
+    plt.yticks(range(len(message_ids)), message_ids)
+    plt.grid(True)
+    plt.show()
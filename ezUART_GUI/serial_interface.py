@@ -1,11 +1,97 @@
 import serial
 import serial.tools.list_ports
+from binascii import crc_hqx
 import struct
+import time
+from collections import namedtuple
+from itertools import compress
+import numpy as np
+from database import (Database, compile_decoders, COMPACT_ID, KEYFRAME_FLAG, COMPACT_HEADER_SIZE, KEYFRAME_INTERVAL,
+                      DELTA_TYPE, COMMAND_ID, SEQUENCE_ID, TIMESTAMP_ID, SEQUENCE_SIZE, TIMESTAMP_SIZE)
+from link_stats import LinkStats
+from profiling import profiler
+
+SOF = b'\xAA'  # Start of frame
+EOF = b'\x55'  # End of frame
+FRAME_OVERHEAD = 3  # SOF + payload size + EOF
+
+# Protocol 1 sends frames as they are: SOF, payload size, payload, EOF.
+# Protocol 2 COBS-encodes payload size, payload and CRC-16 so the only zero
+# byte on the wire is the delimiter ending each frame. Payloads can no longer
+# fake a frame boundary and the receiver resyncs at the next delimiter.
+PROTOCOL_VERSIONS = (1, 2)
+DEFAULT_PROTOCOL = 1
+DELIMITER = b'\x00'  # Protocol 2 end of frame
+CRC_INIT = 0xFFFF  # CRC-16/CCITT-FALSE, computed over payload size and payload
+CRC_SIZE = 2
+MAX_ENCODED_SIZE = 1 + 255 + CRC_SIZE + 2  # Size byte, payload, CRC and COBS overhead
+READ_CHUNK_SIZE = 65536  # Maximum bytes drained from the port per read
+DELTA_DECODER = struct.Struct(Database.TYPE_FORMATS[DELTA_TYPE])
+DELTA_RANGE = (-128, 127)
+UINT_MODULUS = 1 << 32  # uint deltas wrap around
+BATCH_MIN_FRAMES = 32  # Frames of one layout in a read worth a vectorized decode, fewer are decoded one by one
+
+# One decoded value: variable ID, numeric value, host receive time (seconds since epoch)
+# and the source (port) it came from, 0 for a single connection
+Sample = namedtuple('Sample', ['var_id', 'value', 'timestamp', 'source'], defaults=(0,))
+
+# Result of a batch decode: per-frame timestamps and value columns keyed by variable ID
+# for frames matching the layout, plus scalar Samples for the frames that did not
+Batch = namedtuple('Batch', ['timestamps', 'columns', 'samples'])
+
+def cobs_encode(data):
+    """Consistent Overhead Byte Stuffing: remove every zero byte from data."""
+    encoded = bytearray()
+    for block in data.split(b'\x00'):
+        # Runs of 254 non-zero bytes get a 0xFF code that implies no zero
+        while len(block) >= 0xFE:
+            encoded.append(0xFF)
+            encoded += block[:0xFE]
+            block = block[0xFE:]
+        encoded.append(len(block) + 1)
+        encoded += block
+    return bytes(encoded)
+
+def cobs_decode(data):
+    """Inverse of cobs_encode, raises ValueError on malformed input."""
+    decoded = bytearray()
+    index = 0
+    end = len(data)
+    while index < end:
+        code = data[index]
+        if code == 0 or index + code > end:
+            raise ValueError("Invalid COBS block")
+        decoded += data[index + 1:index + code]
+        index += code
+        if code != 0xFF and index < end:
+            decoded.append(0)
+    return bytes(decoded)
 
 class SerialInterface:
-    def __init__(self):
+    def __init__(self, protocol=DEFAULT_PROTOCOL):
+        if protocol not in PROTOCOL_VERSIONS:
+            raise ValueError(f"Unsupported protocol version: {protocol}")
+        self.protocol = protocol  # Wire protocol version
+        self.source = 0  # Source ID given to the decoded samples
         self.serial_port = None
         self.buffer = bytearray()  # Buffer to accumulate incoming bytes
+        self.bytes_received = 0  # Raw bytes fed to the frame parser
+        self.bytes_skipped = 0  # Bytes discarded while looking for a valid frame
+        self.frames_received = 0  # Valid frames extracted
+        self.crc_errors = 0  # Protocol 2 frames rejected by COBS, size or CRC checks
+        self.format_errors = 0  # Protocol 1 frames without EOF and frames with malformed fields
+        self.stats = LinkStats(Database.RUN_RATE)  # Sequence, timestamp and decode time tracking
+        self.on_command_reply = None  # Called with every command reply frame, see CommandChannel
+        table = compile_decoders([])
+        self.decoders = table.decoders  # Variable ID -> precompiled struct.Struct
+        self.type_names = table.type_names  # Variable ID -> data type name
+        self.scales = table.scales  # Variable ID -> scale, None when sent unscaled
+        self.offsets = table.offsets  # Variable ID -> offset added after scaling
+        self.compact_frames = table.frames  # Compact frame number -> variables in frame order
+        self.compact_state = {}  # Compact frame number -> raw values last received
+        self.compact_sent = {}  # Compact frame number -> (raw values, frames until the next keyframe) of encode_compact
+        self.frame_layouts = {}  # Tuple of variable IDs -> (structured dtype, header template)
+        self.layout_keys = {}  # (frame size, first variable ID) -> tuple of variable IDs of a known layout
 
     def list_ports(self):
         """List available USB-to-UART ports."""
@@ -16,50 +102,181 @@ class SerialInterface:
     def connect(self, port, baudrate):
         """Connect to the specified serial port."""
         self.serial_port = serial.Serial(port, baudrate, timeout=1)
+        self.buffer.clear()
+        self.stats.reset()
+
+    def attach(self, port):
+        """Use an already open port object, e.g. a replay FakeSerialPort, instead of a device."""
+        self.serial_port = port
+        self.buffer.clear()
+        self.stats.reset()
 
     def disconnect(self):
         """Disconnect from the serial port."""
         if self.serial_port and self.serial_port.is_open:
             self.serial_port.close()
             self.serial_port = None
+        self.buffer.clear()
 
     def is_connected(self):
         """Check if connected to the serial port."""
         return self.serial_port is not None and self.serial_port.is_open
 
     def read(self):
-        """Read data directly from the serial port and decode packets in real time."""
+        """Read every complete frame currently available and return their decoded messages."""
         try:
-            while self.is_connected():
-                # Read one byte at a time
-                byte = self.serial_port.read(1)
-                if not byte:
-                    continue  # No data read, try again
-
-                # Look for start of frame (SOF)
-                if byte == b'\xAA':
-                    packet = byte  # Start new packet
-
-                    # Read until end of frame (EOF)
-                    while True:
-                        next_byte = self.serial_port.read(1)
-                        if not next_byte:
-                            continue  # Continue waiting for more data
-
-                        packet += next_byte
-
-                        # Check for end of frame (EOF)
-                        if next_byte == b'\x55':
-                            # Process packet now
-                            result = self.decode_packet(packet.hex())
-                            return result
-
+            frames = self.read_frames()
+            started = profiler.clock()
+            text = "".join(self.format_samples(self.decode_frame(frame)) for frame in frames)
+            profiler.record('decode', started)
+            return text
         except serial.SerialException as e:
             self.disconnect()
             return f"Serial exception occurred: {e}"
         except Exception as e:
             return f"An error occurred: {e}"
 
+    def read_frames(self):
+        """Drain the serial port in one bulk read and return all complete raw frames."""
+        if not self.is_connected():
+            return []
+        # Blocks for at most the port timeout when nothing is waiting,
+        # otherwise returns everything the driver has buffered so far
+        chunk = self.serial_port.read(min(self.serial_port.in_waiting, READ_CHUNK_SIZE) or 1)
+        if not chunk:
+            return []
+        started = profiler.clock()
+        frames = self.feed(chunk)
+        profiler.record('framing', started)
+        return frames
+
+    def feed(self, data):
+        """Append raw bytes to the receive buffer and extract every complete frame.
+
+        Incomplete frames stay in the buffer, so parsing resumes where it
+        stopped on the next call. Frames are returned as SOF, payload size,
+        payload, EOF whatever the wire protocol, with their sequence and
+        timestamp fields passed to stats and removed. Command replies go to
+        on_command_reply instead.
+        """
+        if self.protocol == 2:
+            return self.feed_cobs(data)
+        buffer = self.buffer
+        buffer += data
+        self.bytes_received += len(data)
+        frames = []
+        end = len(buffer)
+        pos = 0
+        skipped = 0
+        while True:
+            start = buffer.find(SOF, pos)
+            if start < 0:
+                skipped += end - pos
+                pos = end  # No start of frame left, drop the noise
+                break
+            skipped += start - pos
+            pos = start
+            if start + 1 >= end:
+                break  # Wait for the payload size byte
+            frame_end = start + buffer[start + 1] + FRAME_OVERHEAD
+            if frame_end > end:
+                break  # Wait for the rest of the frame
+            if buffer[frame_end - 1] != EOF[0]:
+                skipped += 1
+                self.format_errors += 1
+                pos = start + 1  # Fake SOF, resync on the next one
+                continue
+            frame = bytes(buffer[start:frame_end])
+            pos = frame_end
+            if frame_end - start > FRAME_OVERHEAD and COMMAND_ID <= frame[2] <= TIMESTAMP_ID:
+                frame = self.route_frame(frame)
+                if frame is None:
+                    continue
+            frames.append(frame)
+        del buffer[:pos]
+        self.bytes_skipped += skipped
+        self.frames_received += len(frames)
+        return frames
+
+    def feed_cobs(self, data):
+        """Protocol 2 version of feed(): split at delimiters, unstuff and check size and CRC."""
+        buffer = self.buffer
+        buffer += data
+        self.bytes_received += len(data)
+        frames = []
+        pos = 0
+        skipped = 0
+        while True:
+            end = buffer.find(DELIMITER, pos)
+            if end < 0:
+                # A frame can never be longer than this, drop what cannot be one
+                if len(buffer) - pos > MAX_ENCODED_SIZE:
+                    skipped += len(buffer) - pos
+                    pos = len(buffer)
+                break
+            encoded = buffer[pos:end]
+            pos = end + 1
+            if not encoded:
+                continue  # Idle delimiter
+            try:
+                raw = cobs_decode(encoded)
+            except ValueError:
+                raw = b''
+            if (len(raw) < 1 + CRC_SIZE or raw[0] + 1 + CRC_SIZE != len(raw)
+                    or crc_hqx(raw[:-CRC_SIZE], CRC_INIT) != int.from_bytes(raw[-CRC_SIZE:], 'little')):
+                self.crc_errors += 1
+                skipped += len(encoded) + 1
+                continue
+            frame = SOF + raw[:-CRC_SIZE] + EOF
+            if len(raw) > 1 + CRC_SIZE and COMMAND_ID <= raw[1] <= TIMESTAMP_ID:
+                frame = self.route_frame(frame)
+                if frame is None:
+                    continue
+            frames.append(frame)
+        del buffer[:pos]
+        self.bytes_skipped += skipped
+        self.frames_received += len(frames)
+        return frames
+
+    def route_frame(self, frame):
+        """Handle a frame starting with a reserved ID, returns the telemetry frame left or None."""
+        if frame[2] == COMMAND_ID:
+            if self.on_command_reply is not None:
+                self.on_command_reply(frame)
+            return None
+        return self.strip_fields(frame)
+
+    def strip_fields(self, frame):
+        """Pass the sequence and timestamp fields of a frame to stats, return the frame without them.
+
+        A sequence gap drops the compact frame state, so delta frames are
+        ignored until the next keyframe instead of building on lost ones.
+        Returns None, counting a format error, when the fields are truncated.
+        """
+        index = 2
+        end = len(frame) - 1
+        if frame[index] == SEQUENCE_ID:
+            if index + SEQUENCE_SIZE > end:
+                self.format_errors += 1
+                return None
+            if self.stats.sequence_received(frame[index + 1]):
+                self.compact_state.clear()  # Lost frames break the delta chains, wait for keyframes
+            index += SEQUENCE_SIZE
+        if index < end and frame[index] == TIMESTAMP_ID:
+            if index + TIMESTAMP_SIZE > end:
+                self.format_errors += 1
+                return None
+            self.stats.ticks_received(int.from_bytes(frame[index + 1:index + TIMESTAMP_SIZE], 'little'))
+            index += TIMESTAMP_SIZE
+        return SOF + bytes((end - index,)) + frame[index:]
+
+    def wrap_frame(self, frame):
+        """Turn a SOF/size/payload/EOF frame into the bytes sent on the wire by this protocol."""
+        if self.protocol == 1:
+            return frame
+        raw = frame[1:-1]
+        return cobs_encode(raw + crc_hqx(raw, CRC_INIT).to_bytes(CRC_SIZE, 'little')) + DELIMITER
+
     def write(self, data):
         """Write data to the serial port."""
         if self.serial_port and self.serial_port.is_open:
@@ -67,38 +284,422 @@ class SerialInterface:
 
     def decode_packet(self, hex_data):
         """Decode the received hex packet and extract variable ID and data."""
-        packet = bytes.fromhex(hex_data)
+        started = profiler.clock()
+        try:
+            packet = bytes.fromhex(hex_data)
 
-        # Validate packet start and end
-        if packet[0] != 0xAA or packet[-1] != 0x55:
-            return "Invalid packet: does not start with 0xAA or end with 0x55."
+            # Validate packet start and end
+            if packet[0] != 0xAA or packet[-1] != 0x55:
+                return "Invalid packet: does not start with 0xAA or end with 0x55."
 
-        # Payload size is in bytes (1 byte)
-        payload_size = packet[1]
-        expected_length = payload_size + 2  # Payload size + start (1 byte) + end (1 byte)
+            # Payload size is in bytes (1 byte)
+            payload_size = packet[1]
+            expected_length = payload_size + FRAME_OVERHEAD
 
-        # Check if the packet length matches the expected length
-        if len(packet) < expected_length:
-            return f"Invalid packet length: expected {expected_length}, got {len(packet)}."
+            # Check if the packet length matches the expected length
+            if len(packet) < expected_length:
+                return f"Invalid packet length: expected {expected_length}, got {len(packet)}."
 
-        index = 2  # Start after the payload size byte
-        decoded_message = ""  # Initialize the decoded message string
+            return self.format_samples(self.decode_frame(packet[:expected_length]))
+        finally:
+            profiler.record('decode packet', started)
 
-        # Process packet based on new protocol
-        while index < expected_length - 1:  # Avoid the last byte (EOF)
-            if index >= len(packet):
-                break
+    def encode_frame(self, values, sequence=None, ticks=None):
+        """Build a frame carrying (var_id, value) pairs, the inverse of decode_frame.
+
+        The optional sequence number and MCU tick count go first, as the firmware sends them.
+        """
+        payload = bytearray()
+        if sequence is not None:
+            payload += bytes((SEQUENCE_ID, sequence & 0xFF))
+        if ticks is not None:
+            payload.append(TIMESTAMP_ID)
+            payload += (ticks % (1 << 32)).to_bytes(TIMESTAMP_SIZE - 1, 'little')
+        for var_id, value in values:
+            encoder = self.decoders[var_id]
+            payload.append(var_id)
+            payload += encoder.pack(self.raw_value(var_id, value))
+        return SOF + bytes((len(payload),)) + bytes(payload) + EOF
+
+    def raw_value(self, var_id, value):
+        """Value as sent on the wire: unscaled and rounded for integer types."""
+        scale = self.scales[var_id]
+        if scale is not None:
+            value = round((value - self.offsets[var_id]) / scale)
+        return value if self.decoders[var_id].format.endswith('f') else int(value)
 
-            var_id = packet[index]  # Get the variable ID
-            index += 1
+    def encode_compact(self, number, values):
+        """Build compact frame number from a value per variable of the frame, the inverse of decode_compact.
 
-            # Decode data based on variable ID
-            if var_id == 1 or var_id == 2 :  # Data ID specified in your example
-                # Expecting a float value next
-                data_value = struct.unpack('<f', packet[index:index + 4])[0]  # Little-endian float
-                index += 4
-                decoded_message += f"ID: {var_id} | Type: float | Value: {data_value:.6f}\n"
+        Mirrors the generated firmware: a keyframe every KEYFRAME_INTERVAL
+        frames or when a delta does not fit in DELTA_TYPE, unchanged values
+        left out of delta frames.
+        """
+        members = self.compact_frames[number]
+        raw = [self.raw_value(var.var_id, value) for var, value in zip(members, values)]
+        sent, countdown = self.compact_sent.get(number, (None, 0))
+        deltas = [self.delta(var, new, old) for var, new, old in zip(members, raw, sent)] if sent is not None else []
+        keyframe = sent is None or countdown == 0 or any(
+            var.delta and not DELTA_RANGE[0] <= delta <= DELTA_RANGE[1] for var, delta in zip(members, deltas))
+
+        mask = 0
+        values_data = bytearray()
+        for i, var in enumerate(members):
+            if not keyframe and raw[i] == sent[i]:
+                continue  # Unchanged, the receiver keeps its value
+            mask |= 1 << i
+            if not keyframe and var.delta:
+                values_data += DELTA_DECODER.pack(deltas[i])
             else:
-                decoded_message += f"ID: {var_id} | Type: Unknown | Value: N/A\n"
+                values_data += self.decoders[var.var_id].pack(raw[i])
+        self.compact_sent[number] = (raw, (countdown - 1) % KEYFRAME_INTERVAL if not keyframe else KEYFRAME_INTERVAL - 1)
+        payload = (bytes((COMPACT_ID, number | (KEYFRAME_FLAG if keyframe else 0)))
+                   + mask.to_bytes((len(members) + 7) // 8, 'little') + bytes(values_data))
+        return SOF + bytes((len(payload),)) + payload + EOF
+
+    def load_database(self, database):
+        """Use the dense decoder tables compiled from the database (or a recording)."""
+        table = database.compile()
+        self.decoders = table.decoders
+        self.type_names = table.type_names
+        self.scales = table.scales
+        self.offsets = table.offsets
+        self.compact_frames = table.frames
+        if isinstance(database, Database):
+            self.stats.tick_rate = database.run_rate  # MCU ticks are run_ezUART() calls
+        self.compact_state.clear()
+        self.compact_sent.clear()
+        self.frame_layouts.clear()
+        self.layout_keys.clear()
+
+    def read_samples(self, recorder=None):
+        """Read every complete frame currently available and return their decoded samples.
+
+        If a RecordingWriter is given, the raw frames are recorded as well.
+        """
+        try:
+            frames = self.read_frames()
+        except serial.SerialException as e:
+            self.disconnect()
+            print(f"Serial exception occurred: {e}")
+            return []
+        except (TypeError, AttributeError, OSError):
+            if self.is_connected():
+                raise
+            return []  # Port closed by disconnect() from another thread while reading
+        timestamp = time.time()  # Every frame of one bulk read arrived together
+        if recorder is not None and frames:
+            recorder.add_frames(frames, timestamp)
+        return self.decode_frames(frames, timestamp)
+
+    def decode_frames(self, frames, timestamp):
+        """Decode the frames of one read, timing the decode for stats.
+
+        Frames are grouped by known layout, and compact frames by frame
+        number. Groups of at least BATCH_MIN_FRAMES frames are decoded with
+        decode_batch or decode_compact_batch, the others one by one. Every
+        variable is sent in a single layout, so its samples keep their order.
+        """
+        if not frames:
+            return []
+        started = time.perf_counter()
+        profiled = profiler.clock()
+        groups = {}
+        layout_keys = self.layout_keys
+        for frame in frames:
+            if len(frame) < 4:
+                key = None
+            elif frame[2] == COMPACT_ID:
+                key = frame[3] & ~KEYFRAME_FLAG
+            else:
+                key = layout_keys.get((len(frame), frame[2]))
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = []
+            group.append(frame)
+
+        samples = []
+        for key, group in groups.items():
+            if len(group) >= BATCH_MIN_FRAMES and key is not None:
+                if isinstance(key, int):
+                    batch = self.decode_compact_batch(group, timestamp)
+                else:
+                    batch = self.decode_batch(group, key, timestamp)
+                samples += self.batch_samples(batch, timestamp)
+                continue
+            for frame in group:
+                decoded = self.decode_frame(frame, timestamp)
+                samples += decoded
+                if key is None and decoded and frame[2] != COMPACT_ID:
+                    self.learn_layout(frame, decoded)
+        profiler.record('decode', profiled)
+        self.stats.frames_decoded(len(frames), time.perf_counter() - started, timestamp)
+        return samples
+
+    def batch_samples(self, batch, timestamp):
+        """Samples of a decoded Batch, variable by variable."""
+        source = self.source
+        samples = []
+        for var_id, values in batch.columns.items():
+            samples += [Sample(var_id, value, timestamp, source) for value in values.tolist()]
+        return samples + batch.samples
+
+    def learn_layout(self, frame, decoded):
+        """Remember the layout of a frame decoded one by one, so the next reads can batch it."""
+        var_ids = tuple(sample.var_id for sample in decoded)
+        if var_ids in self.frame_layouts:
+            return
+        if sum(1 + self.decoders[var_id].size for var_id in var_ids) + FRAME_OVERHEAD == len(frame):
+            self.frame_layout(var_ids)
+
+    def link_stats(self, queue_depth=0):
+        """LinkSnapshot of the link since the previous call, queue_depth being the samples still queued."""
+        return self.stats.snapshot(self, queue_depth)
+
+    def decode_frame(self, frame, timestamp=None):
+        """Decode one validated raw frame into a list of Sample records."""
+        if timestamp is None:
+            timestamp = time.time()
+        if len(frame) > 3 and frame[2] == COMPACT_ID:
+            return self.decode_compact(frame, timestamp)
+        decoders = self.decoders
+        scales = self.scales
+        source = self.source
+        samples = []
+        index = 2  # Start after the payload size byte
+        end = len(frame) - 1  # Avoid the last byte (EOF)
+        while index < end:
+            var_id = frame[index]
+            decoder = decoders[var_id]
+            if index + 1 + decoder.size > end:
+                break  # Truncated value
+            value = decoder.unpack_from(frame, index + 1)[0]
+            scale = scales[var_id]
+            if scale is not None:
+                value = value * scale + self.offsets[var_id]
+            samples.append(Sample(var_id, value, timestamp, source))
+            index += 1 + decoder.size
+        return samples
+
+    @staticmethod
+    def delta(var, new, old):
+        """Difference of two raw values, wrapping around like uint32 arithmetic for uint variables."""
+        if var.data_type == 'uint':
+            return (new - old + UINT_MODULUS // 2) % UINT_MODULUS - UINT_MODULUS // 2
+        return new - old
+
+    def decode_compact(self, frame, timestamp):
+        """Decode one compact frame, a sample per variable of the frame.
+
+        Delta frames received before the first keyframe of their frame number,
+        and frames not matching the database, decode to nothing.
+        """
+        number = frame[3] & ~KEYFRAME_FLAG
+        keyframe = frame[3] & KEYFRAME_FLAG
+        if number >= len(self.compact_frames):
+            return []
+        members = self.compact_frames[number]
+        state = self.compact_state.get(number)
+        if state is None and not keyframe:
+            return []
+        mask_size = (len(members) + 7) // 8
+        mask = int.from_bytes(frame[2 + COMPACT_HEADER_SIZE:2 + COMPACT_HEADER_SIZE + mask_size], 'little')
+        index = 2 + COMPACT_HEADER_SIZE + mask_size
+        end = len(frame) - 1
+        raw = list(state) if state is not None else [0] * len(members)
+        try:
+            for i, var in enumerate(members):
+                if not mask >> i & 1:
+                    if keyframe:
+                        return []  # Keyframes carry every value
+                    continue
+                if var.delta and not keyframe:
+                    raw[i] += DELTA_DECODER.unpack_from(frame, index)[0]
+                    if var.data_type == 'uint':
+                        raw[i] %= UINT_MODULUS
+                    index += DELTA_DECODER.size
+                else:
+                    decoder = self.decoders[var.var_id]
+                    raw[i] = decoder.unpack_from(frame, index)[0]
+                    index += decoder.size
+        except struct.error:
+            return []  # Truncated frame
+        if index != end:
+            return []
+        self.compact_state[number] = raw
+
+        samples = []
+        for var, value in zip(members, raw):
+            scale = self.scales[var.var_id]
+            if scale is not None:
+                value = value * scale + self.offsets[var.var_id]
+            samples.append(Sample(var.var_id, value, timestamp, self.source))
+        return samples
+
+    def frame_layout(self, var_ids):
+        """Build (and cache) the NumPy structured dtype of a frame carrying var_ids in order."""
+        key = tuple(var_ids)
+        layout = self.frame_layouts.get(key)
+        if layout is None:
+            names = ['sof', 'size']
+            formats = ['u1', 'u1']
+            for var_id in key:
+                decoder = self.decoders[var_id]
+                names += [f'id_{var_id}', f'value_{var_id}']
+                formats += ['u1', np.dtype(decoder.format)]
+            names.append('eof')
+            formats.append('u1')
+            dtype = np.dtype({'names': names, 'formats': formats})
+
+            # Expected value of every non-value field, used to validate whole batches at once
+            header = {'sof': SOF[0], 'size': dtype.itemsize - FRAME_OVERHEAD, 'eof': EOF[0]}
+            header.update({f'id_{var_id}': var_id for var_id in key})
+            layout = (dtype, header)
+            self.frame_layouts[key] = layout
+            if key:
+                self.layout_keys[(dtype.itemsize, key[0])] = key
+        return layout
+
+    def load_frame_layouts(self, frames, compact=False):
+        """Precompile the layouts of the frames sent by generated firmware (FRAMES and COMPACT of ezUART_layout.py).
+
+        Raises ValueError when a frame differs from the layout built from the
+        loaded database, i.e. the firmware and the database have drifted.
+        """
+        if compact:
+            expected = [tuple(var.var_id for var in members) for members in self.compact_frames]
+            if [tuple(var_ids) for _, var_ids, _ in frames] != expected:
+                raise ValueError(f"Compact frames {[var_ids for _, var_ids, _ in frames]} of the firmware "
+                                 f"differ from {expected} in the database")
+            return
+        for speed, var_ids, size in frames:
+            dtype, _ = self.frame_layout(var_ids)
+            if dtype.itemsize != size:
+                raise ValueError(f"Frame {var_ids} of speed '{speed}' is {size} bytes in the firmware "
+                                 f"but {dtype.itemsize} bytes in the database")
+
+    def decode_batch(self, frames, var_ids, timestamp=None):
+        """Decode a run of raw frames sharing one layout with a single np.frombuffer.
+
+        Frames that do not match the layout of var_ids are decoded one by one
+        with decode_frame and returned as Samples.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        dtype, header = self.frame_layout(var_ids)
+
+        lengths = np.fromiter(map(len, frames), dtype=np.intp, count=len(frames))
+        sized = lengths == dtype.itemsize
+        records = np.frombuffer(b"".join(compress(frames, sized)), dtype=dtype)
+
+        valid = np.ones(len(records), dtype=bool)
+        for name, expected in header.items():
+            valid &= records[name] == expected
+        if not valid.all():
+            # Hand the odd frames to the scalar path and keep the matching ones
+            sized[np.flatnonzero(sized)[~valid]] = False
+            records = records[valid]
+
+        columns = {var_id: self.scaled(var_id, records[f'value_{var_id}']) for var_id in var_ids}
+        samples = []
+        for frame in compress(frames, ~sized):
+            samples += self.decode_frame(frame, timestamp)
+        return Batch(np.full(len(records), timestamp), columns, samples)
+
+    def scaled(self, var_id, values):
+        """Apply the scale and offset of a variable to an array of raw values."""
+        scale = self.scales[var_id]
+        return values if scale is None else values * scale + self.offsets[var_id]
+
+    def decode_compact_batch(self, frames, timestamp=None):
+        """Vectorized decode_compact of a run of compact frames sharing the frame number of the first one.
+
+        Frames are grouped by header (keyframe flag and bitmask) and each group
+        is read with one np.frombuffer. Delta and missing values are then
+        resolved per variable with cumulative sums from the last full value.
+        Frames that match no layout are decoded one by one afterwards.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if not frames or len(frames[0]) < 4 or frames[0][3] & ~KEYFRAME_FLAG >= len(self.compact_frames):
+            samples = []
+            for frame in frames:
+                samples += self.decode_frame(frame, timestamp)
+            return Batch(np.empty(0), {}, samples)
+        number = frames[0][3] & ~KEYFRAME_FLAG
+        members = self.compact_frames[number]
+        count = len(members)
+        header_size = 2 + COMPACT_HEADER_SIZE + (count + 7) // 8
+
+        values = np.zeros((len(frames), count))
+        present = np.zeros((len(frames), count), dtype=bool)
+        keyframes = np.zeros(len(frames), dtype=bool)
+        matched = np.zeros(len(frames), dtype=bool)
+        headers = {}
+        for index, frame in enumerate(frames):
+            headers.setdefault(bytes(frame[2:header_size]), []).append(index)
+        for header, indices in headers.items():
+            if len(header) < header_size - 2 or header[0] != COMPACT_ID or header[1] & ~KEYFRAME_FLAG != number:
+                continue
+            keyframe = bool(header[1] & KEYFRAME_FLAG)
+            mask = int.from_bytes(header[COMPACT_HEADER_SIZE:], 'little')
+            fields = [i for i in range(count) if mask >> i & 1]
+            if keyframe and len(fields) != count:
+                continue
+            names = ['header'] + [f'v{i}' for i in fields] + ['eof']
+            formats = [f'V{header_size}']
+            for i in fields:
+                fmt = Database.TYPE_FORMATS[DELTA_TYPE] if members[i].delta and not keyframe else self.decoders[members[i].var_id].format
+                formats.append(np.dtype(fmt))
+            formats.append('u1')
+            dtype = np.dtype({'names': names, 'formats': formats})
+            indices = [index for index in indices
+                       if len(frames[index]) == dtype.itemsize and frames[index][1] == dtype.itemsize - FRAME_OVERHEAD
+                       and frames[index][-1] == EOF[0]]
+            if not indices:
+                continue
+            records = np.frombuffer(b"".join(frames[index] for index in indices), dtype=dtype)
+            for i in fields:
+                values[indices, i] = records[f'v{i}']
+                present[indices, i] = True
+            keyframes[indices] = keyframe
+            matched[indices] = True
+
+        state = self.compact_state.get(number)
+        rows = np.flatnonzero(matched)
+        values, present, keyframes = values[rows], present[rows], keyframes[rows]
+        positions = np.arange(len(rows))
+        # Rows before the first keyframe can only be resolved from a previous state
+        valid = np.maximum.accumulate(keyframes) if len(rows) else keyframes
+        if state is not None:
+            valid = np.ones(len(rows), dtype=bool)
+        columns = {}
+        last_raw = []
+        for i, var in enumerate(members):
+            full = present[:, i] & (keyframes | (not var.delta))
+            steps = np.cumsum(np.where(present[:, i] & ~full, values[:, i], 0.0))
+            last_full = np.maximum.accumulate(np.where(full, positions, -1)) if len(rows) else positions
+            previous = state[i] if state is not None else 0.0
+            base = np.where(last_full >= 0, values[np.maximum(last_full, 0), i] - steps[np.maximum(last_full, 0)], previous)
+            raw = base + steps
+            if var.data_type == 'uint':
+                raw = np.mod(raw, UINT_MODULUS)
+            raw = raw[valid]
+            if len(raw):
+                last_raw.append(raw[-1].item() if var.data_type == 'float' else int(raw[-1]))
+            columns[var.var_id] = self.scaled(var.var_id, raw)
+        if last_raw:
+            self.compact_state[number] = last_raw
+
+        samples = []
+        for frame in compress(frames, ~matched):
+            samples += self.decode_frame(frame, timestamp)
+        return Batch(np.full(int(valid.sum()), timestamp), columns, samples)
 
-        return decoded_message
+    def format_samples(self, samples):
+        """Format decoded samples as console text, only needed when the text is shown."""
+        type_names = self.type_names
+        return "".join(
+            f"ID: {sample.var_id} | Type: {type_names[sample.var_id]} | Value: {sample.value:.6f}\n"
+            for sample in samples
+        )